@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Compare two benchmark result files (see the run module).
+
+    python3 -m benchmarks.compare OLD.json NEW.json [--threshold 1.1]
+
+The exit status is 1 when a benchmark is slower than threshold times its
+old duration (using the best of the runs).
+"""
+
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 1.1
+
+
+def load_results(path):
+    """
+    Return the {(benchmark, num_job_adverts): min duration} dict of the
+    results file "path" (skipped benchmarks are ignored).
+    """
+
+    with open(path, "r") as fd:
+        results = json.load(fd)
+
+    return {(result_dict["benchmark"], result_dict["num_job_adverts"]): result_dict["min"]
+            for result_dict in results["results"] if "min" in result_dict}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+
+    parser.add_argument("old", help="the reference results")
+    parser.add_argument("new", help="the new results")
+
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="the new/old ratio above which a benchmark is a regression (default: {})".format(DEFAULT_THRESHOLD))
+
+    args = parser.parse_args(argv)
+
+    old_dict = load_results(args.old)
+    new_dict = load_results(args.new)
+
+    num_regressions = 0
+
+    print("{:<16} {:>8} {:>10} {:>10} {:>7}".format("benchmark", "size", "old", "new", "ratio"))
+    for key in sorted(old_dict.keys() & new_dict.keys()):
+        name, size = key
+        ratio = new_dict[key] / old_dict[key] if old_dict[key] > 0 else float("inf")
+
+        flag = ""
+        if ratio > args.threshold:
+            flag = "  REGRESSION"
+            num_regressions += 1
+
+        print("{:<16} {:>8} {:>9.4f}s {:>9.4f}s {:>7.2f}{}".format(name, size, old_dict[key], new_dict[key], ratio, flag))
+
+    return 1 if num_regressions > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Generate a synthetic database: the "job_adverts.json" and
+"job_adverts_web_sites.json" files read by the application from the home
+directory.
+
+The job adverts are spread over the last years with long descriptions.
+A small fraction of them are duplicates: the same url with tracking
+parameters or the same job advert published on another web site with a few
+words changed. The job search history contains a status for most days of
+each web site.
+
+The output only depends on the arguments (and the seed).
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+
+import category_list
+
+JOB_ADVERTS_FILENAME = "job_adverts.json"
+WEB_SITES_FILENAME = "job_adverts_web_sites.json"
+
+VOCABULARY_SIZE = 5000
+NUM_ORGANIZATIONS = 2000
+TRACKING_DUPLICATE_RATIO = 0.01
+REPOST_DUPLICATE_RATIO = 0.01
+
+JOB_SEARCH_STATUS_LIST = ["Full", "Partial", "None"]
+JOB_SEARCH_STATUS_WEIGHTS = [0.5, 0.3, 0.2]
+JOB_SEARCH_VISIT_RATIO = 0.7          # Fraction of the days with a status
+
+
+def random_word(rng):
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for i in range(rng.randint(2, 10)))
+
+
+def iter_job_adverts(rng, num_job_adverts, web_site_list, first_date, num_days, desc_words):
+    """
+    Iterate over num_job_adverts (url, job_advert_dict) items.
+    """
+
+    vocabulary = [random_word(rng) for i in range(VOCABULARY_SIZE)]
+    organization_list = [" ".join(rng.choices(vocabulary, k=rng.randint(1, 3))).title() for i in range(NUM_ORGANIZATIONS)]
+
+    previous_job_advert_list = []     # (url, job_advert_dict) items that can be duplicated
+    index = 0
+
+    while index < num_job_adverts:
+        draw = rng.random()
+
+        if draw < TRACKING_DUPLICATE_RATIO and len(previous_job_advert_list) > 0:
+            url, job_advert_dict = rng.choice(previous_job_advert_list)
+            url += "&utm_source=newsletter&utm_campaign={}".format(index)
+        elif draw < TRACKING_DUPLICATE_RATIO + REPOST_DUPLICATE_RATIO and len(previous_job_advert_list) > 0:
+            url, job_advert_dict = rng.choice(previous_job_advert_list)
+            word_list = job_advert_dict["desc"].split()
+            for i in range(max(len(word_list) // 50, 1)):
+                word_list[rng.randrange(len(word_list))] = rng.choice(vocabulary)
+            job_advert_dict = dict(job_advert_dict, desc=" ".join(word_list))
+            url = "{}/offer?id={}".format(rng.choice(web_site_list), index)
+        else:
+            date = first_date + datetime.timedelta(days=rng.randrange(num_days))
+            url = "{}/jobs/{}?id={}".format(rng.choice(web_site_list), random_word(rng), index)
+            job_advert_dict = {"date": date.isoformat(),
+                               "category": rng.choice(category_list.CATEGORY_LIST),
+                               "organization": rng.choice(organization_list),
+                               "title": " ".join(rng.choices(vocabulary, k=rng.randint(3, 8))).capitalize(),
+                               "score": rng.randint(0, 5),
+                               "pros": " ".join(rng.choices(vocabulary, k=rng.randint(0, 30))),
+                               "cons": " ".join(rng.choices(vocabulary, k=rng.randint(0, 30))),
+                               "desc": " ".join(rng.choices(vocabulary, k=rng.randint(desc_words // 2, desc_words * 3 // 2)))}
+            if len(previous_job_advert_list) < 1000:
+                previous_job_advert_list.append((url, job_advert_dict))
+            else:
+                previous_job_advert_list[rng.randrange(1000)] = (url, job_advert_dict)
+
+        yield url, job_advert_dict
+        index += 1
+
+
+def generate(directory, num_job_adverts, num_web_sites=100, num_years=5, desc_words=300, seed=0, last_date=datetime.date(2026, 1, 1)):
+    """
+    Write a synthetic database in directory (which is created if needed).
+    """
+
+    rng = random.Random(seed)
+
+    os.makedirs(directory, exist_ok=True)
+
+    num_days = 365 * num_years
+    first_date = last_date - datetime.timedelta(days=num_days - 1)
+
+    web_site_list = ["https://www.{}.{}".format(random_word(rng), rng.choice(["com", "org", "fr", "eu"])) for i in range(num_web_sites)]
+
+    web_site_dict = {url: {"label": url.split(".")[1].title(), "category": rng.choice(category_list.CATEGORY_LIST)} for url in web_site_list}
+    with open(os.path.join(directory, WEB_SITES_FILENAME), "w") as fd:
+        json.dump(web_site_dict, fd, sort_keys=True, indent=4)
+
+    # The job adverts are written one by one (the whole database doesn't
+    # fit in memory with the largest sizes)
+    with open(os.path.join(directory, JOB_ADVERTS_FILENAME), "w") as fd:
+        fd.write('{"job_adverts": {')
+        separator = ""
+        for url, job_advert_dict in iter_job_adverts(rng, num_job_adverts, web_site_list, first_date, num_days, desc_words):
+            fd.write(separator + json.dumps(url) + ": " + json.dumps(job_advert_dict, sort_keys=True))
+            separator = ", "
+
+        fd.write('}, "job_searchs": {')
+        separator = ""
+        for url in web_site_list:
+            status_dict = {}
+            for day in range(num_days):
+                if rng.random() < JOB_SEARCH_VISIT_RATIO:
+                    date = first_date + datetime.timedelta(days=day)
+                    status_dict[date.isoformat()] = rng.choices(JOB_SEARCH_STATUS_LIST, JOB_SEARCH_STATUS_WEIGHTS)[0]
+            fd.write(separator + json.dumps(url) + ": " + json.dumps(status_dict, sort_keys=True))
+            separator = ", "
+        fd.write('}}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic job adverts database.")
+
+    parser.add_argument("directory",
+                        help="the output directory (use it as HOME to run the application on it)")
+
+    parser.add_argument("-n", "--num-job-adverts", type=int, default=10000,
+                        help="the number of job adverts (default: 10000)")
+
+    parser.add_argument("--num-web-sites", type=int, default=100,
+                        help="the number of web sites of the job search history (default: 100)")
+
+    parser.add_argument("--years", type=int, default=5,
+                        help="the number of years covered by the database (default: 5)")
+
+    parser.add_argument("--desc-words", type=int, default=300,
+                        help="the average number of words of the descriptions (default: 300)")
+
+    parser.add_argument("--seed", type=int, default=0,
+                        help="the random seed (default: 0)")
+
+    args = parser.parse_args(argv)
+
+    generate(args.directory, args.num_job_adverts, args.num_web_sites, args.years, args.desc_words, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Measure the memory used per job advert by the dicts of the JSON database and
+by the job_advert_record.JobAdverts that replace them.
+
+The database is generated like the ones of the run module (see the generate
+module) and parsed with json.load(); the job adverts are then converted to
+JobAdverts. The memory is measured with tracemalloc.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks import generate
+
+import job_advert_record
+import storage
+
+
+def measure(function):
+    """
+    Return (result of function(), number of bytes allocated by function()
+    and still referenced when it returns).
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def measure_job_adverts(path):
+    """
+    Return the {"dict": bytes per job advert, "JobAdvert": bytes per job
+    advert} dicts of the whole job adverts (with and without the urls and
+    bodies) and of their summaries.
+    """
+
+    with open(path, "r") as fd:
+        text = fd.read()
+
+    def load_dicts():
+        return json.loads(text)["job_adverts"]
+
+    def load_records():
+        job_advert_dict = json.loads(text)["job_adverts"]
+        for url, job_advert in job_advert_dict.items():
+            job_advert_dict[url] = job_advert_record.from_dict(job_advert)
+        return job_advert_dict
+
+    dict_database, dict_size = measure(load_dicts)
+    del dict_database
+    record_database, record_size = measure(load_records)
+
+    num_job_adverts = max(len(record_database), 1)
+
+    # The urls and the bodies are the same strings in both cases
+    string_size = sum(sys.getsizeof(url) + sum(sys.getsizeof(job_advert[field]) for field in storage.BODY_FIELDS)
+                      for url, job_advert in record_database.items())
+
+    # The summaries kept by the GUI with the split and SQLite backends
+    summary_list = [(url, {field: job_advert[field] for field in storage.SUMMARY_FIELDS}) for url, job_advert in record_database.items()]
+    del record_database
+
+    # New strings for each summary, as read from a SQLite row
+    def copy_dict_summaries():
+        return [{field: (value + " ")[:-1] if isinstance(value, str) else value for field, value in summary_dict.items()} for url, summary_dict in summary_list]
+
+    def copy_record_summaries():
+        return [job_advert_record.from_dict(copied_dict) for copied_dict in copy_dict_summaries()]
+
+    dict_summary_list, dict_summary_size = measure(copy_dict_summaries)
+    del dict_summary_list
+    record_summary_list, record_summary_size = measure(copy_record_summaries)
+
+    return {"job_adverts": {"dict": dict_size / num_job_adverts, "JobAdvert": record_size / num_job_adverts},
+            "without urls and bodies": {"dict": (dict_size - string_size) / num_job_adverts, "JobAdvert": (record_size - string_size) / num_job_adverts},
+            "summaries": {"dict": dict_summary_size / num_job_adverts, "JobAdvert": record_summary_size / num_job_adverts}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the memory used per job advert.")
+
+    parser.add_argument("-n", "--num-job-adverts", type=int, default=100000,
+                        help="the number of job adverts of the database (default: 100000)")
+
+    parser.add_argument("--desc-words", type=int, default=300,
+                        help="the number of words of the descriptions (default: 300)")
+
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        print("Generating a database of {} job adverts".format(args.num_job_adverts), file=sys.stderr)
+        generate.generate(directory, args.num_job_adverts, desc_words=args.desc_words)
+        result_dict = measure_job_adverts(os.path.join(directory, generate.JOB_ADVERTS_FILENAME))
+
+    for name, size_dict in result_dict.items():
+        print("{:<24} dict: {:>6.0f} bytes   JobAdvert: {:>6.0f} bytes   ({:.0%})".format(name, size_dict["dict"], size_dict["JobAdvert"],
+                                                                                         size_dict["JobAdvert"] / size_dict["dict"]))
+
+
+if __name__ == '__main__':
+    main()
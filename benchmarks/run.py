@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Run the benchmarks on synthetic databases of several sizes and write the
+timings in a JSON file (see the compare module to compare two runs).
+
+The benchmarks time the parts of the application that don't need widgets.
+The ones marked as requiring GTK are skipped when PyGObject is not
+installed.
+
+Each database is generated (see the generate module) in
+DATA_DIRECTORY/SIZE the first time it is needed; HOME is set to this
+directory while its benchmarks run, as the application reads its files
+from the home directory.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks import generate
+
+import duplicates
+import search_index
+import snapshot_cache
+import stats_engine
+import storage
+import visit_index
+
+DEFAULT_SIZE_LIST = [1000, 10000, 100000]
+DEFAULT_DATA_DIRECTORY = os.path.join("~", ".cache", "job-advert-manager-benchmarks")
+
+BENCHMARK_LIST = []       # (name, function, requires_gtk)
+
+
+def benchmark(name, requires_gtk=False):
+    """
+    Register a benchmark. The function takes the storage backend name and
+    returns the measured duration in seconds (it can do untimed setup work
+    first).
+    """
+
+    def decorator(function):
+        BENCHMARK_LIST.append((name, function, requires_gtk))
+        return function
+
+    return decorator
+
+
+def open_loaded_storage(storage_name):
+    job_advert_storage = storage.open_storage(storage_name, streaming=True)
+    for url, summary_dict, progress in job_advert_storage.iter_load():
+        pass
+    return job_advert_storage
+
+
+def remove_snapshot_cache(storage_name):
+    # The load benchmarks read the cache written by the previous runs
+    if storage_name == "json":
+        path = storage.JSON_FILENAME
+    elif storage_name == "split":
+        path = storage.SPLIT_INDEX_FILENAME
+    else:
+        return
+
+    try:
+        os.remove(os.path.expanduser(path) + snapshot_cache.CACHE_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+
+def read_web_site_urls():
+    with open(os.path.expanduser(os.path.join("~", generate.WEB_SITES_FILENAME)), "r") as fd:
+        return list(json.load(fd))
+
+
+# Benchmarks ##################################################################
+
+@benchmark("load_streaming")
+def load_streaming_benchmark(storage_name):
+    start_time = time.perf_counter()
+    job_advert_storage = open_loaded_storage(storage_name)
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("load")
+def load_benchmark(storage_name):
+    start_time = time.perf_counter()
+    job_advert_storage = storage.open_storage(storage_name)
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("load_uncached")
+def load_uncached_benchmark(storage_name):
+    remove_snapshot_cache(storage_name)
+
+    start_time = time.perf_counter()
+    job_advert_storage = open_loaded_storage(storage_name)
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()       # Rewrites the cache
+    return duration
+
+
+@benchmark("save")
+def save_benchmark(storage_name):
+    job_advert_storage = open_loaded_storage(storage_name)
+
+    # Same as JobAdvertsModel.save_json_file() followed by close(): wait
+    # until the file is written
+    start_time = time.perf_counter()
+    job_advert_storage.save()
+    job_advert_storage.close()
+    return time.perf_counter() - start_time
+
+
+@benchmark("stats")
+def stats_benchmark(storage_name):
+    job_advert_storage = open_loaded_storage(storage_name)
+
+    # Same as the Stats tab: build the counters (see
+    # JobAdvertsModel.get_stats_counters()) then compute the series of each
+    # period over the whole database
+    start_time = time.perf_counter()
+    job_search_iterable = ((url, job_advert_storage.get_job_search_statuses(url)) for url in job_advert_storage.iter_job_search_urls())
+    stats_counters = stats_engine.StatsCounters(job_advert_storage.count_job_adverts(), job_search_iterable)
+    date_list = list(stats_counters.job_adverts.day_counts)
+    if len(date_list) > 0:
+        for period in stats_engine.PERIOD_LIST:
+            stats_engine.StatsSeries(stats_counters, min(date_list), max(date_list), period)
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("last_visit")
+def last_visit_benchmark(storage_name):
+    job_advert_storage = open_loaded_storage(storage_name)
+    web_site_url_list = read_web_site_urls()
+
+    # Same as SearchContainer.set_last_visit_field_in_model() for each web
+    # site (including the construction of the visit index)
+    start_time = time.perf_counter()
+    index = visit_index.VisitIndex()
+    for url in job_advert_storage.iter_job_search_urls():
+        index.add_web_site(url, job_advert_storage.get_job_search_statuses(url))
+    for url in web_site_url_list:
+        index.get_last_visit_date(url, ('Full',))
+        index.get_last_visit_date(url, ('Full', 'Partial'))
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("duplicate_check")
+def duplicate_check_benchmark(storage_name):
+    job_advert_storage = open_loaded_storage(storage_name)
+    url_list = [url for url, summary_dict in job_advert_storage.iter_job_advert_summaries()]
+
+    # Check each url against the previous ones (as the importer does)
+    start_time = time.perf_counter()
+    url_index = duplicates.CanonicalUrlIndex()
+    for url in url_list:
+        url_index.find(url)
+        url_index.add(url)
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("near_duplicates")
+def near_duplicates_benchmark(storage_name):
+    job_advert_storage = open_loaded_storage(storage_name)
+
+    start_time = time.perf_counter()
+    duplicates.find_duplicates(job_advert_storage)
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("near_duplicates_cached")
+def near_duplicates_cached_benchmark(storage_name):
+    job_advert_storage = open_loaded_storage(storage_name)
+
+    # The signatures computed by a previous scan (as the duplicates command
+    # and the GUI do)
+    signature_cache = duplicates.SignatureCache()
+    for url, job_advert_dict in job_advert_storage.query_job_adverts(field_list=("title", "desc")):
+        signature_cache.get_signature(url, job_advert_dict)
+    signature_cache.save()
+
+    start_time = time.perf_counter()
+    duplicates.find_duplicates(job_advert_storage, signature_cache=duplicates.SignatureCache())
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("search_index")
+def search_index_benchmark(storage_name):
+    job_advert_storage = open_loaded_storage(storage_name)
+
+    start_time = time.perf_counter()
+    index = search_index.InvertedIndex()
+    for url, job_advert_dict in job_advert_storage.iter_job_adverts():
+        index.add(url, job_advert_dict)
+    index.search("pr")               # The words are sorted at the first prefix query
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("tree_model", requires_gtk=True)
+def tree_model_benchmark(storage_name):
+    import job_adverts_tree_model
+
+    job_advert_storage = open_loaded_storage(storage_name)
+    summary_list = list(job_advert_storage.iter_job_advert_summaries())
+
+    start_time = time.perf_counter()
+    tree_model = job_adverts_tree_model.JobAdvertsTreeModel()
+    for url, summary_dict in summary_list:
+        tree_model.append(url, summary_dict)
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("filter", requires_gtk=True)
+def filter_benchmark(storage_name):
+    from gi.repository import Gtk as gtk
+    import job_adverts_tree_model
+    import job_adverts_view
+
+    job_advert_storage = open_loaded_storage(storage_name)
+
+    tree_model = job_adverts_tree_model.JobAdvertsTreeModel()
+    index = search_index.InvertedIndex()
+    for url, job_advert_dict in job_advert_storage.iter_job_adverts():
+        tree_model.append(url, job_advert_dict)
+        index.add(url, job_advert_dict)
+
+    view = job_adverts_view.JobAdvertsView(tree_model, None, index)
+    view.sort_model.set_sort_column_id(5, gtk.SortType.ASCENDING)      # By date (a click on the column)
+
+    # Same as typing in the filter entry of the Edit tab (the visible rows
+    # are counted to evaluate the filter and the sort)
+    start_time = time.perf_counter()
+    for query in ("p", "pr", "pyt", "python", ""):
+        view.set_filter_query(query)
+        view.sort_model.iter_n_children(None)
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("liststore", requires_gtk=True)
+def liststore_benchmark(storage_name):
+    from gi.repository import Gtk as gtk
+
+    job_advert_storage = open_loaded_storage(storage_name)
+    summary_list = list(job_advert_storage.iter_job_advert_summaries())
+
+    # The Gtk.ListStore used before JobAdvertsTreeModel (for comparison)
+    start_time = time.perf_counter()
+    liststore = gtk.ListStore(str, str, str, str, int, str, str)
+    for url, summary_dict in summary_list:
+        liststore.append([url, url.replace('&', '&amp;'), summary_dict["category"], summary_dict["organization"],
+                          summary_dict["score"], summary_dict["date"], summary_dict["title"]])
+    duration = time.perf_counter() - start_time
+
+    job_advert_storage.close()
+    return duration
+
+
+@benchmark("model_load", requires_gtk=True)
+def model_load_benchmark(storage_name):
+    import job_adverts_model
+
+    start_time = time.perf_counter()
+    model = job_adverts_model.JobAdvertsModel(storage_name)
+    duration = time.perf_counter() - start_time
+
+    model.close()
+    return duration
+
+
+###############################################################################
+
+def has_gtk():
+    try:
+        import gi
+        gi.require_version('Gtk', '3.0')
+        from gi.repository import Gtk
+    except (ImportError, ValueError):
+        return False
+    return True
+
+
+def get_git_commit():
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def run_benchmarks(size_list, data_directory, name_list=None, storage_name="json", repeat=3):
+    """
+    Run the benchmarks and return the results (a JSON serializable dict).
+    """
+
+    gtk_available = has_gtk()
+
+    result_list = []
+
+    for size in size_list:
+        size_directory = os.path.join(data_directory, str(size))
+        if not os.path.exists(os.path.join(size_directory, generate.JOB_ADVERTS_FILENAME)):
+            print("Generating a database of {} job adverts in {}".format(size, size_directory), file=sys.stderr)
+            generate.generate(size_directory, size)
+
+        os.environ["HOME"] = size_directory
+
+        for name, function, requires_gtk in BENCHMARK_LIST:
+            if name_list is not None and name not in name_list:
+                continue
+
+            result_dict = {"benchmark": name, "num_job_adverts": size}
+
+            if requires_gtk and not gtk_available:
+                result_dict["skipped"] = "PyGObject is not available"
+            else:
+                duration_list = [function(storage_name) for i in range(repeat)]
+                result_dict["durations"] = duration_list
+                result_dict["min"] = min(duration_list)
+                result_dict["median"] = statistics.median(duration_list)
+
+            print("{:<16} {:>8} {}".format(name, size, "skipped" if "skipped" in result_dict else "{:.4f}s".format(result_dict["min"])), file=sys.stderr)
+            result_list.append(result_dict)
+
+    return {"commit": get_git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": storage_name,
+            "repeat": repeat,
+            "results": result_list}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Job Advert Manager benchmarks.")
+
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZE_LIST,
+                        help="the numbers of job adverts of the databases (default: {})".format(" ".join(str(size) for size in DEFAULT_SIZE_LIST)))
+
+    parser.add_argument("--benchmark", action="append", default=None, choices=[name for name, function, requires_gtk in BENCHMARK_LIST],
+                        help="only run this benchmark (can be repeated)")
+
+    parser.add_argument("--storage", choices=storage.STORAGE_LIST, default="json",
+                        help="the storage backend (default: json)")
+
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="the number of runs of each benchmark (default: 3)")
+
+    parser.add_argument("--data-directory", default=DEFAULT_DATA_DIRECTORY,
+                        help="where the databases are generated (default: {})".format(DEFAULT_DATA_DIRECTORY))
+
+    parser.add_argument("-o", "--output", default="benchmark_results.json",
+                        help="the results file (default: benchmark_results.json)")
+
+    args = parser.parse_args(argv)
+
+    # Expanded before HOME is changed
+    data_directory = os.path.abspath(os.path.expanduser(args.data_directory))
+    output_path = os.path.abspath(os.path.expanduser(args.output))
+
+    results = run_benchmarks(args.sizes, data_directory, args.benchmark, args.storage, args.repeat)
+
+    with open(output_path, "w") as fd:
+        json.dump(results, fd, indent=4)
+
+
+if __name__ == '__main__':
+    main()
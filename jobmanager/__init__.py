@@ -41,3 +41,16 @@
 __version__ = '0.1.dev1'
 
 __all__ = ['job_advert_manager']
+
+# The modules of this package import each other as top level modules (they
+# are also run as scripts, see run_linux.sh): the package directory is added
+# to sys.path so that the entry points of setup.py (jobmanager.cli:main,
+# jobmanager.job_advert_manager:main) can import them too.
+
+import os as _os
+import sys as _sys
+
+_PACKAGE_DIRECTORY = _os.path.dirname(_os.path.abspath(__file__))
+
+if _PACKAGE_DIRECTORY not in _sys.path:
+    _sys.path.insert(0, _PACKAGE_DIRECTORY)
@@ -26,8 +26,11 @@ import datetime
 import json
 
 import category_list
+import job_advert_record
+import tracing
+import validation
 
-DEFAULT_SCORE = 5
+DEFAULT_SCORE = validation.DEFAULT_SCORE
 
 class AddAndEditContainer(gtk.Grid):
 
@@ -50,6 +53,10 @@ class AddAndEditContainer(gtk.Grid):
 
         if self.edit_mode:
             self.url_entry.set_editable(False)
+        else:
+            # Download the page of the job advert to fill in the description
+            self.url_entry.connect("activate", self.urlEnteredCallBack)
+            self.url_entry.connect("focus-out-event", self.urlEnteredCallBack)
 
         self.title_entry = gtk.Entry()
         self.score_spin_button = gtk.SpinButton()
@@ -123,6 +130,11 @@ class AddAndEditContainer(gtk.Grid):
         cancel_button = gtk.Button(label="Cancel")
         cancel_button.connect("clicked", self.clearCallBack)
 
+        if self.edit_mode:
+            saved_page_button = gtk.Button(label="Saved page")
+            saved_page_button.set_tooltip_text("Open the copy of the page kept when the job advert was added")
+            saved_page_button.connect("clicked", self.savedPageCallBack)
+
         # The grid container
         self.set_column_homogeneous(False)
         self.set_row_homogeneous(False)
@@ -189,10 +201,16 @@ class AddAndEditContainer(gtk.Grid):
 
         self.attach(desc_scrolled_window,    left=0, top=6, width=4, height=6)
 
-        self.attach(add_button,              left=0, top=13, width=2, height=1)
-        self.attach(cancel_button,           left=2, top=13, width=2, height=1)
+        if self.edit_mode:
+            self.attach(add_button,          left=0, top=13, width=1, height=1)
+            self.attach(saved_page_button,   left=1, top=13, width=2, height=1)
+            self.attach(cancel_button,       left=3, top=13, width=1, height=1)
+        else:
+            self.attach(add_button,          left=0, top=13, width=2, height=1)
+            self.attach(cancel_button,       left=2, top=13, width=2, height=1)
 
 
+    @tracing.traced()
     def saveCallBack(self, widget):
         """
         Save the current job advert.
@@ -204,8 +222,7 @@ class AddAndEditContainer(gtk.Grid):
 
         organization = self.organization_entry.get_text()
 
-        url = self.url_entry.get_text()
-        tooltip = url.replace('&', '&amp;')
+        url = self.get_url()
 
         title = self.title_entry.get_text()
 
@@ -221,55 +238,37 @@ class AddAndEditContainer(gtk.Grid):
         desc = desc_buffer.get_text(desc_buffer.get_start_iter(), desc_buffer.get_end_iter(), True)
 
         if self.edit_mode:
-            date = self.job_adverts_model.json_database["job_adverts"][url]["date"]
+            date = self.job_adverts_model.get_job_advert(url)["date"]
         else:
             date = datetime.date.isoformat(datetime.date.today())
 
         # Check data ############################
 
-        error_msg_list = []
-
-        if category is None:
-            error_msg_list.append("You must select a category.")
-
-        if len(url) == 0:
-            error_msg_list.append("You must enter an url.")
-        elif url in self.job_adverts_model.json_database["job_adverts"] and not self.edit_mode:
-            error_msg_list.append("This job advert already exists in the database.")
-
-        try:
-            if score not in range(6):
-                error_msg_list.append("The score must be a number between 0 and 5.")
-        except:
-            error_msg_list.append("The score must be a number between 0 and 5.")
+        # The same job advert is often published with different urls (tracking
+        # parameters, ...)
+        is_duplicate = self.job_adverts_model.find_duplicate_url(url) is not None and not self.edit_mode
+        error_msg_list = validation.check_job_advert(url, category, score, is_duplicate)
 
         # Save data or display error ############
 
         if len(error_msg_list) == 0:
-            job_advert_dict = {"date": date,
-                               "category": category,
-                               "organization": organization,
-                               "title": title,
-                               "score": score,
-                               "pros": pros,
-                               "cons": cons,
-                               "desc": desc}
-
-            # Save the job advert in the database
-            self.job_adverts_model.json_database["job_adverts"][url] = job_advert_dict
-
-            # Save the job advert in the JSON file
-            self.job_adverts_model.save_json_file()
-
-            # Update the GtkListStore (TODO: redundant with the previous JSON data structure)
-            if self.edit_mode:
-                model, treeiter = self.treeview.get_selection().get_selected()
-                self.job_adverts_model.liststore.set_value(treeiter, 2, category)      # category
-                self.job_adverts_model.liststore.set_value(treeiter, 3, organization)  # organization
-                self.job_adverts_model.liststore.set_value(treeiter, 4, score)         # score
-                self.job_adverts_model.liststore.set_value(treeiter, 6, title)         # title
-            else:
-                self.job_adverts_model.liststore.append([url, tooltip, category, organization, score, date, title])
+            job_advert_dict = job_advert_record.from_dict({"date": date,
+                                                           "category": category,
+                                                           "organization": organization,
+                                                           "title": title,
+                                                           "score": score,
+                                                           "pros": pros,
+                                                           "cons": cons,
+                                                           "desc": desc})
+
+            # Warn if the job advert looks like one of the database (e.g. the
+            # same job advert published on another web site)
+            if not self.edit_mode and not self.confirm_near_duplicates(job_advert_dict):
+                return
+
+            # Save the job advert in the database (and in the journal file).
+            # The GtkListStore is updated by the model.
+            self.job_adverts_model.set_job_advert(url, job_advert_dict)
 
             # Clear all entries
             self.clearCallBack()
@@ -280,6 +279,87 @@ class AddAndEditContainer(gtk.Grid):
             dialog.destroy()
 
 
+    @tracing.traced()
+    def urlEnteredCallBack(self, widget, event=None):
+        """
+        Download the page of the new job advert (in the background): its text
+        fills in the description if it is empty.
+        """
+
+        url = self.get_url()
+
+        if url.startswith(("http://", "https://")) and self.get_desc() == "":
+            self.job_adverts_model.fetch_page(url, self.pageFetchedCallBack)
+
+        return False
+
+
+    @tracing.traced()
+    def pageFetchedCallBack(self, url, text, error_msg):
+        if text is None:
+            return False
+
+        if url == self.get_url():
+            if self.get_desc() == "":
+                self.desc_textview.get_buffer().set_text(text)
+        elif self.job_adverts_model.has_job_advert(url):
+            # Already saved (with an empty description)
+            job_advert_dict = self.job_adverts_model.get_job_advert(url)
+            if job_advert_dict["desc"] == "":
+                job_advert_dict = job_advert_record.from_dict(dict(job_advert_dict, desc=text))
+                self.job_adverts_model.set_job_advert(url, job_advert_dict)
+
+        return False
+
+
+    @tracing.traced()
+    def savedPageCallBack(self, widget):
+        url = self.get_url()
+
+        if url == "" or not self.job_adverts_model.open_saved_page(url):
+            dialog = gtk.MessageDialog(self.main_window, 0, gtk.MessageType.INFO, gtk.ButtonsType.OK, "No saved page")
+            dialog.format_secondary_text("The page of this job advert has not been saved.")
+            dialog.run()
+            dialog.destroy()
+
+
+    def get_url(self):
+        """
+        Return the url of the entry (without the surrounding spaces of a
+        pasted url: the edited job adverts keep their url as is).
+        """
+
+        url = self.url_entry.get_text()
+        return url if self.edit_mode else url.strip()
+
+
+    def get_desc(self):
+        desc_buffer = self.desc_textview.get_buffer()
+        return desc_buffer.get_text(desc_buffer.get_start_iter(), desc_buffer.get_end_iter(), True)
+
+
+    def confirm_near_duplicates(self, job_advert_dict):
+        """
+        Ask the user to confirm the save if the database contains job adverts
+        similar to job_advert_dict. Return True if the job advert can be saved.
+        """
+
+        similar_list = self.job_adverts_model.find_similar_job_adverts(job_advert_dict)
+
+        if len(similar_list) == 0:
+            return True
+
+        line_list = ["{:.0%}  {}".format(similarity, similar_url) for similarity, similar_url in similar_list[:5]]
+
+        dialog = gtk.MessageDialog(self.main_window, 0, gtk.MessageType.QUESTION, gtk.ButtonsType.YES_NO, "This job advert looks like a duplicate")
+        dialog.format_secondary_text("Similar job adverts:\n" + "\n".join(line_list) + "\n\nSave it anyway?")
+        response = dialog.run()
+        dialog.destroy()
+
+        return response == gtk.ResponseType.YES
+
+
+    @tracing.traced()
     def clearCallBack(self, widget=None, data=None):
         if self.edit_mode:
             # Clear the current form: reset the entry widgets to their default value.
@@ -287,7 +367,7 @@ class AddAndEditContainer(gtk.Grid):
             model, treeiter = self.treeview.get_selection().get_selected()
             url = None
             if treeiter != None:
-                url = self.job_adverts_model.liststore[treeiter][0]
+                url = model[treeiter][0]
 
             if url is None:
                 self.url_entry.set_text("")
@@ -299,13 +379,15 @@ class AddAndEditContainer(gtk.Grid):
                 self.cons_textview.get_buffer().set_text("")
                 self.desc_textview.get_buffer().set_text("")
             else:
-                category = self.job_adverts_model.json_database["job_adverts"][url]["category"]
-                organization = self.job_adverts_model.json_database["job_adverts"][url]["organization"]
-                score = self.job_adverts_model.json_database["job_adverts"][url]["score"]
-                title = self.job_adverts_model.json_database["job_adverts"][url]["title"]
-                pros = self.job_adverts_model.json_database["job_adverts"][url]["pros"]
-                cons = self.job_adverts_model.json_database["job_adverts"][url]["cons"]
-                desc = self.job_adverts_model.json_database["job_adverts"][url]["desc"]
+                job_advert_dict = self.job_adverts_model.get_job_advert(url)
+
+                category = job_advert_dict["category"]
+                organization = job_advert_dict["organization"]
+                score = job_advert_dict["score"]
+                title = job_advert_dict["title"]
+                pros = job_advert_dict["pros"]
+                cons = job_advert_dict["cons"]
+                desc = job_advert_dict["desc"]
 
                 self.url_entry.set_text(url)
                 self.category_combobox.set_active(category_list.CATEGORY_LIST.index(category))
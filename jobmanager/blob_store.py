@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Append-only store of the job advert text bodies (pros, cons, desc).
+
+Each body is written at the end of the blob file and is addressed by its
+(offset, length) reference. Bodies are only read when they are needed (e.g.
+when a job advert is selected in the Edit tab).
+"""
+
+import json
+import os
+
+
+class BlobStore(object):
+
+    def __init__(self, path):
+        self.path = path
+
+
+    def put(self, body_dict):
+        """
+        Append body_dict at the end of the blob file and return its
+        [offset, length] reference.
+        """
+
+        data = json.dumps(body_dict, sort_keys=True).encode("utf-8")
+
+        with open(self.path, "ab") as fd:
+            offset = fd.tell()
+            fd.write(data)
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        return [offset, len(data)]
+
+
+    def put_many(self, body_dict_iterable):
+        """
+        Append several bodies in one write and return the list of their
+        references.
+        """
+
+        ref_list = []
+
+        with open(self.path, "ab") as fd:
+            offset = fd.tell()
+            for body_dict in body_dict_iterable:
+                data = json.dumps(body_dict, sort_keys=True).encode("utf-8")
+                fd.write(data)
+                ref_list.append([offset, len(data)])
+                offset += len(data)
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        return ref_list
+
+
+    def get(self, ref):
+        """
+        Read the body referenced by ref (an [offset, length] list).
+        """
+
+        offset, length = ref
+
+        with open(self.path, "rb") as fd:
+            fd.seek(offset)
+            data = fd.read(length)
+
+        return json.loads(data.decode("utf-8"))
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Command line interface of Job Advert Manager (no GUI).
+
+Installed as the "jobmanager" command (see setup.py) ; from the source tree,
+run "python3 jobmanager/cli.py" instead.
+
+Usage:
+
+    jobmanager import [--format {csv,jsonl}] [--storage {json,split,sqlite}] FILE [FILE ...]
+    jobmanager export [--table {adverts,searchs}] [--format {jsonl,csv}] [--fields FIELDS]
+                      [--from DATE] [--to DATE] [--category CATEGORY] [--url URL]
+                      [--storage {json,split,sqlite}] [-o FILE]
+    jobmanager duplicates [--threshold THRESHOLD] [--storage {json,split,sqlite}]
+    jobmanager check-links [--adverts | --sites] [--timeout SECONDS]
+                           [--connections-per-host N] [--storage {json,split,sqlite}]
+    jobmanager rank [--like URL] [-k K] [--storage {json,split,sqlite}] [KEYWORD ...]
+
+Each command can be traced with "jobmanager --trace OUTPUT ..." (see the
+tracing module).
+"""
+
+import argparse
+import sys
+import time
+
+import duplicates
+import exporter
+import importer
+import link_checker
+import relevance
+import storage
+import tracing
+
+
+@tracing.traced()
+def import_command(args):
+    job_advert_storage = storage.open_storage(args.storage)
+
+    exit_status = 0
+
+    try:
+        for path in args.files:
+            report = importer.import_file(job_advert_storage, path, args.format)
+
+            for error_msg in report.error_msg_list:
+                print("{}: {}".format(path, error_msg), file=sys.stderr)
+            if report.num_invalid > len(report.error_msg_list):
+                print("{}: ... ({} more errors)".format(path, report.num_invalid - len(report.error_msg_list)), file=sys.stderr)
+
+            print("{}: {}".format(path, report))
+
+            if report.num_invalid > 0:
+                exit_status = 1
+    finally:
+        # Write the database (and wait until it's done)
+        start_time = time.monotonic()
+        job_advert_storage.close()
+        print("Database written in {:.2f}s".format(time.monotonic() - start_time))
+
+    return exit_status
+
+
+@tracing.traced()
+def export_command(args):
+    if args.table == "adverts":
+        available_field_list = exporter.JOB_ADVERT_RECORD_FIELDS
+    else:
+        available_field_list = exporter.JOB_SEARCH_RECORD_FIELDS
+
+    if args.fields is None:
+        field_list = list(available_field_list)
+    else:
+        field_list = [field.strip() for field in args.fields.split(",")]
+        for field in field_list:
+            if field not in available_field_list:
+                raise ValueError("Unknown field '{}' (available fields: {})".format(field, ", ".join(available_field_list)))
+
+    job_advert_storage = storage.open_storage(args.storage)
+
+    try:
+        if args.table == "adverts":
+            category_set = None if args.category is None else set(args.category)
+            record_iterable = exporter.iter_job_advert_records(job_advert_storage, args.first_date, args.last_date, category_set, field_list)
+        else:
+            url_set = None if args.url is None else set(args.url)
+            record_iterable = exporter.iter_job_search_records(job_advert_storage, args.first_date, args.last_date, url_set, field_list)
+
+        writer = exporter.WRITERS[args.format]
+
+        if args.output == "-":
+            num_records = writer(record_iterable, sys.stdout, field_list)
+        else:
+            with open(args.output, "w", newline="") as fd:
+                num_records = writer(record_iterable, fd, field_list)
+    finally:
+        job_advert_storage.close()
+
+    print("{} records exported".format(num_records), file=sys.stderr)
+
+    return 0
+
+
+@tracing.traced()
+def duplicates_command(args):
+    if not 0. < args.threshold <= 1.:
+        raise ValueError("The threshold must be in ]0, 1]")
+
+    job_advert_storage = storage.open_storage(args.storage)
+    signature_cache = duplicates.SignatureCache()
+
+    try:
+        url_duplicate_list, similar_pair_list = duplicates.find_duplicates(job_advert_storage, args.threshold, signature_cache)
+    finally:
+        job_advert_storage.close()
+
+    signature_cache.save()
+
+    for url_list in url_duplicate_list:
+        print("same url:\t" + "\t".join(url_list))
+
+    for similarity, url1, url2 in similar_pair_list:
+        print("similar ({:.0%}):\t{}\t{}".format(similarity, url1, url2))
+
+    print("{} duplicate urls, {} similar job adverts".format(len(url_duplicate_list), len(similar_pair_list)), file=sys.stderr)
+
+    return 0
+
+
+@tracing.traced()
+def check_links_command(args):
+    if args.connections_per_host < 1:
+        raise ValueError("The number of connections per host must be at least 1")
+
+    url_list = []
+
+    if args.targets in ("all", "adverts"):
+        job_advert_storage = storage.open_storage(args.storage)
+        try:
+            url_list += [url for url, summary_dict in job_advert_storage.iter_job_advert_summaries()]
+        finally:
+            job_advert_storage.close()
+
+    if args.targets in ("all", "sites"):
+        url_list += link_checker.read_web_site_urls()
+
+    url_list = list(dict.fromkeys(url_list))      # Without the duplicates
+
+    previous_statuses = link_checker.load_link_statuses()
+
+    start_time = time.monotonic()
+    status_dicts = link_checker.check_urls(url_list, previous_statuses,
+                                           timeout=args.timeout,
+                                           max_connections_per_host=args.connections_per_host)
+    elapsed_time = time.monotonic() - start_time
+
+    link_checker.save_link_statuses(status_dicts)
+
+    num_dead = 0
+    num_errors = 0
+    for url in url_list:
+        status_dict = status_dicts[url]
+        if status_dict["state"] == link_checker.DEAD:
+            num_dead += 1
+            print("{}:\t{}".format(link_checker.describe_status(status_dict), url))
+        elif status_dict["state"] == link_checker.ERROR:
+            num_errors += 1
+            print("{}:\t{}\t{}".format(link_checker.describe_status(status_dict), url, status_dict["error"]))
+
+    print("{} urls checked in {:.2f}s: {} dead, {} errors".format(len(url_list), elapsed_time, num_dead, num_errors), file=sys.stderr)
+
+    return 0
+
+
+@tracing.traced()
+def rank_command(args):
+    if (len(args.keywords) > 0) == (args.like is not None):
+        raise ValueError("Give either keywords or --like URL")
+    if args.k < 1:
+        raise ValueError("k must be at least 1")
+
+    job_advert_storage = storage.open_storage(args.storage)
+
+    try:
+        if args.like is not None and not job_advert_storage.has_job_advert(args.like):
+            raise ValueError("Unknown job advert: {}".format(args.like))
+
+        relevance_index = relevance.TfidfIndex()
+        for url, job_advert_dict in job_advert_storage.iter_job_adverts():
+            relevance_index.add(url, job_advert_dict)
+
+        if args.like is not None:
+            query_vector = relevance_index.query_vector(job_advert_dict=job_advert_storage.get_job_advert(args.like))
+        else:
+            query_vector = relevance_index.query_vector(" ".join(args.keywords))
+
+        result_list = relevance_index.top_k(query_vector, args.k, excluded_url=args.like)
+
+        for relevance_score, url in result_list:
+            print("{:.0%}\t{}\t{}".format(relevance_score, url, job_advert_storage.get_job_advert(url)["title"]))
+    finally:
+        job_advert_storage.close()
+
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="jobmanager",
+                                     description="Manage the job adverts database from the command line.")
+
+    parser.add_argument("--trace", metavar="OUTPUT", default=None,
+                        help='trace the command: "summary" prints a table at exit, any other value is the path of a Chrome trace file (see the {} environment variable)'.format(tracing.TRACE_ENV_VAR))
+
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    # Import
+
+    import_parser = subparsers.add_parser("import",
+                                          help="import job adverts from CSV or JSONL files")
+
+    import_parser.add_argument("files", nargs="+", metavar="FILE",
+                               help="the CSV or JSONL files to import ('-' for the standard input)")
+
+    import_parser.add_argument("--format", choices=importer.INPUT_FORMAT_LIST, default=None,
+                               help="the format of the input files (guessed from their extension by default)")
+
+    import_parser.add_argument("--storage", choices=storage.STORAGE_LIST, default=None,
+                               help="the storage backend (see the {} environment variable)".format(storage.STORAGE_ENV_VAR))
+
+    import_parser.set_defaults(function=import_command)
+
+    # Export
+
+    export_parser = subparsers.add_parser("export",
+                                          help="export job adverts or the job search history to JSONL or CSV")
+
+    export_parser.add_argument("--table", choices=["adverts", "searchs"], default="adverts",
+                               help="export the job adverts (default) or the job search history")
+
+    export_parser.add_argument("--format", choices=exporter.OUTPUT_FORMAT_LIST, default="jsonl",
+                               help="the output format (default: jsonl)")
+
+    export_parser.add_argument("--fields", default=None,
+                               help="comma separated list of the fields to export (default: all)")
+
+    export_parser.add_argument("--from", dest="first_date", metavar="DATE", default=None,
+                               help="only export the records dated on or after DATE (YYYY-MM-DD)")
+
+    export_parser.add_argument("--to", dest="last_date", metavar="DATE", default=None,
+                               help="only export the records dated on or before DATE (YYYY-MM-DD)")
+
+    export_parser.add_argument("--category", action="append", default=None,
+                               help="only export the job adverts of this category (can be repeated)")
+
+    export_parser.add_argument("--url", action="append", default=None,
+                               help="only export the job search history of this web site (can be repeated)")
+
+    export_parser.add_argument("--storage", choices=storage.STORAGE_LIST, default=None,
+                               help="the storage backend (see the {} environment variable)".format(storage.STORAGE_ENV_VAR))
+
+    export_parser.add_argument("-o", "--output", default="-",
+                               help="the output file (default: the standard output)")
+
+    export_parser.set_defaults(function=export_command)
+
+    # Duplicates
+
+    duplicates_parser = subparsers.add_parser("duplicates",
+                                              help="list the duplicate and near-duplicate job adverts")
+
+    duplicates_parser.add_argument("--threshold", type=float, default=duplicates.DEFAULT_SIMILARITY_THRESHOLD,
+                                   help="the minimum estimated similarity of the near-duplicates (default: {})".format(duplicates.DEFAULT_SIMILARITY_THRESHOLD))
+
+    duplicates_parser.add_argument("--storage", choices=storage.STORAGE_LIST, default=None,
+                                   help="the storage backend (see the {} environment variable)".format(storage.STORAGE_ENV_VAR))
+
+    duplicates_parser.set_defaults(function=duplicates_command)
+
+    # Check links
+
+    check_links_parser = subparsers.add_parser("check-links",
+                                               help="check whether the job adverts and the web sites are still online")
+
+    targets_group = check_links_parser.add_mutually_exclusive_group()
+
+    targets_group.add_argument("--adverts", dest="targets", action="store_const", const="adverts", default="all",
+                               help="only check the urls of the job adverts")
+
+    targets_group.add_argument("--sites", dest="targets", action="store_const", const="sites",
+                               help="only check the urls of the web sites")
+
+    check_links_parser.add_argument("--timeout", type=float, default=link_checker.DEFAULT_TIMEOUT,
+                                    help="the maximum time in seconds of each request (default: {})".format(link_checker.DEFAULT_TIMEOUT))
+
+    check_links_parser.add_argument("--connections-per-host", type=int, default=link_checker.DEFAULT_MAX_CONNECTIONS_PER_HOST,
+                                    help="the maximum number of connections to each host (default: {})".format(link_checker.DEFAULT_MAX_CONNECTIONS_PER_HOST))
+
+    check_links_parser.add_argument("--storage", choices=storage.STORAGE_LIST, default=None,
+                                    help="the storage backend (see the {} environment variable)".format(storage.STORAGE_ENV_VAR))
+
+    check_links_parser.set_defaults(function=check_links_command)
+
+    # Rank
+
+    rank_parser = subparsers.add_parser("rank",
+                                        help="list the job adverts most relevant to keywords or to a job advert")
+
+    rank_parser.add_argument("keywords", nargs="*", metavar="KEYWORD",
+                             help="the keyword profile")
+
+    rank_parser.add_argument("--like", metavar="URL", default=None,
+                             help="rank by similarity to the job advert URL instead of keywords")
+
+    rank_parser.add_argument("-k", type=int, default=relevance.DEFAULT_TOP_K,
+                             help="the number of job adverts listed (default: {})".format(relevance.DEFAULT_TOP_K))
+
+    rank_parser.add_argument("--storage", choices=storage.STORAGE_LIST, default=None,
+                             help="the storage backend (see the {} environment variable)".format(storage.STORAGE_ENV_VAR))
+
+    rank_parser.set_defaults(function=rank_command)
+
+    args = parser.parse_args(argv)
+
+    if args.trace is not None:
+        tracing.enable(args.trace)
+    else:
+        tracing.enable_from_environment()
+
+    try:
+        return args.function(args)
+    except (OSError, ValueError) as e:
+        print("jobmanager: error: {}".format(e), file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
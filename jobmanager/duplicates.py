@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Detection of duplicate and near-duplicate job adverts.
+
+- Duplicates: the same job advert is often published with different urls
+  (tracking parameters, http/https, "www." prefix, ...). canonical_url()
+  removes these differences and CanonicalUrlIndex maps the canonical urls to
+  the urls of the database (O(1) checks).
+
+- Near-duplicates: the same job advert published on different web sites.
+  Each job advert gets a MinHash signature of the word 3-grams of its title
+  and description (one permutation hashing: the hash space is split into
+  NUM_BINS bins and the signature keeps the minimum hash of each bin).
+  Signatures are split into NUM_BANDS bands: two job adverts are candidate
+  duplicates if one of their bands is equal (locality sensitive hashing),
+  then their estimated Jaccard similarity is checked. This avoids the O(n^2)
+  pairwise comparison.
+
+Computing the signatures takes most of the time of a scan: they are kept in
+SIGNATURE_CACHE_FILENAME (see SignatureCache) and only computed again for
+the job adverts added or edited since the previous scan.
+"""
+
+import array
+import logging
+import marshal
+import os
+import re
+import sys
+import urllib.parse
+import zlib
+
+import save_scheduler
+import search_index
+
+# Query parameters added by mailing lists, social networks and ads trackers.
+# Only parameters that never identify the page are listed: generic names like
+# "ref" or "trk" are also used by some web sites to select the job advert.
+TRACKING_PARAMETER_REGEX = re.compile(r"^(utm_[a-z_]+|fbclid|gclid|dclid|msclkid|yclid|mc_cid|mc_eid|_hsenc|_hsmi|igshid)$", re.IGNORECASE)
+
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_BINS = NUM_BANDS * ROWS_PER_BAND
+
+SHINGLE_SIZE = 3
+
+# Only the first words of the descriptions are used (the beginning of a job
+# advert is enough to identify it and it keeps the signatures fast to compute)
+MAX_WORDS = 100
+MAX_DESC_CHARS = 20 * MAX_WORDS
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.7
+
+# Shingles are hashed with CRC32 (unlike hash(), it doesn't change between
+# two runs so the similarities are reproducible)
+EMPTY_BIN = 1 << 32
+
+SIGNATURE_CACHE_FILENAME = "~/job_adverts_signatures.cache"
+
+# The cached signatures are dropped when the format or the parameters of the
+# signatures change
+SIGNATURE_CACHE_VERSION = (1, tuple(sys.version_info[:2]), NUM_BINS, SHINGLE_SIZE, MAX_WORDS, MAX_DESC_CHARS)
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_url(url):
+    """
+    Return the canonical form of url: the scheme, the "www." prefix, the
+    fragment, the tracking parameters and the trailing slash are removed,
+    the host is lower cased and the query parameters are sorted.
+    """
+
+    split_url = urllib.parse.urlsplit(url.strip())
+
+    netloc = split_url.netloc.lower()
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    if netloc.endswith(":80") or netloc.endswith(":443"):
+        netloc = netloc.rsplit(":", 1)[0]
+
+    path = split_url.path.rstrip("/")
+
+    query_list = [(key, value) for (key, value) in urllib.parse.parse_qsl(split_url.query, keep_blank_values=True)
+                  if TRACKING_PARAMETER_REGEX.match(key) is None]
+    query = urllib.parse.urlencode(sorted(query_list))
+
+    canonical = netloc + path
+    if len(query) > 0:
+        canonical += "?" + query
+
+    return canonical
+
+
+class CanonicalUrlIndex(object):
+
+    def __init__(self):
+        self.urls = {}          # {canonical url: url}
+
+
+    def add(self, url):
+        self.urls.setdefault(canonical_url(url), url)
+
+
+    def remove(self, url):
+        key = canonical_url(url)
+        if self.urls.get(key) == url:
+            del self.urls[key]
+
+
+    def find(self, url):
+        """
+        Return the url of the database equivalent to url (or None).
+        """
+
+        return self.urls.get(canonical_url(url))
+
+
+def _first_words(text, max_words):
+    """
+    Return the first max_words words of text (without tokenizing the whole
+    text, which took most of the time of minhash_signature()).
+    """
+
+    # A word and its separator rarely take more than 8 characters
+    prefix_length = 8 * max_words
+    word_list = search_index.tokenize(text[:prefix_length])
+    if len(word_list) <= max_words and len(text) > prefix_length:
+        word_list = search_index.tokenize(text[:MAX_DESC_CHARS])
+    return word_list[:max_words]
+
+
+def minhash_signature(job_advert_dict):
+    """
+    Return the MinHash signature (a tuple of NUM_BINS ints) of the title and
+    the description of the job advert (or None if they are too short).
+    """
+
+    word_list = search_index.tokenize(job_advert_dict.get("title", ""))
+    word_list += _first_words(job_advert_dict.get("desc", ""), MAX_WORDS)
+
+    if len(word_list) < SHINGLE_SIZE:
+        return None
+
+    # Minimum hash of each bin, in one pass over the shingles (a shingle seen
+    # twice doesn't change the minimums: no set is needed)
+    shingle_iterator = map(" ".join, zip(*[word_list[i:] for i in range(SHINGLE_SIZE)]))
+
+    signature = [EMPTY_BIN] * NUM_BINS
+    for shingle_hash in map(zlib.crc32, map(str.encode, shingle_iterator)):
+        bin_index = shingle_hash % NUM_BINS
+        if shingle_hash < signature[bin_index]:
+            signature[bin_index] = shingle_hash
+
+    # Densification: the empty bins take the value of the next non-empty bin
+    for bin_index in range(NUM_BINS):
+        if signature[bin_index] == EMPTY_BIN:
+            offset = 1
+            while signature[(bin_index + offset) % NUM_BINS] == EMPTY_BIN:
+                offset += 1
+            signature[bin_index] = signature[(bin_index + offset) % NUM_BINS] + offset
+
+    return tuple(signature)
+
+
+def estimated_similarity(signature1, signature2):
+    """
+    Estimate the Jaccard similarity of two job adverts from their signatures.
+    """
+
+    return sum(1 for value1, value2 in zip(signature1, signature2) if value1 == value2) / NUM_BINS
+
+
+class SignatureCache(object):
+    """
+    The MinHash signatures of the previous scans: {url: (key, signature
+    bytes)} where key is a CRC32 of the title and of the beginning of the
+    description (an edited job advert gets a new signature).
+    """
+
+    def __init__(self, path=SIGNATURE_CACHE_FILENAME):
+        self.path = os.path.expanduser(path)
+
+        self.entries = {}        # The entries read from the file
+        self.used_entries = {}   # The entries of the job adverts seen since the loading
+        self.changed = False
+
+        try:
+            with open(self.path, "rb") as fd:
+                version, entries = marshal.load(fd)
+            if version == SIGNATURE_CACHE_VERSION:
+                self.entries = entries
+        except FileNotFoundError:
+            pass
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            logger.warning("Invalid signature cache %s (%s): the signatures are computed again", self.path, e)
+
+
+    def get_signature(self, url, job_advert_dict):
+        """
+        Return minhash_signature(job_advert_dict), from the cache if the job
+        advert has not changed.
+        """
+
+        title = job_advert_dict.get("title", "")
+        desc = job_advert_dict.get("desc", "")
+        key = zlib.crc32(desc[:MAX_DESC_CHARS].encode(), zlib.crc32(title.encode()))
+
+        entry = self.used_entries.get(url) or self.entries.get(url)
+        if entry is not None and entry[0] == key:
+            self.used_entries[url] = entry
+            return _decode_signature(entry[1])
+
+        signature = minhash_signature(job_advert_dict)
+        self.used_entries[url] = (key, _encode_signature(signature))
+        self.changed = True
+        return signature
+
+
+    def save(self, keep_unused=False):
+        """
+        Write the signatures of the job adverts seen since the loading (the
+        other ones have been removed from the database), and the other
+        signatures too if keep_unused is True (the scan has been
+        interrupted).
+        """
+
+        if keep_unused:
+            self.used_entries = {**self.entries, **self.used_entries}
+
+        if not self.changed and len(self.used_entries) == len(self.entries):
+            return
+
+        try:
+            fd_num, tmp_path = save_scheduler.create_temporary_file(self.path)
+            try:
+                with os.fdopen(fd_num, "wb") as fd:
+                    marshal.dump((SIGNATURE_CACHE_VERSION, self.used_entries), fd)
+            except:
+                os.remove(tmp_path)
+                raise
+            save_scheduler.replace_file(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Cannot write the signature cache %s (%s)", self.path, e)
+            return
+
+        self.entries = self.used_entries
+        self.used_entries = dict(self.entries)
+        self.changed = False
+
+
+def _encode_signature(signature):
+    # 32 bits values, unless a densified bin exceeds them (no bytes if there
+    # is no signature)
+    if signature is None:
+        return b""
+    return array.array("I" if max(signature) <= 0xffffffff else "Q", signature).tobytes()
+
+
+def _decode_signature(signature_bytes):
+    if len(signature_bytes) == 0:
+        return None
+    return tuple(array.array("I" if len(signature_bytes) == 4 * NUM_BINS else "Q", signature_bytes))
+
+
+class MinHashIndex(object):
+
+    def __init__(self, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD, signature_cache=None):
+        """
+        The signatures are read from signature_cache (a SignatureCache) if
+        it is not None.
+        """
+
+        self.similarity_threshold = similarity_threshold
+        self.signature_cache = signature_cache
+        self.signatures = {}                                  # {url: signature}
+
+        # {band values: url, or set of urls if there are several} for each
+        # band (most band values are unique: a set for each one takes most
+        # of the time and memory of the index)
+        self.bands = [{} for band in range(NUM_BANDS)]
+
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+    def _iter_band_keys(self, signature):
+        # (band dict, the ROWS_PER_BAND values of the band) for each band
+        return zip(self.bands, zip(*[iter(signature)] * ROWS_PER_BAND))
+
+
+    def add(self, url, job_advert_dict):
+        self.remove(url)
+
+        if self.signature_cache is not None:
+            signature = self.signature_cache.get_signature(url, job_advert_dict)
+        else:
+            signature = minhash_signature(job_advert_dict)
+        if signature is None:
+            return
+
+        self.signatures[url] = signature
+        for band_dict, key in self._iter_band_keys(signature):
+            other_urls = band_dict.setdefault(key, url)
+            if other_urls is not url:
+                if isinstance(other_urls, set):
+                    other_urls.add(url)
+                else:
+                    band_dict[key] = {other_urls, url}
+
+
+    def remove(self, url):
+        signature = self.signatures.pop(url, None)
+        if signature is None:
+            return
+
+        for band_dict, key in self._iter_band_keys(signature):
+            urls = band_dict[key]
+            if isinstance(urls, set):
+                urls.discard(url)
+                if len(urls) == 1:
+                    band_dict[key] = urls.pop()
+            else:
+                del band_dict[key]
+
+
+    def _find_similar(self, signature, excluded_url=None):
+        candidate_set = set()
+        for band_dict, key in self._iter_band_keys(signature):
+            urls = band_dict.get(key)
+            if isinstance(urls, set):
+                candidate_set.update(urls)
+            elif urls is not None:
+                candidate_set.add(urls)
+        candidate_set.discard(excluded_url)
+
+        similar_list = []
+        for candidate_url in candidate_set:
+            similarity = estimated_similarity(signature, self.signatures[candidate_url])
+            if similarity >= self.similarity_threshold:
+                similar_list.append((similarity, candidate_url))
+
+        similar_list.sort(reverse=True)
+        return similar_list
+
+
+    def find_similar(self, job_advert_dict, excluded_url=None):
+        """
+        Return the [(estimated similarity, url), ...] list of the probable
+        duplicates of job_advert_dict (most similar first).
+        """
+
+        signature = minhash_signature(job_advert_dict)
+        if signature is None:
+            return []
+
+        return self._find_similar(signature, excluded_url)
+
+
+    def iter_similar_pairs(self):
+        """
+        Iterate over the (similarity, url1, url2) probable duplicates of the
+        whole index (each pair once).
+        """
+
+        for url, signature in self.signatures.items():
+            for similarity, other_url in self._find_similar(signature, url):
+                if url < other_url:
+                    yield similarity, url, other_url
+
+
+def find_duplicates(job_advert_storage, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD, signature_cache=None):
+    """
+    Return (url_duplicate_list, similar_pair_list) for the whole database:
+    url_duplicate_list contains the lists of urls having the same canonical
+    url and similar_pair_list the (similarity, url1, url2) near-duplicates.
+
+    The signatures are read from signature_cache (a SignatureCache) if it is
+    not None (save it afterwards).
+    """
+
+    url_groups = {}
+    minhash_index = MinHashIndex(similarity_threshold, signature_cache)
+
+    for url, job_advert_dict in job_advert_storage.query_job_adverts(field_list=("title", "desc")):
+        url_groups.setdefault(canonical_url(url), []).append(url)
+        minhash_index.add(url, job_advert_dict)
+
+    url_duplicate_list = [sorted(url_list) for url_list in url_groups.values() if len(url_list) > 1]
+    similar_pair_list = sorted(minhash_index.iter_similar_pairs(), reverse=True)
+
+    return url_duplicate_list, similar_pair_list
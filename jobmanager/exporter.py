@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Streaming export of the job adverts and of the job search history to JSONL
+or CSV files.
+
+Records are written one by one as they are read from the storage backend.
+"""
+
+import csv
+import json
+
+import storage
+
+OUTPUT_FORMAT_LIST = ["jsonl", "csv"]
+
+JOB_ADVERT_RECORD_FIELDS = ("url",) + storage.JOB_ADVERT_FIELDS
+JOB_SEARCH_RECORD_FIELDS = ("url", "date", "status")
+
+
+def iter_job_advert_records(job_advert_storage, first_date=None, last_date=None, category_set=None, field_list=JOB_ADVERT_RECORD_FIELDS):
+    """
+    Iterate over the job adverts as flat dicts containing the fields of
+    field_list (taken from JOB_ADVERT_RECORD_FIELDS).
+    """
+
+    storage_field_list = [field for field in field_list if field != "url"]
+
+    for url, job_advert_dict in job_advert_storage.query_job_adverts(first_date, last_date, category_set, storage_field_list):
+        job_advert_dict["url"] = url
+        yield {field: job_advert_dict[field] for field in field_list}
+
+
+def iter_job_search_records(job_advert_storage, first_date=None, last_date=None, url_set=None, field_list=JOB_SEARCH_RECORD_FIELDS):
+    """
+    Iterate over the job search history as flat dicts containing the fields
+    of field_list (taken from JOB_SEARCH_RECORD_FIELDS).
+    """
+
+    for url, date, status in job_advert_storage.query_job_searchs(first_date, last_date, url_set):
+        record = {"url": url, "date": date, "status": status}
+        yield {field: record[field] for field in field_list}
+
+
+def write_jsonl(record_iterable, fd, field_list):
+    num_records = 0
+    for record in record_iterable:
+        fd.write(json.dumps(record) + "\n")
+        num_records += 1
+    return num_records
+
+
+def write_csv(record_iterable, fd, field_list):
+    writer = csv.DictWriter(fd, fieldnames=field_list)
+    writer.writeheader()
+
+    num_records = 0
+    for record in record_iterable:
+        writer.writerow(record)
+        num_records += 1
+    return num_records
+
+
+WRITERS = {"jsonl": write_jsonl, "csv": write_csv}
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Advisory locks shared between processes (e.g. the GUI and the jobmanager
+command working on the same database).
+
+Readers take a shared lock while they read the database files and writers
+take an exclusive lock while they append to the journal or rewrite the JSON
+file. The lock is taken on a separate lock file (e.g.
+"~/job_adverts.json.lock") as the database files are replaced on each save.
+
+Locks are reentrant within a thread (a thread holding the exclusive lock can
+take the shared or the exclusive lock again). Each thread uses its own file
+descriptor so that the threads of the same process exclude each other too.
+"""
+
+import contextlib
+import fcntl
+import threading
+
+LOCK_SUFFIX = ".lock"
+
+
+class FileLock(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()    # fd, mode and depth of the lock held by the current thread
+
+
+    @contextlib.contextmanager
+    def _lock(self, mode):
+        depth = getattr(self.local, "depth", 0)
+
+        if depth > 0:
+            # Already locked by this thread (a shared lock is not upgraded:
+            # it could deadlock with another reader doing the same)
+            if mode == fcntl.LOCK_EX and self.local.mode == fcntl.LOCK_SH:
+                raise RuntimeError("Can't upgrade a shared lock to an exclusive lock")
+            self.local.depth += 1
+            try:
+                yield
+            finally:
+                self.local.depth -= 1
+            return
+
+        fd = open(self.path, "a")
+        try:
+            fcntl.flock(fd, mode)
+            self.local.mode = mode
+            self.local.depth = 1
+            try:
+                yield
+            finally:
+                self.local.depth = 0
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            fd.close()
+
+
+    def shared(self):
+        """
+        Return a context manager holding the shared (read) lock.
+        """
+
+        return self._lock(fcntl.LOCK_SH)
+
+
+    def exclusive(self):
+        """
+        Return a context manager holding the exclusive (write) lock.
+        """
+
+        return self._lock(fcntl.LOCK_EX)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Bulk import of job adverts from CSV or JSONL files.
+
+Each row (or JSON object) has the keys "url", "category", "organization",
+"title", "score", "pros", "cons", "desc" and optionally "date" (today by
+default). Rows are checked with the same rules as the GUI (see the
+validation module); rows whose url is already in the database (or earlier
+in the input) are skipped, up to tracking parameters and such (see
+duplicates.canonical_url()).
+"""
+
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+
+import duplicates
+import job_advert_record
+import validation
+
+INPUT_FORMAT_LIST = ["csv", "jsonl"]
+
+# Maximum number of error messages kept in the report
+MAX_ERROR_MESSAGES = 100
+
+
+def guess_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    elif extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ValueError("Cannot guess the format of {} (use --format)".format(path))
+
+
+def read_csv(fd):
+    return csv.DictReader(fd)
+
+
+def read_jsonl(fd):
+    """
+    Yield the JSON objects of fd (one per line) ; malformed lines are
+    yielded as None.
+    """
+
+    for line in fd:
+        if len(line.strip()) == 0:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+class ImportReport(object):
+
+    def __init__(self):
+        self.num_rows = 0
+        self.num_imported = 0
+        self.num_duplicates = 0
+        self.num_invalid = 0
+        self.error_msg_list = []
+        self.duration = 0.
+
+    def add_error(self, row_number, error_msg):
+        self.num_invalid += 1
+        if len(self.error_msg_list) < MAX_ERROR_MESSAGES:
+            self.error_msg_list.append("Row {}: {}".format(row_number, error_msg))
+
+    def rows_per_second(self):
+        return self.num_rows / self.duration if self.duration > 0 else float("inf")
+
+    def __str__(self):
+        return "{} rows read, {} imported, {} duplicates, {} invalid in {:.2f}s ({:.0f} rows/s)".format(self.num_rows,
+                                                                                                       self.num_imported,
+                                                                                                       self.num_duplicates,
+                                                                                                       self.num_invalid,
+                                                                                                       self.duration,
+                                                                                                       self.rows_per_second())
+
+
+TEXT_FIELDS = ("url", "category", "organization", "title", "pros", "cons", "desc", "date")
+
+
+def _parse_score(score):
+    """
+    Return the score as an int, None if it is not an integer (e.g. 3.5 or
+    "high").
+    """
+
+    if isinstance(score, bool):
+        return None
+    if isinstance(score, int):
+        return score
+    if isinstance(score, float):
+        return int(score) if score.is_integer() else None
+    if isinstance(score, str):
+        try:
+            return int(score.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _row_to_job_advert(row, today_iso_str):
+    """
+    Return (url, job_advert_dict, error_msg_list).
+    """
+
+    error_msg_list = []
+
+    # JSONL values may have any type
+    text_dict = {}
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        if value is None:
+            value = ""
+        elif not isinstance(value, str):
+            error_msg_list.append("The {} must be a string.".format(field))
+            value = ""
+        text_dict[field] = value
+
+    url = text_dict["url"].strip()
+    category = text_dict["category"] or None
+
+    score = row.get("score")
+    if score in (None, ""):
+        score = validation.DEFAULT_SCORE
+    else:
+        score = _parse_score(score)
+
+    date = text_dict["date"] or today_iso_str
+
+    error_msg_list += validation.check_job_advert(url, category, score)
+    try:
+        job_advert_record.date_to_ordinal(date)       # Also rejects impossible dates (e.g. 2024-02-30)
+    except ValueError:
+        error_msg_list.append("The date must be a valid date in the YYYY-MM-DD format.")
+
+    job_advert_dict = {"date": date,
+                       "category": category,
+                       "organization": text_dict["organization"],
+                       "title": text_dict["title"],
+                       "score": score,
+                       "pros": text_dict["pros"],
+                       "cons": text_dict["cons"],
+                       "desc": text_dict["desc"]}
+
+    return url, job_advert_dict, error_msg_list
+
+
+def import_job_adverts(job_advert_storage, row_iterable):
+    """
+    Import the rows (dicts) of row_iterable in job_advert_storage (in one
+    write) and return an ImportReport.
+    """
+
+    report = ImportReport()
+    start_time = time.monotonic()
+
+    # Hash set of the canonical urls already in the database or imported (the
+    # same job advert is often published with different tracking parameters)
+    url_set = set(duplicates.canonical_url(url) for url, summary_dict in job_advert_storage.iter_job_advert_summaries())
+
+    today_iso_str = datetime.date.isoformat(datetime.date.today())
+
+    def iter_valid_job_adverts():
+        for row in row_iterable:
+            report.num_rows += 1
+
+            if row is None:
+                report.add_error(report.num_rows, "Malformed row.")
+                continue
+
+            url, job_advert_dict, error_msg_list = _row_to_job_advert(row, today_iso_str)
+
+            if len(error_msg_list) > 0:
+                report.add_error(report.num_rows, " ".join(error_msg_list))
+                continue
+
+            canonical_url = duplicates.canonical_url(url)
+            if canonical_url in url_set:
+                report.num_duplicates += 1
+            else:
+                url_set.add(canonical_url)
+                report.num_imported += 1
+                yield url, job_advert_dict
+
+    job_advert_storage.set_job_adverts(iter_valid_job_adverts())
+
+    report.duration = time.monotonic() - start_time
+
+    return report
+
+
+def import_file(job_advert_storage, path, input_format=None):
+    """
+    Import the CSV or JSONL file "path" ("-" for the standard input).
+    """
+
+    if input_format is None:
+        input_format = guess_format(path)
+
+    reader = READERS[input_format]
+
+    if path == "-":
+        return import_job_adverts(job_advert_storage, reader(sys.stdin))
+
+    with open(path, "r", newline="") as fd:
+        return import_job_adverts(job_advert_storage, reader(fd))
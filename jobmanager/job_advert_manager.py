@@ -25,117 +25,266 @@
 ...
 """
 
+import time
+
+START_TIME = time.monotonic()       # Used to measure the cold start time
+
 import gi
 
 gi.require_version('Gtk', '3.0')
 
 from gi.repository import Gtk as gtk
 
-import fcntl  # TODO: use GtkApplication instead
-import sys
+import argparse
+import logging
 
 import add_and_edit_container
 import job_adverts_model
 import job_adverts_view
-import search_container
-import stats_container
+import tracing
+
+# Maximum time (in seconds) between the start of the process and the first
+# display of the main window
+COLD_START_BUDGET = 1.
 
-LOCK_FILENAME = ".lock"  # TODO: use GtkApplication instead
+logger = logging.getLogger(__name__)
 
 class MainWindow(gtk.Window):
 
     def __init__(self):
 
-        self.job_adverts_model = job_adverts_model.JobAdvertsModel()
+        # The database is loaded from the GTK main loop (see load_async())
+        self.job_adverts_model = job_adverts_model.JobAdvertsModel(streaming=True)
+        self.database_loaded = False
 
         # Build the main window
         gtk.Window.__init__(self, title="Job advert logger")
         self.maximize()
         self.set_border_width(4)
 
-        notebook_container = gtk.Notebook()
-        self.add(notebook_container)
+        main_box = gtk.Box(orientation=gtk.Orientation.VERTICAL, spacing=4)
+        self.add(main_box)
+
+        self.notebook_container = gtk.Notebook()
+        main_box.pack_start(self.notebook_container, expand=True, fill=True, padding=0)
+
+        self.progress_bar = gtk.ProgressBar()
+        self.progress_bar.set_text("Loading the database...")
+        self.progress_bar.set_show_text(True)
+        main_box.pack_start(self.progress_bar, expand=False, fill=False, padding=0)
+
+        # Notebook pages ######################################################
+
+        # The content of each page is built the first time it is displayed
+        # (see switch_page_cb()) ; the Search and Stats pages also wait for
+        # the end of the database loading
+        self.page_builders = {}     # {page: (build_function, needs_the_database)}
+
+        self.append_lazy_page("Add", self.build_add_page)
+        self.append_lazy_page("Edit", self.build_edit_page)
+        self.append_lazy_page("Search", self.build_search_page, needs_the_database=True)
+        self.append_lazy_page("Stats", self.build_stats_page, needs_the_database=True)
+
+        self.notebook_container.connect("switch-page", self.switch_page_cb)
+        self.build_page(self.notebook_container.get_nth_page(0))
+
+        self.cold_start_time = None
+        self.first_draw_handler_id = self.connect("draw", self.first_draw_cb)
+
+        self.job_adverts_model.load_async(self.load_progress_cb, self.load_done_cb)
 
-        # Add job advert container ############################################
 
+    def append_lazy_page(self, label, build_function, needs_the_database=False):
+        page = gtk.Box(orientation=gtk.Orientation.VERTICAL)
+        self.page_builders[page] = (build_function, needs_the_database)
+        self.notebook_container.append_page(page, gtk.Label(label=label))
+
+
+    @tracing.traced()
+    def build_page(self, page):
+        if page not in self.page_builders:
+            return                        # Already built
+
+        build_function, needs_the_database = self.page_builders[page]
+        if needs_the_database and not self.database_loaded:
+            return                        # Built at the end of the loading
+
+        del self.page_builders[page]
+
+        widget = build_function()
+        page.pack_start(widget, expand=True, fill=True, padding=0)
+        widget.show_all()
+
+
+    @tracing.traced()
+    def switch_page_cb(self, notebook, page, page_num):
+        self.build_page(page)
+
+
+    def build_add_page(self):
         self.add_container = add_and_edit_container.AddAndEditContainer(self, self.job_adverts_model, edit_mode=False)
+        return self.add_container
 
-        # Edit container ######################################################
 
+    def build_edit_page(self):
         # Treeview
-        self.job_advert_treeview = job_adverts_view.JobAdvertsView(self.job_adverts_model.liststore, None) # TODO!!!
+        self.job_advert_treeview = job_adverts_view.JobAdvertsView(self.job_adverts_model.tree_model, None, self.job_adverts_model.search_index) # TODO!!!
+
+        # Filter entry
+        filter_entry = gtk.SearchEntry()
+        filter_entry.set_placeholder_text("Filter (title, organization, pros, cons, description)")
+        filter_entry.connect("search-changed", self.job_advert_treeview.search_changed_cb)
+
+        # Link check button (the "Link" column shows the results)
+        self.check_links_button = gtk.Button(label="Check the links")
+        self.check_links_button.set_tooltip_text("Check whether the job adverts are still online")
+        self.check_links_button.connect("clicked", self.check_links_cb)
+
+        # Relevance ranking (the "Relevance" column shows the results)
+        self.relevance_entry = gtk.Entry()
+        self.relevance_entry.set_placeholder_text("Rank by relevance to keywords (Enter)")
+        self.relevance_entry.connect("activate", self.rank_by_keywords_cb)
+
+        rank_like_button = gtk.Button(label="Rank like selected")
+        rank_like_button.set_tooltip_text("Rank the job adverts by similarity to the selected one")
+        rank_like_button.connect("clicked", self.rank_like_selected_cb)
+
+        filter_box = gtk.Box(orientation=gtk.Orientation.HORIZONTAL, spacing=6)
+        filter_box.pack_start(filter_entry, expand=True, fill=True, padding=0)
+        filter_box.pack_start(self.relevance_entry, expand=True, fill=True, padding=0)
+        filter_box.pack_start(rank_like_button, expand=False, fill=False, padding=0)
+        filter_box.pack_start(self.check_links_button, expand=False, fill=False, padding=0)
 
         scrolled_window = gtk.ScrolledWindow()
-        scrolled_window.set_border_width(18)
         scrolled_window.set_shadow_type(gtk.ShadowType.IN)
         scrolled_window.set_policy(gtk.PolicyType.AUTOMATIC, gtk.PolicyType.ALWAYS)
         scrolled_window.add(self.job_advert_treeview)
 
+        treeview_box = gtk.Box(orientation=gtk.Orientation.VERTICAL, spacing=6)
+        treeview_box.set_border_width(18)
+        treeview_box.pack_start(filter_box, expand=False, fill=True, padding=0)
+        treeview_box.pack_start(scrolled_window, expand=True, fill=True, padding=0)
+
         # Edit box container
         self.edit_container = add_and_edit_container.AddAndEditContainer(self, self.job_adverts_model, edit_mode=True, treeview=self.job_advert_treeview)
         self.job_advert_treeview.edit_container = self.edit_container # TODO!!!
 
         # Add the widgets to the container
         paned_container = gtk.Paned(orientation=gtk.Orientation.VERTICAL)
-        paned_container.add1(scrolled_window)
+        paned_container.add1(treeview_box)
         paned_container.add2(self.edit_container)
 
         # The position in pixels of the divider (i.e. the default size of the top pane)
         paned_container.set_position(400)
 
-        # Job search container ################################################
+        return paned_container
+
+
+    @tracing.traced()
+    def rank_by_keywords_cb(self, entry):
+        keywords = entry.get_text().strip()
+
+        if keywords == "":
+            self.job_adverts_model.rank_job_adverts()          # Clear the column
+        else:
+            self.job_adverts_model.rank_job_adverts(keywords=keywords)
+            self.job_advert_treeview.sort_by_relevance()
+
+
+    @tracing.traced()
+    def rank_like_selected_cb(self, button):
+        url = self.job_advert_treeview.get_selected_url()
+
+        if url is not None:
+            self.relevance_entry.set_text("")
+            self.job_adverts_model.rank_job_adverts(reference_url=url)
+            self.job_advert_treeview.sort_by_relevance()
+
+
+    @tracing.traced()
+    def check_links_cb(self, button):
+        self.check_links_button.set_sensitive(False)
+        self.job_adverts_model.check_links(list(self.job_adverts_model.tree_model.urls), self.check_links_done_cb)
+
+
+    def check_links_done_cb(self, status_dicts):
+        self.check_links_button.set_sensitive(True)
+
+
+    def build_search_page(self):
+        import search_container
+        return search_container.SearchContainer(self.job_adverts_model)
+
+
+    def build_stats_page(self):
+        import stats_container      # Imports matplotlib
+        return stats_container.StatsContainer(self.job_adverts_model)
+
+
+    @tracing.traced()
+    def first_draw_cb(self, widget, cairo_context):
+        self.disconnect(self.first_draw_handler_id)
+
+        self.cold_start_time = time.monotonic() - START_TIME
+
+        if self.cold_start_time > COLD_START_BUDGET:
+            logger.warning("Cold start: main window displayed after %.3fs (budget: %.3fs)", self.cold_start_time, COLD_START_BUDGET)
+        else:
+            logger.info("Cold start: main window displayed after %.3fs (budget: %.3fs)", self.cold_start_time, COLD_START_BUDGET)
 
-        search_job_adverts_container = search_container.SearchContainer(self.job_adverts_model)
+        return False
 
-        # Stats container #####################################################
 
-        stats_job_adverts_container = stats_container.StatsContainer(self.job_adverts_model)
+    @tracing.traced()
+    def load_progress_cb(self, progress):
+        self.progress_bar.set_fraction(progress)
 
-        ###################################
 
-        add_label = gtk.Label(label="Add")
-        notebook_container.append_page(self.add_container, add_label)
+    @tracing.traced()
+    def load_done_cb(self):
+        self.progress_bar.hide()
+        self.database_loaded = True
 
-        edit_label = gtk.Label(label="Edit")
-        notebook_container.append_page(paned_container, edit_label)
+        # Apply the changes made by the other processes from now on
+        self.job_adverts_model.watch()
 
-        search_label = gtk.Label(label="Search")
-        notebook_container.append_page(search_job_adverts_container, search_label)
+        # Build the current page if it was waiting for the database
+        current_page = self.notebook_container.get_nth_page(self.notebook_container.get_current_page())
+        self.build_page(current_page)
 
-        stats_label = gtk.Label(label="Stats")
-        notebook_container.append_page(stats_job_adverts_container, stats_label)
 
+    @tracing.traced()
+    def delete_event_cb(self, widget, event):
+        # Compact the journal into the JSON file and wait for the pending
+        # writes before quitting
+        self.job_adverts_model.close()
+        gtk.main_quit()
 
-def main():
 
-    # Acquire an exclusive lock on LOCK_FILENAME
-    fd = open(LOCK_FILENAME, "w")  # TODO: use GtkApplication instead
+def main(argv=None):
 
-    try:  # TODO: use GtkApplication instead
-        # LOCK_EX = acquire an exclusive lock on fd
-        # LOCK_NB = make a nonblocking request
-        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)  # TODO: use GtkApplication instead
+    parser = argparse.ArgumentParser(description="A tool to manage job adverts for job seekers.")
 
-        ###################################
+    parser.add_argument("--trace", metavar="OUTPUT", default=None,
+                        help='trace the load, save, tab rendering and callbacks: "summary" prints a table at exit, any other value is the path of a Chrome trace file (see the {} environment variable)'.format(tracing.TRACE_ENV_VAR))
 
-        window = MainWindow()
+    args = parser.parse_args(argv)
 
-        window.connect("delete-event", gtk.main_quit) # ask to quit the application when the close button is clicked
-        window.show_all()                             # display the window
-        gtk.main()                                    # GTK+ main loop
+    if args.trace is not None:
+        tracing.enable(args.trace)
+    else:
+        tracing.enable_from_environment()
 
-        ###################################
+    logging.basicConfig(level=logging.INFO, format="%(name)s: %(message)s")
 
-        # LOCK_UN = unlock fd
-        fcntl.flock(fd, fcntl.LOCK_UN)  # TODO: use GtkApplication instead
-    except IOError:  # TODO: use GtkApplication instead
-        #print(LOCK_FILENAME + " is locked ; another instance is running. Exit.")
-        dialog = gtk.MessageDialog(parent=None, flags=0, message_type=gtk.MessageType.ERROR, buttons=gtk.ButtonsType.OK, message_format="Another instance is running in the same directory")
-        dialog.format_secondary_text("Exit.")
-        dialog.run()
-        dialog.destroy()
+    # Several instances can run at the same time (and the jobmanager
+    # command too): the database handles the concurrent accesses (see the
+    # storage module)
+    window = MainWindow()
 
-        sys.exit(1)
+    window.connect("delete-event", window.delete_event_cb) # ask to quit the application when the close button is clicked
+    window.show_all()                             # display the window
+    gtk.main()                                    # GTK+ main loop
 
 
 if __name__ == '__main__':
@@ -20,46 +20,661 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-from gi.repository import Gtk as gtk
+from gi.repository import Gio as gio
+from gi.repository import GLib as glib
 
-import json
-import os
+import threading
+import time
 
-JSON_FILENAME = "~/job_adverts.json"
+import duplicates
+import job_advert_record
+import job_adverts_tree_model
+import link_checker
+import page_cache
+import relevance
+import search_index
+import stats_engine
+import storage
+import tracing
+import visit_index
+
+# Maximum duration (in seconds) of each loading step run in the GTK main loop
+LOAD_STEP_DURATION = 0.01
+
+# Delay (in milliseconds) between a change of the database files and the
+# reading of the changes (the changes made meanwhile are read at once)
+REFRESH_DELAY = 300
 
 class JobAdvertsModel(object):
 
-    def __init__(self):
+    def __init__(self, storage_name=None, streaming=False):
+        """
+        If streaming is True, the database is not loaded here: call
+        load_async() to load it from the GTK main loop.
+        """
+
+        # Open the database (see the storage module)
+        self.storage = storage.open_storage(storage_name, streaming)
+
+        # Status of the urls of the job adverts and of the web sites at the
+        # last link check (see the link_checker module)
+        self.link_statuses = link_checker.load_link_statuses()
+
+        # Functions called with the set of the urls whose link status has
+        # been changed
+        self.link_status_changed_callbacks = []
+
+        # Link statuses received from the link checker thread and not applied
+        # yet (see check_links())
+        self.pending_link_statuses = []
+        self.pending_link_statuses_lock = threading.Lock()
+
+        # Local copy of the pages of the job adverts (created at the first
+        # use, see fetch_page())
+        self.page_cache = None
+        self.page_fetcher = None
+
+        # The Gtk.TreeModel of the views: it reads the rows from the job
+        # adverts of the database (the pros, cons and desc bodies are not
+        # needed there: they are read when a job advert is selected)
+        self.tree_model = job_adverts_tree_model.JobAdvertsTreeModel(self.link_statuses)
+
+        # Full-text index used to filter the job adverts
+        self.search_index = search_index.InvertedIndex()
+
+        # TF-IDF index of the job adverts (filled with the bodies, after the
+        # loading) and query vector of the relevance column (None if the job
+        # adverts are not ranked)
+        self.relevance_index = relevance.TfidfIndex()
+        self.relevance_query_vector = None
+
+        # Duplicate detection: canonical urls (filled with the ListStore) and
+        # MinHash signatures of the bodies (filled after the loading, from
+        # the signatures of the previous session)
+        self.url_index = duplicates.CanonicalUrlIndex()
+        self.signature_cache = duplicates.SignatureCache()
+        self.minhash_index = duplicates.MinHashIndex(signature_cache=self.signature_cache)
+        self.bodies_indexed = False
+
+        # Index of the job search visits (built at the first request, once
+        # the database is loaded)
+        self.visit_index = None
+
+        # Counts of the job adverts and of the visits per day (built at the
+        # first request, then updated on each change)
+        self.stats_counters = None
+
+        # Functions called (with no argument) when stats_counters is changed
+        self.stats_changed_callbacks = []
+
+        # Functions called with the set of the urls of the web sites whose
+        # job search history has been changed by another process (None if
+        # any may have changed)
+        self.job_search_changed_callbacks = []
+
+        # Monitoring of the changes made by the other processes (see watch())
+        self.file_monitors = []
+        self.refresh_timeout_id = None
+        self.refreshing = False
+        self.refresh_requested = False
+
+        if not streaming:
+            with tracing.span("JobAdvertsModel.load"):
+                for url, job_advert_dict, progress in self.storage.iter_load():
+                    self._append_row(url, job_advert_dict)
+
+            with tracing.span("JobAdvertsModel.index_bodies"):
+                for url, job_advert_dict in self.storage.iter_job_adverts():
+                    self._index_body(url, job_advert_dict)
+            self.bodies_indexed = True
+
+
+    def _append_row(self, url, summary_dict):
+        self.search_index.add(url, summary_dict)
+        self.url_index.add(url)
+        self.tree_model.append(url, summary_dict)
+
+
+    def _row_summary(self, job_advert):
+        # The JSON backend keeps the whole job adverts in memory: the tree
+        # model shares them. Other backends only return copies of their
+        # summaries so the bodies are not kept.
+        if self.storage.summaries_include_bodies:
+            return job_advert
+        if isinstance(job_advert, job_advert_record.JobAdvert):
+            return job_advert.summary()
+        return {field: job_advert[field] for field in storage.SUMMARY_FIELDS}
+
+
+    def load_async(self, progress_callback=None, done_callback=None):
+        """
+        Load the database in small steps run by GLib idle callbacks so that
+        the window stays responsive.
+
+        progress_callback is called with the fraction (between 0 and 1) of
+        the database loaded after each step and done_callback is called (with
+        no argument) at the end of the loading.
+        """
+
+        self.load_start_time = tracing.now()
+
+        load_iterator = self.storage.iter_load()
+        glib.idle_add(self._load_step, load_iterator, progress_callback, done_callback)
+
+
+    @tracing.traced()
+    def _load_step(self, load_iterator, progress_callback, done_callback):
+        deadline = time.monotonic() + LOAD_STEP_DURATION
+
+        for url, job_advert_dict, progress in load_iterator:
+            self._append_row(url, job_advert_dict)
+
+            if time.monotonic() > deadline:
+                if progress_callback is not None:
+                    progress_callback(progress)
+                return True      # Call _load_step again at the next idle time
+
+        tracing.record("JobAdvertsModel.load", self.load_start_time)
+
+        if done_callback is not None:
+            done_callback()
+
+        # The bodies have not been indexed yet (MinHash signatures, TF-IDF
+        # index, and the full-text index with some backends)
+        glib.idle_add(self._index_bodies_step, self.storage.iter_job_adverts())
+
+        return False             # Remove the idle callback
+
+
+    @tracing.traced()
+    def _index_bodies_step(self, job_advert_iterator):
+        deadline = time.monotonic() + LOAD_STEP_DURATION
+
+        for url, job_advert_dict in job_advert_iterator:
+            if self.tree_model.has_row(url):   # Not removed since the iteration started
+                self._index_body(url, job_advert_dict)
+
+            if time.monotonic() > deadline:
+                return True
+
+        self.bodies_indexed = True
+        return False
+
+
+    def _index_body(self, url, job_advert_dict):
+        if not self.storage.summaries_include_bodies:
+            self.search_index.add(url, job_advert_dict)
+        self.minhash_index.add(url, job_advert_dict)
+        self.relevance_index.add(url, job_advert_dict)
+
+
+    # Job adverts #############################################################
+
+    def get_job_advert(self, url):
+        return self.storage.get_job_advert(url)
+
+
+    def has_job_advert(self, url):
+        return self.storage.has_job_advert(url)
+
+
+    def num_job_adverts(self):
+        return self.storage.num_job_adverts()
+
+
+    def iter_job_adverts(self, first_date=None, last_date=None, category_set=None, field_list=storage.JOB_ADVERT_FIELDS):
+        """
+        Iterate over the (url, job_advert_dict) items matching the given
+        predicates (see Storage.query_job_adverts()).
+        """
+
+        return self.storage.query_job_adverts(first_date, last_date, category_set, field_list)
+
+
+    @tracing.traced()
+    def get_stats_counters(self):
+        """
+        Return the stats_engine.StatsCounters of the database. It is built
+        with one pass over the database at the first call, then updated on
+        each change (the stats_changed_callbacks are called).
+        """
+
+        if self.stats_counters is None:
+            job_search_iterable = ((url, self.storage.get_job_search_statuses(url)) for url in self.storage.iter_job_search_urls())
+            self.stats_counters = stats_engine.StatsCounters(self.storage.count_job_adverts(), job_search_iterable)
+        return self.stats_counters
+
+
+    def _stats_changed(self):
+        for callback in self.stats_changed_callbacks:
+            callback()
+
+
+    @tracing.traced()
+    def set_job_advert(self, url, job_advert_dict):
+        """
+        Add or replace a job advert in the database (the tree model and the
+        indexes are updated too).
+        """
+
+        # Converted once: the JSON backend and the tree model share it
+        job_advert = job_advert_record.from_dict(job_advert_dict)
+
+        self.storage.set_job_advert(url, job_advert)
+        self._set_row(url, job_advert)
+
+
+    def _set_row(self, url, job_advert_dict):
+        # The summary of the previous version of the job advert (if any)
+        previous_summary_dict = self.tree_model.rows.get(url)
+
+        if previous_summary_dict is not None:
+            self.tree_model.update(url, self._row_summary(job_advert_dict))
+        else:
+            self.url_index.add(url)
+            self.tree_model.append(url, self._row_summary(job_advert_dict))
+
+        if self.stats_counters is not None:
+            self.stats_counters.job_advert_changed(previous_summary_dict, job_advert_dict)
+            self._stats_changed()
+
+        self.search_index.add(url, job_advert_dict)
+        self.minhash_index.add(url, job_advert_dict)
+        self.relevance_index.add(url, job_advert_dict)
+
+        if self.relevance_query_vector is not None:
+            self.tree_model.set_relevance_score(url, relevance.score(job_advert_dict, self.relevance_query_vector))
+
+
+    def find_duplicate_url(self, url):
+        """
+        Return the url of the job advert of the database equivalent to url (up
+        to tracking parameters and such, see duplicates.canonical_url()) or
+        None.
+        """
+
+        return self.url_index.find(url)
+
+
+    def find_similar_job_adverts(self, job_advert_dict, excluded_url=None):
+        """
+        Return the [(estimated similarity, url), ...] list of the job adverts
+        whose title and description are close to the ones of job_advert_dict
+        (most similar first).
+
+        The bodies are indexed in the background after the loading: the
+        result may be incomplete until then.
+        """
+
+        return self.minhash_index.find_similar(job_advert_dict, excluded_url)
+
+
+    def search(self, query):
+        """
+        Return the set of urls of the job adverts matching query (see the
+        search_index module) or None if the query is empty.
+        """
+
+        return self.search_index.search(query)
+
+
+    def _relevance_query_vector(self, keywords=None, reference_url=None):
+        if reference_url is not None:
+            return self.relevance_index.query_vector(job_advert_dict=self.storage.get_job_advert(reference_url))
+        return self.relevance_index.query_vector(keywords)
+
+
+    @tracing.traced()
+    def rank_job_adverts(self, keywords=None, reference_url=None):
+        """
+        Fill the relevance column of the tree model with the similarity of
+        each job advert to the keyword profile keywords (a string) or to the
+        job advert reference_url (see the relevance module). Both None clear
+        the column.
+
+        The job adverts added or edited afterwards are scored too (with the
+        IDF of the words at the time of the ranking).
+        """
+
+        if keywords is None and reference_url is None:
+            self.relevance_query_vector = None
+            self.tree_model.set_relevance_scores({})
+            return
+
+        self.relevance_query_vector = self._relevance_query_vector(keywords, reference_url)
+        self.tree_model.set_relevance_scores(self.relevance_index.score_all(self.relevance_query_vector))
+
+
+    def find_relevant_job_adverts(self, keywords=None, reference_url=None, k=relevance.DEFAULT_TOP_K):
+        """
+        Return the [(relevance score, url), ...] list of the k job adverts
+        most similar to keywords or to the job advert reference_url (most
+        similar first, reference_url excluded).
+
+        The bodies are indexed in the background after the loading: the
+        result may be incomplete until then.
+        """
+
+        query_vector = self._relevance_query_vector(keywords, reference_url)
+        return self.relevance_index.top_k(query_vector, k, excluded_url=reference_url)
+
+
+    # Job searchs #############################################################
 
-        # Load the JSON database
-        self.json_database = {"job_adverts": {}, "job_searchs": {}}
-        try:
-            fd = open(self.get_json_filename(), "r")
-            self.json_database = json.load(fd)
-            fd.close()
-        except FileNotFoundError:
-            pass
+    def get_job_search_statuses(self, url):
+        return self.storage.get_job_search_statuses(url)
 
 
-        # Creating the gtk.ListStore model
-        self.liststore = gtk.ListStore(str, str, str, str, int, str, str)
-        for url, job_advert_dict in self.json_database["job_adverts"].items():
-            tooltip = url.replace('&', '&amp;')
-            category = job_advert_dict["category"]
-            organization = job_advert_dict["organization"]
-            score = job_advert_dict["score"]
-            title = job_advert_dict["title"]
-            date = job_advert_dict["date"]
+    def get_job_search_status(self, url, date):
+        return self.storage.get_job_search_status(url, date)
 
-            self.liststore.append([url, tooltip, category, organization, score, date, title])
 
+    def get_last_visit_date(self, url, status_list):
+        """
+        Return the last date (a datetime.date) the web site "url" had one of
+        the statuses of status_list or None.
+        """
 
-    def get_json_filename(self):
-        return os.path.expanduser(JSON_FILENAME)
+        return self._get_visit_index().get_last_visit_date(url, status_list)
 
 
+    def iter_job_searchs(self, first_date=None, last_date=None, url_set=None):
+        """
+        Iterate over the (url, date, status) items of the job search history
+        (see Storage.query_job_searchs()).
+        """
+
+        return self.storage.query_job_searchs(first_date, last_date, url_set)
+
+
+    def _get_visit_index(self):
+        if self.visit_index is None:
+            self.visit_index = visit_index.VisitIndex()
+            for url in self.storage.iter_job_search_urls():
+                self.visit_index.add_web_site(url, self.storage.get_job_search_statuses(url))
+        return self.visit_index
+
+
+    def set_job_search_status(self, url, date, status):
+        """
+        Set the status of the web site "url" for the day "date" (ISO format).
+        """
+
+        if self.visit_index is not None or self.stats_counters is not None:
+            previous_status = self.storage.get_job_search_status(url, date)
+
+            if self.visit_index is not None:
+                self.visit_index.set_status(url, date, status, previous_status)
+
+            if self.stats_counters is not None:
+                self.stats_counters.job_search_status_changed(date, previous_status, status)
+                self._stats_changed()
+
+        self.storage.set_job_search_status(url, date, status)
+
+
+    # Link check #############################################################
+
+    def get_link_status(self, url):
+        """
+        Return the status dict of the last check of "url" (None if it has
+        never been checked).
+        """
+
+        return self.link_statuses.get(url)
+
+
+    def check_links(self, url_list, done_callback=None, **options):
+        """
+        Check the urls of url_list on a worker thread (see the link_checker
+        module). The statuses are applied to the model (and the views) while
+        the urls are checked, and saved at the end.
+
+        done_callback is called (from the GTK main loop) with the
+        {url: status dict} dict of the results. options are passed to
+        link_checker.check_urls().
+        """
+
+        previous_statuses = {url: self.link_statuses[url] for url in url_list if url in self.link_statuses}
+
+        thread = threading.Thread(target=self._check_links_thread,
+                                  args=(url_list, previous_statuses, done_callback, options),
+                                  daemon=True)
+        thread.start()
+
+
+    def _check_links_thread(self, url_list, previous_statuses, done_callback, options):
+        status_dicts = link_checker.check_urls(url_list, previous_statuses, self._link_checked_cb, **options)
+        link_checker.save_link_statuses(status_dicts)
+        glib.idle_add(self._check_links_done, status_dicts, done_callback)
+
+
+    def _link_checked_cb(self, url, status_dict):
+        # Called from the link checker thread: the statuses are applied in
+        # batches by an idle callback
+        with self.pending_link_statuses_lock:
+            if len(self.pending_link_statuses) == 0:
+                glib.idle_add(self._apply_link_statuses)
+            self.pending_link_statuses.append((url, status_dict))
+
+
+    @tracing.traced()
+    def _apply_link_statuses(self):
+        with self.pending_link_statuses_lock:
+            status_list = self.pending_link_statuses
+            self.pending_link_statuses = []
+
+        if len(status_list) == 0:
+            return False
+
+        for url, status_dict in status_list:
+            self.link_statuses[url] = status_dict
+            self.tree_model.link_status_changed(url)
+
+        url_set = {url for url, status_dict in status_list}
+        for callback in self.link_status_changed_callbacks:
+            callback(url_set)
+
+        return False
+
+
+    def _check_links_done(self, status_dicts, done_callback):
+        self._apply_link_statuses()       # In case the last batch is still pending
+
+        if done_callback is not None:
+            done_callback(status_dicts)
+
+        return False
+
+
+    # Pages of the job adverts ###############################################
+
+    def _get_page_cache(self):
+        if self.page_cache is None:
+            self.page_cache = page_cache.PageCache()
+        return self.page_cache
+
+
+    def fetch_page(self, url, callback):
+        """
+        Download the page of the job advert "url" on a worker thread and keep
+        a copy of it (see the page_cache module).
+
+        callback is called from the GTK main loop with (url, text, error
+        message): text is the visible text of the page or None if the page
+        can't be downloaded.
+        """
+
+        if self.page_fetcher is None:
+            self.page_fetcher = page_cache.PageFetcher(self._get_page_cache())
+
+        self.page_fetcher.fetch(url, lambda *args: glib.idle_add(callback, *args))
+
+
+    def has_saved_page(self, url):
+        return self._get_page_cache().has_page(url)
+
+
+    @tracing.traced()
+    def open_saved_page(self, url):
+        """
+        Open the copy of the page of the job advert "url" in the web browser.
+        Return False if there is no copy.
+        """
+
+        import webbrowser           # Imported at the first use (faster startup)
+
+        path = self._get_page_cache().write_view_file(url)
+        if path is None:
+            return False
+
+        webbrowser.open("file://" + path)
+        return True
+
+
+    # Changes made by the other processes ####################################
+
+    def watch(self):
+        """
+        Monitor the database files (to be called once the database is
+        loaded): the changes made by other processes (e.g. the jobmanager
+        command or another instance of the application) are applied to the
+        tree model and to the indexes.
+        """
+
+        for path in self.storage.watched_paths():
+            file_monitor = gio.File.new_for_path(path).monitor_file(gio.FileMonitorFlags.NONE, None)
+            file_monitor.connect("changed", self._file_changed_cb)
+            self.file_monitors.append(file_monitor)     # The monitor is stopped if it is garbage collected
+
+
+    def _file_changed_cb(self, file_monitor, changed_file, other_file, event_type):
+        if event_type == gio.FileMonitorEvent.ATTRIBUTE_CHANGED:
+            return
+
+        # Our own writes are notified too: they are cheap to refresh (nothing
+        # new is read)
+        if self.refresh_timeout_id is None:
+            self.refresh_timeout_id = glib.timeout_add(REFRESH_DELAY, self._refresh_timeout_cb)
+
+
+    def _refresh_timeout_cb(self):
+        self.refresh_timeout_id = None
+        self.refresh()
+        return False
+
+
+    def refresh(self):
+        """
+        Read the changes made by the other processes and apply them (without
+        blocking the GTK main loop).
+        """
+
+        if self.refreshing:
+            self.refresh_requested = True
+            return
+
+        self.refreshing = True
+
+        if self.storage.refresh_in_background:
+            threading.Thread(target=self._refresh_thread, daemon=True).start()
+        else:
+            self._apply_changes(self.storage.refresh())
+
+
+    def _refresh_thread(self):
+        changes = self.storage.refresh()
+        glib.idle_add(self._apply_changes, changes)
+
+
+    @tracing.traced()
+    def _apply_changes(self, changes):
+        job_advert_url_set, job_search_url_set = changes
+
+        # Job search history
+        if job_search_url_set is None or len(job_search_url_set) > 0:
+            if self.visit_index is not None:
+                url_iterable = self.storage.iter_job_search_urls() if job_search_url_set is None else job_search_url_set
+                for url in url_iterable:
+                    self.visit_index.add_web_site(url, self.storage.get_job_search_statuses(url))
+
+            if self.stats_counters is not None:
+                self.stats_counters.reset_visits((url, self.storage.get_job_search_statuses(url)) for url in self.storage.iter_job_search_urls())
+                self._stats_changed()
+
+            for callback in self.job_search_changed_callbacks:
+                callback(job_search_url_set)
+
+        # Job adverts (compared with the rows of the tree model in small steps)
+        if job_advert_url_set is None:
+            job_advert_iterator = self.storage.iter_job_advert_summaries()
+        else:
+            job_advert_iterator = ((url, None) for url in job_advert_url_set)
+
+        glib.idle_add(self._apply_job_advert_changes_step, job_advert_iterator)
+
+        return False
+
+
+    @tracing.traced()
+    def _apply_job_advert_changes_step(self, job_advert_iterator):
+        deadline = time.monotonic() + LOAD_STEP_DURATION
+
+        for url, summary_dict in job_advert_iterator:
+            if summary_dict is not None:
+                row_summary_dict = self.tree_model.rows.get(url)
+                if row_summary_dict is not None and all(row_summary_dict[field] == summary_dict[field] for field in storage.SUMMARY_FIELDS):
+                    continue    # Unchanged (the bodies are not compared)
+
+            self._set_row(url, self.storage.get_job_advert(url))
+
+            if time.monotonic() > deadline:
+                return True
+
+        self.refreshing = False
+        if self.refresh_requested:
+            self.refresh_requested = False
+            self.refresh()
+
+        return False
+
+
+    ###########################################################################
+
+    @tracing.traced()
     def save_json_file(self):
-        # Save the JSON file
-        with open(self.get_json_filename(), "w") as fd:
-            json.dump(self.json_database, fd, sort_keys=True, indent=4)
+        """
+        Make sure the last changes will be written on the disk (with the JSON
+        backend, the file is written later on a worker thread).
+        """
+
+        self.storage.save()
+
+
+    def get_save_stats(self):
+        """
+        Return the save latency and queue depth of the save scheduler.
+        """
+
+        return self.storage.get_save_stats()
+
+
+    @tracing.traced()
+    def close(self):
+        """
+        Write the pending changes and close the database (to be called when
+        the application is closed).
+        """
+
+        for file_monitor in self.file_monitors:
+            file_monitor.cancel()
+
+        # The pages being downloaded are still saved (but the queued ones are
+        # dropped)
+        if self.page_fetcher is not None:
+            self.page_fetcher.close(cancel_pending=True)
+
+        self.storage.close()
 
+        # The signatures of the job adverts not indexed yet are kept
+        self.signature_cache.save(keep_unused=not self.bodies_indexed)
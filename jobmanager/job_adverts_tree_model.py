@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+A Gtk.TreeModel reading the job adverts directly from the summaries of the
+database.
+
+The rows are not copied in a Gtk.ListStore: each value is read from the
+summary of the job advert (a job_advert_record.JobAdvert) when the view
+asks for it (and the tooltip is computed on the fly). With the JSON
+backends, these summaries are the job adverts of the storage itself so each
+job advert is held only once in memory.
+
+The relevance column is read from the scores of the last ranking (see the
+relevance module) and the link column is read from the status dicts of the last link checks
+(see the link_checker module).
+
+Rows are only appended (job adverts are never removed from the database),
+so the row index of a job advert never changes and is used as the tree iter.
+"""
+
+from gi.repository import GObject as gobject
+from gi.repository import Gtk as gtk
+
+import link_checker
+
+# (name, type) of the columns (same layout as the former Gtk.ListStore)
+COLUMN_LIST = [("url", str),
+               ("tooltip", str),
+               ("category", str),
+               ("organization", str),
+               ("score", int),
+               ("date", str),
+               ("title", str),
+               ("link", str),
+               ("relevance", float)]
+
+URL_COLUMN = 0
+TOOLTIP_COLUMN = 1
+LINK_COLUMN = 7
+RELEVANCE_COLUMN = 8
+
+ITER_STAMP = 0x4a4f42      # Any constant is fine: iters persist
+
+
+class JobAdvertsTreeModel(gobject.GObject, gtk.TreeModel):
+
+    def __init__(self, link_statuses=None):
+        """
+        link_statuses is the {url: status dict} dict of the link checks (it
+        is shared with the caller: call link_status_changed() when it is
+        changed).
+        """
+
+        super(JobAdvertsTreeModel, self).__init__()
+
+        self.urls = []           # The url of each row
+        self.rows = {}           # {url: summary mapping}
+        self.row_indexes = {}    # {url: row index}
+
+        self.link_statuses = {} if link_statuses is None else link_statuses
+
+        self.relevance_scores = {}      # {url: relevance score} (0 if missing)
+
+
+    def has_row(self, url):
+        return url in self.row_indexes
+
+
+    def get_url(self, treeiter):
+        """
+        Return the url of the row of treeiter (faster than get_value(), which
+        goes through the do_get_value() virtual method).
+        """
+
+        return self.urls[self._get_index(treeiter)]
+
+
+    def append(self, url, summary_dict):
+        """
+        Add a row for the job advert "url" (summary_dict is a mapping
+        containing at least the keys listed in storage.SUMMARY_FIELDS).
+        """
+
+        index = len(self.urls)
+
+        self.urls.append(url)
+        self.rows[url] = summary_dict
+        self.row_indexes[url] = index
+
+        self.row_inserted(gtk.TreePath(index), self._make_iter(index))
+
+
+    def update(self, url, summary_dict):
+        """
+        Replace the summary of the job advert "url" (the row must exist).
+        """
+
+        index = self.row_indexes[url]
+        self.rows[url] = summary_dict
+
+        self.row_changed(gtk.TreePath(index), self._make_iter(index))
+
+
+    def link_status_changed(self, url):
+        """
+        Redraw the row of the job advert "url" (if any) after a change of its
+        link status.
+        """
+
+        self._redraw_row(url)
+
+
+    def set_relevance_scores(self, relevance_scores):
+        """
+        Replace the {url: relevance score} dict of the relevance column (only
+        the rows whose score changes are redrawn).
+        """
+
+        previous_relevance_scores = self.relevance_scores
+        self.relevance_scores = relevance_scores
+
+        for url in previous_relevance_scores.keys() | relevance_scores.keys():
+            if previous_relevance_scores.get(url) != relevance_scores.get(url):
+                self._redraw_row(url)
+
+
+    def set_relevance_score(self, url, relevance_score):
+        if self.relevance_scores.get(url) != relevance_score:
+            self.relevance_scores[url] = relevance_score
+            self._redraw_row(url)
+
+
+    def _redraw_row(self, url):
+        index = self.row_indexes.get(url)
+        if index is not None:
+            self.row_changed(gtk.TreePath(index), self._make_iter(index))
+
+
+    # The user_data of the iters is the row index + 1 (a null user_data is
+    # read back as None)
+
+    def _make_iter(self, index):
+        treeiter = gtk.TreeIter()
+        treeiter.stamp = ITER_STAMP
+        treeiter.user_data = index + 1
+        return treeiter
+
+
+    def _get_index(self, treeiter):
+        return treeiter.user_data - 1
+
+
+    # Gtk.TreeModel virtual methods ###########################################
+
+    def do_get_flags(self):
+        return gtk.TreeModelFlags.LIST_ONLY | gtk.TreeModelFlags.ITERS_PERSIST
+
+
+    def do_get_n_columns(self):
+        return len(COLUMN_LIST)
+
+
+    def do_get_column_type(self, column):
+        return COLUMN_LIST[column][1]
+
+
+    def do_get_iter(self, path):
+        index = path.get_indices()[0]
+        if index < len(self.urls):
+            return (True, self._make_iter(index))
+        return (False, None)
+
+
+    def do_get_path(self, treeiter):
+        return gtk.TreePath(self._get_index(treeiter))
+
+
+    def do_get_value(self, treeiter, column):
+        url = self.urls[self._get_index(treeiter)]
+
+        if column == URL_COLUMN:
+            return url
+        elif column == TOOLTIP_COLUMN:
+            return url.replace('&', '&amp;')
+        elif column == LINK_COLUMN:
+            return link_checker.describe_status(self.link_statuses.get(url))
+        elif column == RELEVANCE_COLUMN:
+            return self.relevance_scores.get(url, 0.)
+        else:
+            return self.rows[url][COLUMN_LIST[column][0]]
+
+
+    def do_iter_next(self, treeiter):
+        index = self._get_index(treeiter) + 1
+        if index < len(self.urls):
+            treeiter.user_data = index + 1
+            return True
+        treeiter.stamp = 0
+        return False
+
+
+    def do_iter_children(self, parent):
+        if parent is None and len(self.urls) > 0:
+            return (True, self._make_iter(0))
+        return (False, None)
+
+
+    def do_iter_has_child(self, treeiter):
+        return False
+
+
+    def do_iter_n_children(self, treeiter):
+        if treeiter is None:
+            return len(self.urls)
+        return 0
+
+
+    def do_iter_nth_child(self, parent, n):
+        if parent is None and n < len(self.urls):
+            return (True, self._make_iter(n))
+        return (False, None)
+
+
+    def do_iter_parent(self, child):
+        return (False, None)
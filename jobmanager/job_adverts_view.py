@@ -23,21 +23,35 @@
 from gi.repository import Gtk as gtk
 from gi.repository import Pango as pango
 
-import webbrowser
+import tracing
 
-TREE_VIEW_COLUMN_LABEL_LIST = ["Url", "Tooltip", "Category", "Organization", "Score", "Date", "Title"]
+
+TREE_VIEW_COLUMN_LABEL_LIST = ["Url", "Tooltip", "Category", "Organization", "Score", "Date", "Title", "Link", "Relevance"]
+
+RELEVANCE_COLUMN = 8
 
 class JobAdvertsView(gtk.TreeView):
 
-    def __init__(self, liststore, edit_container):
+    def __init__(self, tree_model, edit_container, search_index=None):
         """
-        ...
+        The rows are filtered with search_index (see set_filter_query()).
         """
 
-        super(JobAdvertsView, self).__init__(liststore)
+        super(JobAdvertsView, self).__init__()
 
         self.edit_container = edit_container
 
+        self.tree_model = tree_model
+        self.search_index = search_index
+        self.filter_query = ""
+        self.filter_url_set = None        # None = no filter
+        self.filter_version = None        # Version of search_index used to compute filter_url_set
+
+        # tree model -> filter model -> sort model -> tree view
+        self.filter_model = None
+        self.sort_model = None
+        self._set_models()
+
         # Creating the treeview, making it use the filter as a model, and
         # adding the columns
         for column_index, column_title in enumerate(TREE_VIEW_COLUMN_LABEL_LIST):
@@ -64,6 +78,11 @@ class JobAdvertsView(gtk.TreeView):
                 column.set_sort_column_id(5)
             elif column_title == "Title":
                 column.set_sort_column_id(6)
+            elif column_title == "Link":
+                column.set_sort_column_id(7)
+            elif column_title == "Relevance":
+                column.set_sort_column_id(RELEVANCE_COLUMN)
+                column.set_cell_data_func(renderer, relevance_cell_data_func)
 
             self.append_column(column)
 
@@ -77,12 +96,95 @@ class JobAdvertsView(gtk.TreeView):
         self.connect("row-activated", treeview_double_click_cb)
 
 
+    @tracing.traced()
     def treeViewSelectionChangedCallBack(self, selection):
         self.edit_container.clearCallBack()
 
 
+    def sort_by_relevance(self):
+        """
+        Display the most relevant job adverts first (see
+        JobAdvertsModel.rank_job_adverts()).
+        """
+
+        self.sort_model.set_sort_column_id(RELEVANCE_COLUMN, gtk.SortType.DESCENDING)
+
+
+    def get_selected_url(self):
+        model, treeiter = self.get_selection().get_selected()
+        if treeiter is None:
+            return None
+        return model[treeiter][0]
+
+
+    def _set_models(self):
+        """
+        Display the tree model through new filter and sort models (keeping
+        the sort order).
+        """
+
+        sort_column_id = self.sort_model.get_sort_column_id() if self.sort_model is not None else (None, None)
+
+        self.filter_model = self.tree_model.filter_new()
+        self.filter_model.set_visible_func(self.filter_visible_func)
+
+        self.sort_model = gtk.TreeModelSort(model=self.filter_model)
+        if sort_column_id[0] is not None:
+            self.sort_model.set_sort_column_id(*sort_column_id)
+
+        self.set_model(self.sort_model)
+
+
+    @tracing.traced()
+    def set_filter_query(self, query):
+        """
+        Only display the job adverts matching query (see the search_index
+        module).
+        """
+
+        if query == self.filter_query:
+            return
+
+        self.filter_query = query
+        self.filter_version = None
+
+        # refilter() emits a row-deleted or row-inserted signal for each row
+        # that is hidden or shown (handled by the sort model and the view):
+        # new models only evaluate the visible func once per row
+        self._set_models()
+
+
+    @tracing.traced()
+    def search_changed_cb(self, search_entry):
+        self.set_filter_query(search_entry.get_text())
+
+
+    def filter_visible_func(self, model, treeiter, data):
+        if self.search_index is None:
+            return True
+
+        # Search again when the index has been updated (e.g. a job advert has
+        # been added or edited)
+        if self.filter_version != self.search_index.version:
+            self.filter_url_set = self.search_index.search(self.filter_query)
+            self.filter_version = self.search_index.version
+
+        if self.filter_url_set is None:
+            return True
+
+        return self.tree_model.get_url(treeiter) in self.filter_url_set
+
+
+def relevance_cell_data_func(column, renderer, model, treeiter, data):
+    relevance_score = model.get_value(treeiter, RELEVANCE_COLUMN)
+    renderer.set_property("text", "{:.0%}".format(relevance_score) if relevance_score > 0. else "")
+
+
+@tracing.traced()
 def treeview_double_click_cb(tree_view, tree_path, tree_view_column):
     """Inspired from http://stackoverflow.com/questions/17109634/hyperlink-in-cellrenderertext-markup"""
+    import webbrowser           # Imported at the first use (faster startup)
+
     model = tree_view.get_model()
     url = model[tree_path][0]
     webbrowser.open(url)
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Compact encoding of the job search history of the web sites.
+
+The history of a web site used to be a {"YYYY-MM-DD": status} dict with one
+entry per day. A JobSearchHistory stores one byte per day instead, from the
+first day of the history: 0 for the days without status, then the code of
+the status (its index in the statuses tuple + 1). It is written in the JSON
+file as its first day and a string of one character per day:
+
+    ["2015-01-01", "FFP.N.F"]
+
+(with the list of the statuses as third item if the history uses other
+statuses than STATUS_LIST).
+
+JobSearchHistory is a MutableMapping with the keys and values of the former
+dicts: the code reading or writing statuses works unchanged and the
+histories written in the former format are converted when they are read.
+The former histories with invalid dates are kept as dicts (their valid items
+are still counted, see ordinal_items()).
+"""
+
+import collections.abc
+import logging
+
+import job_advert_record
+
+# The statuses set in the Search tab
+STATUS_LIST = ("Full", "Partial", "None")
+
+# The character of each code in the JSON file (".": no status)
+CODE_CHARS = ".FPN" + "abcdefghijklmnopqrstuvwxyz"
+
+MAX_NUM_STATUSES = len(CODE_CHARS) - 1
+
+_ENCODE_TABLE = bytes.maketrans(bytes(range(len(CODE_CHARS))), CODE_CHARS.encode("ascii"))
+_DECODE_TABLE = bytes.maketrans(CODE_CHARS.encode("ascii"), bytes(range(len(CODE_CHARS))))
+
+logger = logging.getLogger(__name__)
+
+
+class JobSearchHistory(collections.abc.MutableMapping):
+
+    __slots__ = ("start_ordinal", "codes", "statuses")
+
+    def __init__(self, start_ordinal=None, codes=None, statuses=STATUS_LIST):
+        self.start_ordinal = start_ordinal     # The ordinal date of codes[0] (None if empty)
+        self.codes = bytearray() if codes is None else codes
+        self.statuses = statuses               # The status of each code - 1
+
+
+    def _index(self, date_iso_str):
+        # Return the index of date_iso_str in self.codes (raise KeyError if
+        # it has no status)
+        try:
+            index = job_advert_record.date_to_ordinal(date_iso_str) - self.start_ordinal
+        except (TypeError, ValueError):
+            raise KeyError(date_iso_str) from None
+
+        if not 0 <= index < len(self.codes) or self.codes[index] == 0:
+            raise KeyError(date_iso_str)
+
+        return index
+
+
+    def __getitem__(self, date_iso_str):
+        return self.statuses[self.codes[self._index(date_iso_str)] - 1]
+
+
+    def __setitem__(self, date_iso_str, status):
+        """
+        Raise ValueError if date_iso_str is not a "YYYY-MM-DD" date or if the
+        history already has MAX_NUM_STATUSES statuses.
+        """
+
+        ordinal = job_advert_record.date_to_ordinal(date_iso_str)
+
+        try:
+            code = self.statuses.index(status) + 1
+        except ValueError:
+            if len(self.statuses) >= MAX_NUM_STATUSES:
+                raise ValueError("Too many statuses")
+            self.statuses = self.statuses + (status,)
+            code = len(self.statuses)
+
+        if self.start_ordinal is None:
+            self.start_ordinal = ordinal
+        elif ordinal < self.start_ordinal:
+            self.codes[0:0] = bytes(self.start_ordinal - ordinal)
+            self.start_ordinal = ordinal
+
+        index = ordinal - self.start_ordinal
+        if index >= len(self.codes):
+            self.codes.extend(bytes(index - len(self.codes) + 1))
+
+        self.codes[index] = code
+
+
+    def __delitem__(self, date_iso_str):
+        self.codes[self._index(date_iso_str)] = 0
+
+
+    def __iter__(self):
+        for ordinal, status in self.ordinal_items():
+            yield job_advert_record.ordinal_to_date(ordinal)
+
+
+    def __len__(self):
+        return len(self.codes) - self.codes.count(0)
+
+
+    def items(self):
+        """
+        Return the list of the (date, status) items sorted by date (faster
+        than the default ItemsView).
+        """
+
+        return [(job_advert_record.ordinal_to_date(ordinal), status) for ordinal, status in self.ordinal_items()]
+
+
+    def ordinal_items(self):
+        """
+        Iterate over the (ordinal date, status) items sorted by date.
+        """
+
+        statuses = self.statuses
+        start_ordinal = self.start_ordinal
+        for index, code in enumerate(self.codes):
+            if code != 0:
+                yield start_ordinal + index, statuses[code - 1]
+
+
+    def copy(self):
+        return JobSearchHistory(self.start_ordinal, bytearray(self.codes), self.statuses)
+
+
+    def __repr__(self):
+        return "JobSearchHistory({!r})".format(dict(self.items()))
+
+
+    def to_json(self):
+        if self.start_ordinal is None:
+            return []
+
+        json_value = [job_advert_record.ordinal_to_date(self.start_ordinal), self.codes.translate(_ENCODE_TABLE).decode("ascii")]
+        if self.statuses != STATUS_LIST:
+            json_value.append(list(self.statuses))
+        return json_value
+
+
+def from_json(json_value):
+    """
+    Return the JobSearchHistory encoded by json_value (see
+    JobSearchHistory.to_json()) or equivalent to the {date: status} dict
+    json_value (former format).
+
+    Dicts that can't be encoded (e.g. with invalid dates) and
+    JobSearchHistories are returned as is. Invalid encoded values (e.g. a
+    corrupted first day) are replaced by an empty history.
+    """
+
+    if isinstance(json_value, JobSearchHistory):
+        return json_value
+
+    if isinstance(json_value, dict):
+        return _from_status_dict(json_value)
+
+    try:
+        if len(json_value) == 0:
+            return JobSearchHistory()
+
+        statuses = tuple(json_value[2]) if len(json_value) > 2 else STATUS_LIST
+        codes = bytearray(json_value[1].encode("ascii").translate(_DECODE_TABLE))
+        if max(codes, default=0) > len(statuses):
+            raise ValueError("Unknown status code")
+
+        return JobSearchHistory(job_advert_record.date_to_ordinal(json_value[0]), codes, statuses)
+    except (AttributeError, IndexError, TypeError, ValueError) as e:
+        logger.warning("Invalid job search history %.80r (%s): it is ignored", json_value, e)
+        return JobSearchHistory()
+
+
+def _from_status_dict(status_dict):
+    history = JobSearchHistory()
+
+    try:
+        ordinal_item_list = sorted((job_advert_record.date_to_ordinal(date_iso_str), status) for date_iso_str, status in status_dict.items())
+        if len(ordinal_item_list) > 0:
+            history.start_ordinal = ordinal_item_list[0][0]
+            history.codes = bytearray(ordinal_item_list[-1][0] - history.start_ordinal + 1)
+        for ordinal, status in ordinal_item_list:
+            history[job_advert_record.ordinal_to_date(ordinal)] = status
+    except (TypeError, ValueError):
+        return status_dict
+
+    return history
+
+
+def ordinal_items(status_mapping):
+    """
+    Iterate over the (ordinal date, status) items of the JobSearchHistory or
+    {date: status} dict status_mapping (the invalid dates of the dicts are
+    skipped).
+    """
+
+    if isinstance(status_mapping, JobSearchHistory):
+        return status_mapping.ordinal_items()
+
+    return _dict_ordinal_items(status_mapping)
+
+
+def _dict_ordinal_items(status_dict):
+    for date_iso_str, status in status_dict.items():
+        try:
+            yield job_advert_record.date_to_ordinal(date_iso_str), status
+        except (TypeError, ValueError):
+            pass
+
+
+def set_status(job_search_dict, url, date_iso_str, status):
+    """
+    Set the status of the web site "url" for the day date_iso_str in the
+    {url: history} dict job_search_dict.
+
+    The histories that can't be encoded (invalid dates, ...) are converted
+    back to {date: status} dicts.
+    """
+
+    history = job_search_dict.get(url)
+    if history is None:
+        history = job_search_dict[url] = JobSearchHistory()
+
+    try:
+        history[date_iso_str] = status
+    except (TypeError, ValueError):
+        status_dict = job_search_dict[url] = dict(history.items())
+        status_dict[date_iso_str] = status
+
+
+def to_json(value):
+    """
+    The "default" function of json.dump() for the databases containing
+    JobSearchHistories (and JobAdverts).
+    """
+
+    if isinstance(value, JobSearchHistory):
+        return value.to_json()
+    return job_advert_record.to_json(value)
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Append-only journal of the changes made to the JSON database.
+
+Each mutation is written as one JSON object per line in a file next to the
+main JSON database (e.g. "~/job_adverts.json.journal").
+The journal is replayed when the database is loaded and it is emptied each
+time the whole database is written back to the main JSON file (compaction).
+
+Several processes can share the database (e.g. the GUI and the jobmanager
+command): they append their changes to the same journal (under the
+exclusive lock of the database, see the file_lock module) and read the
+records appended by the others to stay up to date.
+
+The first line of the journal gives the generation of the JSON file it
+applies to. The generation is incremented at each compaction: a process
+whose journal file has a different generation knows that another process has
+rewritten the JSON file and that it must be read again.
+
+The JSON file is dumped without the lock (the other processes can read and
+write the database meanwhile). The records appended during the dump are then
+written to a pending journal file for the new generation (e.g.
+"~/job_adverts.json.journal.pending"), which replaces the journal file once
+the new JSON file has been renamed: if the process is interrupted between
+the two renames, the pending file is replayed instead of the stale journal.
+
+Record format:
+
+    {"op": "base", "generation": 12}
+    {"op": "set_job_advert", "url": "...", "job_advert": {...}}
+    {"op": "set_job_search_status", "url": "...", "date": "YYYY-MM-DD", "status": "..."}
+"""
+
+import json
+import os
+
+import job_advert_record
+import job_search_history
+
+JOURNAL_SUFFIX = ".journal"
+ROTATED_JOURNAL_SUFFIX = ".old"     # Written by the previous versions of the application
+PENDING_JOURNAL_SUFFIX = ".pending"
+
+BASE = "base"
+SET_JOB_ADVERT = "set_job_advert"
+SET_JOB_SEARCH_STATUS = "set_job_search_status"
+
+
+def apply_record(json_database, record):
+    """
+    Apply one journal record to the given database (in place).
+    """
+
+    op = record["op"]
+
+    if op == SET_JOB_ADVERT:
+        json_database["job_adverts"][record["url"]] = job_advert_record.from_dict(record["job_advert"])
+    elif op == SET_JOB_SEARCH_STATUS:
+        job_search_history.set_status(json_database["job_searchs"], record["url"], record["date"], record["status"])
+    elif op == BASE:
+        pass
+    else:
+        raise ValueError("Unknown journal operation: {}".format(op))
+
+
+def _read_file(path, start_offset=0):
+    """
+    Return (generation, record_list, end_offset) where generation is given by
+    the header of the journal file "path" (None if it has no header),
+    record_list contains the records written after start_offset and
+    end_offset is the end of the last complete record.
+
+    A truncated last line (e.g. if a process crashed while writing it) is
+    ignored. Raise FileNotFoundError if the file doesn't exist.
+    """
+
+    with open(path, "rb") as fd:
+        generation = None
+        header_size = 0
+
+        first_line = fd.readline()
+        if first_line.endswith(b"\n") and len(first_line.strip()) > 0:
+            first_record = json.loads(first_line.decode("utf-8"))
+            if first_record["op"] == BASE:
+                generation = first_record["generation"]
+                header_size = len(first_line)
+
+        offset = max(start_offset, header_size)
+        fd.seek(offset)
+
+        record_list = []
+        for line in fd:
+            if not line.endswith(b"\n"):
+                break                     # Truncated record
+            if len(line.strip()) > 0:
+                record_list.append(json.loads(line.decode("utf-8")))
+            offset += len(line)
+
+    return generation, record_list, offset
+
+
+def _read_generation(path):
+    # Return the generation given by the header of the journal file "path"
+    # (None if it has no header or doesn't exist)
+    try:
+        with open(path, "rb") as fd:
+            first_line = fd.readline()
+    except FileNotFoundError:
+        return None
+
+    if first_line.endswith(b"\n") and len(first_line.strip()) > 0:
+        first_record = json.loads(first_line.decode("utf-8"))
+        if first_record["op"] == BASE:
+            return first_record["generation"]
+    return None
+
+
+def _write_file(path, generation, record_list):
+    # Write a journal file (via a temporary file + fsync + rename)
+    lines = [json.dumps({"op": BASE, "generation": generation}) + "\n"]
+    lines += [json.dumps(record, sort_keys=True, default=job_advert_record.to_json) + "\n" for record in record_list]
+    data = "".join(lines).encode("utf-8")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fd:
+        fd.write(data)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.replace(tmp_path, path)
+
+    return len(data)
+
+
+class Journal(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.rotated_path = path + ROTATED_JOURNAL_SUFFIX
+        self.pending_path = path + PENDING_JOURNAL_SUFFIX
+        self.num_records = 0      # Number of records in the journal files
+        self.generation = None    # Generation of the JSON file the database has been read from
+        self.offset = None        # Size of the part of the journal file already applied (None before replay())
+        self.stale = False        # The journal file belongs to an older generation (it will be replaced)
+
+
+    def __len__(self):
+        return self.num_records
+
+
+    def replay(self, json_database, generation):
+        """
+        Apply all the records of the journal files to json_database (in place).
+
+        generation is the generation of the JSON file json_database has been
+        read from: a journal written for an older generation is ignored (a
+        process has been interrupted during a compaction: its records are
+        already in the JSON file).
+        """
+
+        self.num_records = 0
+        self.generation = generation
+        self.offset = 0
+        self.stale = False
+
+        # The pending file only matches the generation if a compaction has
+        # been interrupted after the JSON file was renamed: the journal file
+        # is then stale
+        for path in (self.rotated_path, self.pending_path, self.path):
+            try:
+                file_generation, record_list, end_offset = _read_file(path)
+            except FileNotFoundError:
+                continue
+
+            if file_generation is not None and file_generation != generation:
+                if path == self.path:
+                    self.stale = True
+                continue
+
+            for record in record_list:
+                apply_record(json_database, record)
+            self.num_records += len(record_list)
+
+            # The pending file becomes the journal file (same offsets)
+            if path != self.rotated_path:
+                self.offset = end_offset
+
+
+    def read_new_records(self):
+        """
+        Return the list of the records appended (by other processes) since
+        the last call, or None if the journal file has been replaced by
+        another process (the JSON file has been rewritten and must be read
+        again).
+        """
+
+        if self.stale:
+            if _read_generation(self.path) != self.generation:
+                return []         # Replaced at the next append
+            self.stale = False    # Replaced by another process
+
+        try:
+            file_generation, record_list, end_offset = _read_file(self.path, self.offset)
+        except FileNotFoundError:
+            return [] if self.offset == 0 else None
+
+        if file_generation is not None and file_generation < self.generation:
+            return []             # Stale journal file (replaced at the next append)
+
+        if (file_generation is not None and file_generation != self.generation) or end_offset < self.offset:
+            return None
+
+        self.offset = end_offset
+        self.num_records += len(record_list)
+
+        return record_list
+
+
+    def append(self, record):
+        """
+        Append one record at the end of the journal file (to be called with
+        the exclusive lock of the database).
+        """
+
+        if self.stale:
+            self.replace_stale_file()
+
+        line = (json.dumps(record, sort_keys=True, default=job_advert_record.to_json) + "\n").encode("utf-8")
+
+        with open(self.path, "ab+") as fd:
+            size = fd.seek(0, os.SEEK_END)
+
+            # Remove the truncated record left by a process that crashed while
+            # writing it
+            if size > 0:
+                fd.seek(size - 1)
+                if fd.read(1) != b"\n":
+                    fd.seek(0)
+                    size = fd.read().rfind(b"\n") + 1
+                    fd.truncate(size)
+
+            if size == 0 and self.generation is not None:
+                header = (json.dumps({"op": BASE, "generation": self.generation}) + "\n").encode("utf-8")
+                fd.write(header)
+                if self.offset == 0:
+                    self.offset = len(header)
+                size = len(header)
+
+            fd.write(line)
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        # Records written by other processes since the last call to
+        # read_new_records() will be read (with this one) at the next call
+        if self.offset == size:
+            self.offset += len(line)
+
+        self.num_records += 1
+
+
+    def replace_stale_file(self):
+        """
+        Replace the journal file left by an older generation (to be called
+        with the exclusive lock of the database) by the pending file of the
+        current generation if there is one, by an empty journal otherwise.
+        """
+
+        # Another process may have replaced it since replay()
+        if _read_generation(self.path) != self.generation:
+            if _read_generation(self.pending_path) == self.generation:
+                os.replace(self.pending_path, self.path)
+            else:
+                self.reset(self.generation)
+
+        self.stale = False
+
+
+    def read_records(self, start_offset):
+        """
+        Return the list of the records of the journal file written after
+        start_offset (to be called with the lock of the database).
+        """
+
+        try:
+            file_generation, record_list, end_offset = _read_file(self.path, start_offset)
+        except FileNotFoundError:
+            return []
+
+        if file_generation is not None and file_generation != self.generation:
+            return []
+
+        return record_list
+
+
+    def write_pending(self, generation, record_list):
+        """
+        Write the records that are not in the new JSON file being saved (for
+        the given generation) in the pending file, to be called with the
+        exclusive lock of the database before the JSON file is renamed.
+        """
+
+        _write_file(self.pending_path, generation, record_list)
+
+
+    def commit_pending(self, generation):
+        """
+        Replace the journal file by the pending file (to be called, with the
+        exclusive lock of the database, once the JSON file for the given
+        generation has been renamed).
+        """
+
+        file_generation, record_list, end_offset = _read_file(self.pending_path)
+        os.replace(self.pending_path, self.path)
+
+        try:
+            os.remove(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+        self.generation = generation
+        self.offset = end_offset
+        self.num_records = len(record_list)
+        self.stale = False
+
+
+    def reset(self, generation):
+        """
+        Replace the journal files by an empty journal for the given
+        generation of the JSON file (to be called, with the exclusive lock of
+        the database, once the JSON file has been written).
+        """
+
+        header_size = _write_file(self.path, generation, [])
+
+        for path in (self.rotated_path, self.pending_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        self.generation = generation
+        self.offset = header_size
+        self.num_records = 0
+        self.stale = False
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Incremental reading of JSON objects.
+
+json.load() parses the whole document in one call. ObjectScanner reads the
+members of a JSON object one by one so that a large database can be loaded
+in small steps (e.g. from GLib idle callbacks) without freezing the GUI.
+"""
+
+import json
+import json.decoder
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+_decoder = json.JSONDecoder()
+
+
+def skip_whitespace(text, idx):
+    return WHITESPACE.match(text, idx).end()
+
+
+class ObjectScanner(object):
+
+    def __init__(self, text, idx=0):
+        """
+        Scan the JSON object starting at text[idx] (leading whitespaces are
+        skipped).
+        """
+
+        self.text = text
+        self.idx = skip_whitespace(text, idx)
+        self.first_member = True
+        self.done = False
+
+        if text[self.idx:self.idx + 1] != "{":
+            raise ValueError("Expecting '{{' at index {}".format(self.idx))
+
+        self.idx += 1
+
+
+    def next_key(self):
+        """
+        Return the key of the next member (the scanner is then positioned on
+        its value) or None at the end of the object.
+        """
+
+        if self.done:
+            return None
+
+        self.idx = skip_whitespace(self.text, self.idx)
+        char = self.text[self.idx:self.idx + 1]
+
+        if char == "}":
+            self.idx += 1
+            self.done = True
+            return None
+
+        if not self.first_member:
+            if char != ",":
+                raise ValueError("Expecting ',' at index {}".format(self.idx))
+            self.idx = skip_whitespace(self.text, self.idx + 1)
+            char = self.text[self.idx:self.idx + 1]
+
+        if char != '"':
+            raise ValueError("Expecting a key at index {}".format(self.idx))
+
+        key, self.idx = json.decoder.scanstring(self.text, self.idx + 1)
+
+        self.idx = skip_whitespace(self.text, self.idx)
+        if self.text[self.idx:self.idx + 1] != ":":
+            raise ValueError("Expecting ':' at index {}".format(self.idx))
+        self.idx += 1
+
+        self.first_member = False
+
+        return key
+
+
+    def read_value(self):
+        """
+        Parse and return the value of the current member.
+        """
+
+        value, self.idx = _decoder.raw_decode(self.text, skip_whitespace(self.text, self.idx))
+        return value
+
+
+    def enter_object(self):
+        """
+        Return a scanner on the value of the current member (which must be an
+        object). Once this sub-scanner is exhausted, call leave_object().
+        """
+
+        return ObjectScanner(self.text, self.idx)
+
+
+    def leave_object(self, sub_scanner):
+        self.idx = sub_scanner.idx
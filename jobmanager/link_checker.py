@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Concurrent check of the urls of the job adverts and of the job search web
+sites (to find the job adverts that have been removed).
+
+The urls are checked with HEAD requests (GET if the server doesn't support
+HEAD) made by asyncio: at most max_connections requests at the same time
+and max_connections_per_host per host, with the connections kept open
+between the requests to the same host. The timeout applies to each request
+(the time spent waiting for a free connection is not counted). The ETag and Last-Modified headers
+of the previous check are sent back (If-None-Match and If-Modified-Since) so
+that unchanged pages are not sent again.
+
+Each check gives a status dict:
+
+    {"state": "alive", "dead" or "error",
+     "http_status": 200,                       (None if no response)
+     "checked": "YYYY-MM-DDTHH:MM:SS",
+     "etag": "...", "last_modified": "...",    (if given by the server)
+     "final_url": "...",                       (if redirected)
+     "error": "..."}                           (if state is "error")
+
+A url is "dead" if the server answers 404 or 410 (after the redirections)
+and "error" if it can't be reached or answers another error: it may be
+temporary.
+
+The statuses are kept in LINK_STATUS_FILENAME.
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import ssl
+import urllib.parse
+
+import save_scheduler
+
+LINK_STATUS_FILENAME = "~/job_adverts_link_statuses.json"
+WEB_SITES_FILENAME = "~/job_adverts_web_sites.json"     # See search_container
+
+ALIVE = "alive"
+DEAD = "dead"
+ERROR = "error"
+
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 2
+DEFAULT_TIMEOUT = 15.                 # Seconds per request
+
+MAX_REDIRECTIONS = 5
+
+REDIRECTION_STATUSES = (301, 302, 303, 307, 308)
+DEAD_STATUSES = (404, 410)
+
+USER_AGENT = "job-advert-manager link checker"
+
+
+def describe_status(status_dict):
+    """
+    Return the text displayed in the link columns of the GUI ("" if the url
+    has not been checked).
+    """
+
+    if status_dict is None:
+        return ""
+    if status_dict["http_status"] is None or status_dict["state"] == ALIVE:
+        return status_dict["state"]
+    return "{} ({})".format(status_dict["state"], status_dict["http_status"])
+
+
+class _Connection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+
+    def close(self):
+        self.writer.close()
+
+
+class _HostPool(object):
+    """
+    The connections to one host (scheme, host, port).
+    """
+
+    def __init__(self, max_connections):
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.idle_connections = []
+
+
+class LinkChecker(object):
+    """
+    To be created and used in a running event loop (see check_urls()).
+    """
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST, timeout=DEFAULT_TIMEOUT):
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+
+        self.host_pools = {}             # {(scheme, host, port): _HostPool}
+        self.ssl_context = None          # Created at the first https url
+
+
+    async def check(self, url, previous_status_dict=None):
+        """
+        Check url and return its status dict. The validators of
+        previous_status_dict (the result of the previous check) are sent in
+        a conditional request.
+        """
+
+        request_headers = {}
+        if previous_status_dict is not None and previous_status_dict.get("final_url") is None:
+            if previous_status_dict.get("etag") is not None:
+                request_headers["If-None-Match"] = previous_status_dict["etag"]
+            if previous_status_dict.get("last_modified") is not None:
+                request_headers["If-Modified-Since"] = previous_status_dict["last_modified"]
+
+        try:
+            status_dict = await self._check(url, request_headers)
+        except asyncio.TimeoutError:
+            status_dict = {"state": ERROR, "http_status": None, "error": "timeout"}
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            status_dict = {"state": ERROR, "http_status": None, "error": str(e) or type(e).__name__}
+
+        status_dict["checked"] = datetime.datetime.now().isoformat(timespec="seconds")
+
+        # A 304 response has no validators: keep the previous ones
+        if status_dict["http_status"] == 304 and previous_status_dict is not None:
+            for name in ("etag", "last_modified"):
+                if previous_status_dict.get(name) is not None:
+                    status_dict.setdefault(name, previous_status_dict[name])
+
+        return status_dict
+
+
+    async def _check(self, url, request_headers):
+        current_url = url
+
+        for redirection_index in range(MAX_REDIRECTIONS + 1):
+            http_status, response_headers = await self._request("HEAD", current_url, request_headers)
+            if http_status in (405, 501):
+                http_status, response_headers = await self._request("GET", current_url, request_headers)
+
+            if http_status not in REDIRECTION_STATUSES or "location" not in response_headers:
+                break
+
+            current_url = urllib.parse.urljoin(current_url, response_headers["location"])
+            request_headers = {}         # The validators are the ones of url
+        else:
+            return {"state": ERROR, "http_status": http_status, "error": "too many redirections", "final_url": current_url}
+
+        if 200 <= http_status < 300 or http_status == 304:
+            state = ALIVE
+        elif http_status in DEAD_STATUSES:
+            state = DEAD
+        else:
+            state = ERROR
+
+        status_dict = {"state": state, "http_status": http_status}
+
+        if current_url != url:
+            status_dict["final_url"] = current_url
+        elif state == ALIVE:
+            if "etag" in response_headers:
+                status_dict["etag"] = response_headers["etag"]
+            if "last-modified" in response_headers:
+                status_dict["last_modified"] = response_headers["last-modified"]
+
+        if state == ERROR:
+            status_dict["error"] = "HTTP status {}".format(http_status)
+
+        return status_dict
+
+
+    async def _request(self, method, url, request_headers):
+        """
+        Return the (HTTP status, {lower case header name: value}) of the
+        response. The body of the GET responses is not read (their
+        connection is closed).
+        """
+
+        url_parts = urllib.parse.urlsplit(url)
+        if url_parts.scheme not in ("http", "https") or not url_parts.hostname:
+            raise ValueError("Unsupported url: {}".format(url))
+
+        default_port = 443 if url_parts.scheme == "https" else 80
+        port = url_parts.port or default_port
+        host_header = url_parts.hostname if port == default_port else "{}:{}".format(url_parts.hostname, port)
+        target = url_parts.path or "/"
+        if url_parts.query:
+            target += "?" + url_parts.query
+
+        key = (url_parts.scheme, url_parts.hostname, port)
+        host_pool = self.host_pools.get(key)
+        if host_pool is None:
+            host_pool = self.host_pools[key] = _HostPool(self.max_connections_per_host)
+
+        keep_alive = (method == "HEAD")
+
+        # The host slot is taken first: a request waiting for its host
+        # doesn't hold one of the max_connections slots
+        async with host_pool.semaphore:
+            async with self.semaphore:
+                return await asyncio.wait_for(self._pooled_request(host_pool, url_parts.scheme, url_parts.hostname, port,
+                                                                   method, target, host_header, request_headers, keep_alive),
+                                              self.timeout)
+
+
+    async def _pooled_request(self, host_pool, scheme, hostname, port, method, target, host_header, request_headers, keep_alive):
+        # To be called with a slot of host_pool
+        if len(host_pool.idle_connections) > 0:
+            connection = host_pool.idle_connections.pop()
+            try:
+                response = await self._exchange(connection, method, target, host_header, request_headers, keep_alive)
+            except (OSError, asyncio.IncompleteReadError):
+                # The server has closed the idle connection: retry with a
+                # new one
+                connection.close()
+                connection = None
+            except:
+                connection.close()
+                raise
+        else:
+            connection = None
+
+        if connection is None:
+            connection = await self._connect(scheme, hostname, port)
+            try:
+                response = await self._exchange(connection, method, target, host_header, request_headers, keep_alive)
+            except:
+                connection.close()    # Including the timeouts (the response may still come)
+                raise
+
+        http_status, response_headers, reusable = response
+
+        if keep_alive and reusable:
+            host_pool.idle_connections.append(connection)
+        else:
+            connection.close()
+
+        return http_status, response_headers
+
+
+    async def _connect(self, scheme, hostname, port):
+        if scheme == "https":
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            reader, writer = await asyncio.open_connection(hostname, port, ssl=self.ssl_context)
+        else:
+            reader, writer = await asyncio.open_connection(hostname, port)
+        return _Connection(reader, writer)
+
+
+    async def _exchange(self, connection, method, target, host_header, request_headers, keep_alive):
+        line_list = ["{} {} HTTP/1.1".format(method, target),
+                     "Host: {}".format(host_header),
+                     "User-Agent: {}".format(USER_AGENT),
+                     "Accept: */*"]
+        line_list += ["{}: {}".format(name, value) for name, value in request_headers.items()]
+        if not keep_alive:
+            line_list.append("Connection: close")
+
+        connection.writer.write(("\r\n".join(line_list) + "\r\n\r\n").encode("latin-1"))
+        await connection.writer.drain()
+
+        while True:
+            status_line = await connection.reader.readline()
+            if len(status_line) == 0:
+                raise ConnectionResetError("Connection closed by the server")
+
+            try:
+                version, http_status = status_line.decode("latin-1").split(None, 2)[:2]
+                http_status = int(http_status)
+            except ValueError:
+                raise ValueError("Invalid HTTP response: {!r}".format(status_line[:100]))
+
+            response_headers = {}
+            while True:
+                header_line = await connection.reader.readline()
+                if len(header_line) == 0:
+                    raise ConnectionResetError("Connection closed by the server")
+                header_line = header_line.decode("latin-1").strip()
+                if len(header_line) == 0:
+                    break
+                name, separator, value = header_line.partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+
+            if not 100 <= http_status < 200:      # Skip the informational responses
+                break
+
+        reusable = version == "HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+
+        return http_status, response_headers, reusable
+
+
+    def close(self):
+        for host_pool in self.host_pools.values():
+            for connection in host_pool.idle_connections:
+                connection.close()
+            host_pool.idle_connections = []
+
+
+async def check_urls_async(url_list, previous_status_dicts=None, callback=None, **options):
+    """
+    Check the urls of url_list and return the {url: status dict} dict of the
+    results. callback is called with (url, status dict) after each check.
+
+    previous_status_dicts is the {url: status dict} dict of the previous
+    checks and options are passed to LinkChecker.
+    """
+
+    if previous_status_dicts is None:
+        previous_status_dicts = {}
+
+    link_checker = LinkChecker(**options)
+
+    async def check(url):
+        status_dict = await link_checker.check(url, previous_status_dicts.get(url))
+        if callback is not None:
+            callback(url, status_dict)
+        return url, status_dict
+
+    try:
+        result_list = await asyncio.gather(*(check(url) for url in url_list))
+    finally:
+        link_checker.close()
+
+    return dict(result_list)
+
+
+def check_urls(url_list, previous_status_dicts=None, callback=None, **options):
+    """
+    Same as check_urls_async() in a new event loop.
+    """
+
+    return asyncio.run(check_urls_async(url_list, previous_status_dicts, callback, **options))
+
+
+# Status file #################################################################
+
+def load_link_statuses(path=LINK_STATUS_FILENAME):
+    """
+    Return the {url: status dict} dict of the last checks.
+    """
+
+    try:
+        with open(os.path.expanduser(path), "r") as fd:
+            return json.load(fd)
+    except FileNotFoundError:
+        return {}
+
+
+def save_link_statuses(status_dicts, path=LINK_STATUS_FILENAME):
+    """
+    Add the {url: status dict} dict status_dicts to the status file (the
+    statuses written meanwhile by the other processes are kept).
+    """
+
+    path = os.path.expanduser(path)
+    all_status_dicts = load_link_statuses(path)
+    all_status_dicts.update(status_dicts)
+    save_scheduler.atomic_write_json(path, all_status_dicts)
+
+
+def read_web_site_urls(path=WEB_SITES_FILENAME):
+    try:
+        with open(os.path.expanduser(path), "r") as fd:
+            return list(json.load(fd))
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Local copy of the web pages of the job adverts (the job adverts are often
+removed from the web sites a few weeks after their publication).
+
+The pages are stored compressed (zlib) in PAGE_CACHE_DIRNAME:
+
+    index.json                {url: {"hash": ..., "content_type": ...,
+                                     "fetched": "YYYY-MM-DDTHH:MM:SS",
+                                     "accessed": timestamp}}
+    objects/ab/abcdef...      the pages, named after the SHA-256 of their
+                              content (identical pages are stored once)
+    view/abcdef....html       the last pages opened in the web browser
+
+The total size of the objects is bounded: the least recently used pages are
+removed first (a page is used when it is stored or read).
+
+The index is shared with the other processes (it is read and written under
+a file lock, see the file_lock module).
+
+PageFetcher downloads the pages on worker threads (at most max_workers at
+the same time) and stores them in the cache. Only the text of the HTML and
+plain text pages is extracted: the other pages (e.g. PDF files) are stored
+but give no description.
+"""
+
+import concurrent.futures
+import datetime
+import hashlib
+import html.parser
+import http.client
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib.request
+import zlib
+
+import file_lock
+import save_scheduler
+
+PAGE_CACHE_DIRNAME = "~/job_adverts_pages"
+
+INDEX_FILENAME = "index.json"
+OBJECTS_DIRNAME = "objects"
+VIEW_DIRNAME = "view"          # Decompressed pages opened in the web browser
+
+DEFAULT_MAX_SIZE = 200 * 1024 * 1024     # Bytes (compressed)
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_TIMEOUT = 30.                    # Seconds
+
+MAX_PAGE_SIZE = 10 * 1024 * 1024         # Bytes (larger pages are truncated)
+
+COMPRESSION_LEVEL = 6
+
+USER_AGENT = "job-advert-manager"
+
+# Media types of the pages whose text is extracted
+TEXT_MEDIA_TYPE_SET = {"text/html", "application/xhtml+xml", "text/plain"}
+
+
+class PageCache(object):
+
+    def __init__(self, path=PAGE_CACHE_DIRNAME, max_size=DEFAULT_MAX_SIZE):
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+
+        self.index_path = os.path.join(self.path, INDEX_FILENAME)
+        self.objects_path = os.path.join(self.path, OBJECTS_DIRNAME)
+
+        os.makedirs(self.objects_path, exist_ok=True)
+
+        self.lock = file_lock.FileLock(self.index_path + file_lock.LOCK_SUFFIX)
+
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r") as fd:
+                return json.load(fd)
+        except FileNotFoundError:
+            return {}
+
+
+    def _write_index(self, index):
+        save_scheduler.atomic_write_json(self.index_path, index)
+
+
+    def _object_path(self, page_hash):
+        return os.path.join(self.objects_path, page_hash[:2], page_hash)
+
+
+    def has_page(self, url):
+        with self.lock.shared():
+            return url in self._read_index()
+
+
+    def get_page(self, url):
+        """
+        Return the (content (bytes), content type) of the page stored for
+        "url" or None.
+        """
+
+        with self.lock.exclusive():
+            index = self._read_index()
+
+            entry = index.get(url)
+            if entry is None:
+                return None
+
+            try:
+                with open(self._object_path(entry["hash"]), "rb") as fd:
+                    content = zlib.decompress(fd.read())
+            except (FileNotFoundError, zlib.error):
+                del index[url]                  # Removed by hand or damaged
+                self._write_index(index)
+                return None
+
+            entry["accessed"] = time.time()
+            self._write_index(index)
+
+        return content, entry["content_type"]
+
+
+    def put_page(self, url, content, content_type):
+        """
+        Store the page "url" and return the hash of its content.
+        """
+
+        page_hash = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(page_hash)
+
+        with self.lock.exclusive():
+            # Content addressed: an identical page is already stored
+            if not os.path.exists(object_path):
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                fd_num, tmp_path = tempfile.mkstemp(prefix=page_hash + ".", suffix=".tmp", dir=os.path.dirname(object_path))
+                try:
+                    with os.fdopen(fd_num, "wb") as fd:
+                        fd.write(zlib.compress(content, COMPRESSION_LEVEL))
+                    os.replace(tmp_path, object_path)
+                except:
+                    os.unlink(tmp_path)
+                    raise
+
+            index = self._read_index()
+
+            previous_entry = index.get(url)
+
+            index[url] = {"hash": page_hash,
+                          "content_type": content_type,
+                          "fetched": datetime.datetime.now().isoformat(timespec="seconds"),
+                          "accessed": time.time()}
+
+            if previous_entry is not None and previous_entry["hash"] != page_hash:
+                self._remove_unused_objects(index, [previous_entry["hash"]])
+
+            self._evict(index)
+            self._write_index(index)
+
+        return page_hash
+
+
+    def _remove_unused_objects(self, index, page_hash_list):
+        used_hash_set = {entry["hash"] for entry in index.values()}
+        for page_hash in page_hash_list:
+            if page_hash not in used_hash_set:
+                try:
+                    os.unlink(self._object_path(page_hash))
+                except FileNotFoundError:
+                    pass
+
+
+    def _evict(self, index):
+        """
+        Remove the least recently used pages of index until the size of the
+        objects is less than max_size.
+        """
+
+        # Last access and size of each object (shared by the urls having the
+        # same page)
+        object_dict = {}       # {hash: [last access, size]}
+        for entry in index.values():
+            object_info = object_dict.get(entry["hash"])
+            if object_info is None:
+                try:
+                    size = os.path.getsize(self._object_path(entry["hash"]))
+                except FileNotFoundError:
+                    size = 0
+                object_dict[entry["hash"]] = [entry["accessed"], size]
+            else:
+                object_info[0] = max(object_info[0], entry["accessed"])
+
+        total_size = sum(size for accessed, size in object_dict.values())
+        if total_size <= self.max_size:
+            return
+
+        evicted_hash_set = set()
+        for page_hash, (accessed, size) in sorted(object_dict.items(), key=lambda item: item[1][0]):
+            if total_size <= self.max_size:
+                break
+            evicted_hash_set.add(page_hash)
+            total_size -= size
+
+        for url in [url for url, entry in index.items() if entry["hash"] in evicted_hash_set]:
+            del index[url]
+
+        self._remove_unused_objects(index, evicted_hash_set)
+
+
+    def write_view_file(self, url):
+        """
+        Write the page stored for "url" in a file that can be opened in a web
+        browser and return its path (None if the page is not stored).
+        """
+
+        page = self.get_page(url)
+        if page is None:
+            return None
+        content, content_type = page
+
+        view_path = os.path.join(self.path, VIEW_DIRNAME)
+        os.makedirs(view_path, exist_ok=True)
+
+        # Only keep the last page
+        for filename in os.listdir(view_path):
+            os.unlink(os.path.join(view_path, filename))
+
+        media_type = get_media_type(content_type)
+        if media_type == "" or "html" in media_type:
+            extension = ".html"
+        else:
+            extension = mimetypes.guess_extension(media_type) or ".txt"
+        path = os.path.join(view_path, hashlib.sha256(content).hexdigest() + extension)
+        with open(path, "wb") as fd:
+            fd.write(content)
+
+        return path
+
+
+    def get_stats(self):
+        """
+        Return the number of urls, the number of distinct pages and the size
+        of the objects (bytes).
+        """
+
+        with self.lock.shared():
+            index = self._read_index()
+
+        hash_set = {entry["hash"] for entry in index.values()}
+        size = 0
+        for page_hash in hash_set:
+            try:
+                size += os.path.getsize(self._object_path(page_hash))
+            except FileNotFoundError:
+                pass
+
+        return len(index), len(hash_set), size
+
+
+# Text extraction #############################################################
+
+# Tags whose content is not displayed
+HIDDEN_TAG_SET = {"script", "style", "noscript", "template", "head", "svg"}
+
+# Tags ending a line of text
+BLOCK_TAG_SET = {"address", "article", "aside", "blockquote", "br", "dd", "div",
+                 "dl", "dt", "fieldset", "figcaption", "figure", "footer", "form",
+                 "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main",
+                 "nav", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul"}
+
+
+class _TextExtractor(html.parser.HTMLParser):
+
+    def __init__(self):
+        super(_TextExtractor, self).__init__(convert_charrefs=True)
+        self.hidden_depth = 0
+        self.chunk_list = []
+
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_TAG_SET:
+            self.hidden_depth += 1
+        elif tag in BLOCK_TAG_SET:
+            self.chunk_list.append("\n")
+
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_TAG_SET:
+            self.hidden_depth = max(self.hidden_depth - 1, 0)
+        elif tag in BLOCK_TAG_SET:
+            self.chunk_list.append("\n")
+
+
+    def handle_data(self, data):
+        if self.hidden_depth == 0:
+            self.chunk_list.append(data)
+
+
+def get_media_type(content_type):
+    """
+    Return the media type of the Content-Type header content_type (e.g.
+    "text/html" for "text/html; charset=utf-8"), "" if it is not given.
+    """
+
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def is_text_page(content_type):
+    """
+    Tell whether the text of a page of this Content-Type can be extracted
+    (HTML or plain text, HTML if the type is not given).
+    """
+
+    media_type = get_media_type(content_type)
+    return media_type == "" or media_type in TEXT_MEDIA_TYPE_SET
+
+
+def decode_page(content, content_type):
+    """
+    Return the text of the page (str) using the charset of content_type
+    (UTF-8 by default).
+    """
+
+    match = re.search(r"charset\s*=\s*[\"']?([\w.:-]+)", content_type or "", re.IGNORECASE)
+    encoding = match.group(1) if match is not None else "utf-8"
+
+    try:
+        return content.decode(encoding, errors="replace")
+    except LookupError:                 # Unknown charset
+        return content.decode("utf-8", errors="replace")
+
+
+def extract_text(content, content_type):
+    """
+    Return the visible text of the page (one line per paragraph), to be used
+    as the description of a job advert, or None if it is not a text page
+    (see is_text_page()).
+    """
+
+    if not is_text_page(content_type):
+        return None
+
+    text = decode_page(content, content_type)
+
+    if "html" in (content_type or "text/html").lower():
+        extractor = _TextExtractor()
+        extractor.feed(text)
+        extractor.close()
+        text = "".join(extractor.chunk_list)
+
+    line_list = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in line_list if len(line) > 0)
+
+
+# Fetcher #####################################################################
+
+class PageFetcher(object):
+    """
+    Download the pages on at most max_workers worker threads and store them
+    in page_cache.
+    """
+
+    def __init__(self, page_cache, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT):
+        self.page_cache = page_cache
+        self.timeout = timeout
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="PageFetcher")
+
+        self.futures = {}                # {url: Future} of the pending fetches
+        self.futures_lock = threading.Lock()
+
+
+    def fetch(self, url, callback=None):
+        """
+        Download the page "url" (unless it is being downloaded) and return a
+        concurrent.futures.Future of its text (see extract_text()).
+
+        callback is called from the worker thread with (url, text, error
+        message): text is None if the page can't be downloaded or is not a
+        text page (e.g. a PDF file, which is stored anyway).
+        """
+
+        with self.futures_lock:
+            future = self.futures.get(url)
+            if future is None:
+                future = self.futures[url] = self.executor.submit(self._fetch, url)
+
+        if callback is not None:
+            future.add_done_callback(lambda future: callback(url, *_future_result(future)))
+
+        return future
+
+
+    def _fetch(self, url):
+        try:
+            request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                content = response.read(MAX_PAGE_SIZE)
+
+                # read(amt) doesn't check the Content-Length: don't store a
+                # page cut by a closed connection
+                if len(content) < MAX_PAGE_SIZE and response.length:
+                    raise http.client.IncompleteRead(content, response.length)
+
+                content_type = response.headers.get("Content-Type", "")
+
+            self.page_cache.put_page(url, content, content_type)
+        finally:
+            with self.futures_lock:
+                del self.futures[url]
+
+        text = extract_text(content, content_type)
+        if text is None:
+            raise ValueError("Not a text page ({})".format(get_media_type(content_type)))
+
+        return text
+
+
+    def close(self, cancel_pending=False):
+        """
+        Wait for the pending downloads (only the running ones if
+        cancel_pending is True).
+        """
+
+        self.executor.shutdown(wait=True, cancel_futures=cancel_pending)
+
+
+def _future_result(future):
+    try:
+        return future.result(), None
+    except (OSError, ValueError, http.client.HTTPException) as e:       # urllib.error.URLError is an OSError
+        return None, str(e) or type(e).__name__
+    except concurrent.futures.CancelledError:
+        return None, "cancelled"
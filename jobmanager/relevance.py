@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Relevance ranking of the job adverts against a keyword profile or a
+reference job advert (TF-IDF, cosine similarity).
+
+The index is a sparse term x job advert matrix stored by columns: for each
+word, the array of the ids of the job adverts containing it and the array of
+its weights in these job adverts. A query is scored against all the job
+adverts at once, one column per query word (the job adverts sharing no word
+with the query are never visited).
+
+Weighting ("lnc.ltc" in the SMART notation): the job advert vectors use the
+logarithmic term frequency, cosine normalized, without IDF; the query vector
+uses the logarithmic term frequency times the IDF, cosine normalized. A job
+advert vector only depends on the job advert itself, so adding or editing a
+job advert is an incremental update of the columns of its words.
+
+An edited job advert gets a new id: the entries of its previous id are left
+in the columns (and skipped) until COMPACTION_RATIO of the ids are stale,
+then the columns are rebuilt without them.
+"""
+
+import array
+import collections
+import heapq
+import math
+
+import search_index
+
+RANKED_FIELDS = ("title", "pros", "cons", "desc")
+
+# The words of the title are counted TITLE_WEIGHT times
+TITLE_WEIGHT = 2
+
+MIN_WORD_LENGTH = 2
+
+DEFAULT_TOP_K = 20
+
+COMPACTION_RATIO = 0.25
+
+
+def term_counts(job_advert_dict):
+    """
+    Return the {word: number of occurrences} Counter of the RANKED_FIELDS of
+    job_advert_dict (the missing fields are ignored).
+    """
+
+    counter = collections.Counter()
+
+    for field in RANKED_FIELDS:
+        word_list = [word for word in search_index.tokenize(job_advert_dict.get(field, "")) if len(word) >= MIN_WORD_LENGTH]
+        if field == "title":
+            word_list *= TITLE_WEIGHT
+        counter.update(word_list)
+
+    return counter
+
+
+# 1 + log(count) for the usual counts
+_LOG_TF_LIST = [0.] + [1. + math.log(count) for count in range(1, 64)]
+
+
+def _log_tf(count):
+    return _LOG_TF_LIST[count] if count < 64 else 1. + math.log(count)
+
+
+def _log_tf_vector(counter, idf=None):
+    """
+    Return the (word list, weight list) cosine normalized vector of the
+    logarithmic term frequencies of counter (times idf(word) if idf is not
+    None).
+    """
+
+    word_list = list(counter)
+    weight_list = [_log_tf(count) for count in counter.values()]
+    if idf is not None:
+        weight_list = [weight * idf(word) for word, weight in zip(word_list, weight_list)]
+
+    norm = math.sqrt(sum(weight * weight for weight in weight_list))
+    if norm == 0.:
+        return [], []
+    return word_list, [weight / norm for weight in weight_list]
+
+
+class TfidfIndex(object):
+
+    def __init__(self):
+        self.urls = []            # {id: url} (None for the stale ids)
+        self.ids = {}             # {url: id}
+        self.columns = {}         # {word: (array of ids, array of weights)}
+        self.num_stale_ids = 0
+        self.version = 0          # Incremented at each change
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def add(self, url, job_advert_dict):
+        """
+        Index (or re-index) the job advert "url".
+        """
+
+        self.remove(url)
+
+        doc_id = len(self.urls)
+        self.urls.append(url)
+        self.ids[url] = doc_id
+
+        columns = self.columns
+        for word, weight in zip(*_log_tf_vector(term_counts(job_advert_dict))):
+            column = columns.get(word)
+            if column is None:
+                column = columns[word] = (array.array("I"), array.array("f"))
+            column[0].append(doc_id)
+            column[1].append(weight)
+
+        self.version += 1
+
+
+    def remove(self, url):
+        doc_id = self.ids.pop(url, None)
+        if doc_id is None:
+            return
+
+        self.urls[doc_id] = None
+        self.num_stale_ids += 1
+        self.version += 1
+
+        if self.num_stale_ids > COMPACTION_RATIO * len(self.urls):
+            self._compact()
+
+
+    def _compact(self):
+        """
+        Renumber the job adverts without the stale ids.
+        """
+
+        new_ids = array.array("i", [-1]) * len(self.urls)
+        url_list = []
+        for doc_id, url in enumerate(self.urls):
+            if url is not None:
+                new_ids[doc_id] = len(url_list)
+                url_list.append(url)
+
+        columns = {}
+        for word, (id_array, weight_array) in self.columns.items():
+            new_id_array = array.array("I")
+            new_weight_array = array.array("f")
+            for doc_id, weight in zip(id_array, weight_array):
+                new_id = new_ids[doc_id]
+                if new_id >= 0:
+                    new_id_array.append(new_id)
+                    new_weight_array.append(weight)
+            if len(new_id_array) > 0:
+                columns[word] = (new_id_array, new_weight_array)
+
+        self.urls = url_list
+        self.ids = {url: doc_id for doc_id, url in enumerate(url_list)}
+        self.columns = columns
+        self.num_stale_ids = 0
+
+
+    def idf(self, word):
+        """
+        Smoothed inverse document frequency of word (the stale ids are
+        counted until the next compaction).
+        """
+
+        column = self.columns.get(word)
+        document_frequency = 0 if column is None else len(column[0])
+        return math.log((1. + len(self.urls)) / (1. + document_frequency)) + 1.
+
+
+    def query_vector(self, keywords=None, job_advert_dict=None):
+        """
+        Return the {word: weight} query vector of the keyword profile
+        keywords (a string) or of the reference job advert job_advert_dict.
+        """
+
+        if job_advert_dict is not None:
+            counter = term_counts(job_advert_dict)
+        else:
+            counter = collections.Counter(word for word in search_index.tokenize(keywords or "") if len(word) >= MIN_WORD_LENGTH)
+
+        return dict(zip(*_log_tf_vector(counter, self.idf)))
+
+
+    def score_all(self, query_vector):
+        """
+        Return the {url: cosine similarity} dict of the job adverts sharing at
+        least one word with query_vector.
+        """
+
+        scores = array.array("d", bytes(8 * len(self.urls)))
+        matched_id_set = set()
+
+        for word, query_weight in query_vector.items():
+            column = self.columns.get(word)
+            if column is None:
+                continue
+            id_array, weight_array = column
+            for doc_id, weight in zip(id_array, weight_array):
+                scores[doc_id] += query_weight * weight
+            matched_id_set.update(id_array)
+
+        url_list = self.urls
+        return {url_list[doc_id]: scores[doc_id] for doc_id in matched_id_set if url_list[doc_id] is not None}
+
+
+    def top_k(self, query_vector, k=DEFAULT_TOP_K, excluded_url=None):
+        """
+        Return the [(cosine similarity, url), ...] list of the k job adverts
+        most similar to query_vector (most similar first).
+        """
+
+        scores = self.score_all(query_vector)
+        scores.pop(excluded_url, None)
+        return heapq.nlargest(k, ((score, url) for url, score in scores.items()))
+
+
+def score(job_advert_dict, query_vector):
+    """
+    Return the cosine similarity of job_advert_dict and query_vector (same as
+    TfidfIndex.score_all() for one job advert).
+    """
+
+    vector = dict(zip(*_log_tf_vector(term_counts(job_advert_dict))))
+    return sum(query_weight * vector.get(word, 0.) for word, query_weight in query_vector.items())
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Coalesced and atomic background saving of the JSON database.
+
+The SaveScheduler runs the save function on a worker thread.
+Save requests made while a save is pending are merged: a burst of changes
+(e.g. ticking ten web site statuses in a row) triggers only one write. A
+continuous stream of changes still triggers a write every max_delay seconds.
+
+A failed save is retried RETRY_DELAY seconds later (the changes stay
+pending).
+"""
+
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+
+# Number of seconds to wait after the last save request before writing the
+# file (coalescing window)
+DEFAULT_SAVE_DELAY = 0.5
+
+# Maximum number of seconds between the first pending save request and the
+# write (even if new requests keep coming)
+DEFAULT_MAX_SAVE_DELAY = 5.
+
+# Number of seconds to wait after a failed save before retrying
+RETRY_DELAY = 5.
+
+logger = logging.getLogger(__name__)
+
+
+def create_temporary_file(path):
+    """
+    Create a new temporary file in the directory of "path" (so that it can
+    be renamed to path) with the mode of path. Return (fd number, temporary
+    file path).
+    """
+
+    dir_path = os.path.dirname(os.path.abspath(path))
+    fd_num, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=dir_path)
+
+    # mkstemp creates the file with the 0600 mode: keep the mode of the
+    # previous file (or use the default mode given by the umask)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    try:
+        os.chmod(tmp_path, mode)
+    except:
+        os.close(fd_num)
+        os.remove(tmp_path)
+        raise
+
+    return fd_num, tmp_path
+
+
+def write_temporary_json(path, data, default=None):
+    """
+    Write data in a new temporary JSON file next to "path" (+ fsync) and
+    return its path, to be given to replace_file() (default is passed to
+    json.dump()).
+    """
+
+    fd_num, tmp_path = create_temporary_file(path)
+
+    try:
+        with os.fdopen(fd_num, "w") as fd:
+            json.dump(data, fd, sort_keys=True, indent=4, default=default)
+            fd.flush()
+            os.fsync(fd.fileno())
+    except:
+        os.remove(tmp_path)
+        raise
+
+    return tmp_path
+
+
+def replace_file(tmp_path, path):
+    """
+    Rename the temporary file tmp_path to path (durably). The temporary
+    file is removed if the rename fails.
+    """
+
+    try:
+        os.replace(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+    # Make the rename durable
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return                       # Not supported on this platform
+
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def atomic_write_json(path, data, default=None):
+    """
+    Write data in the JSON file "path" via a temporary file + fsync + rename
+    (default is passed to json.dump()).
+
+    The previous version of the file is kept untouched until the new one is
+    completely written on the disk: a crash during the dump can't corrupt
+    the database.
+    """
+
+    replace_file(write_temporary_json(path, data, default), path)
+
+
+class SaveScheduler(object):
+
+    def __init__(self, save_function, delay=DEFAULT_SAVE_DELAY, max_delay=DEFAULT_MAX_SAVE_DELAY):
+        """
+        save_function is called (without argument) on the worker thread.
+        """
+
+        self.save_function = save_function
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self.condition = threading.Condition()
+        self.num_pending_requests = 0     # Queue depth
+        self.first_request_time = None    # Time of the first pending request
+        self.last_request_time = None     # None = save now (see flush())
+        self.retry_time = 0.              # No save before (after a failure)
+        self.num_attempts = 0
+        self.saving = False
+        self.stopped = False
+
+        self.num_requests = 0
+        self.num_saves = 0
+        self.last_save_latency = None     # In seconds
+        self.max_save_latency = None      # In seconds
+        self.last_error = None
+
+        self.thread = threading.Thread(target=self._run, name="SaveScheduler", daemon=True)
+        self.thread.start()
+
+
+    def schedule(self):
+        """
+        Mark the database dirty: it will be saved by the worker thread within
+        the next "delay" seconds.
+        """
+
+        with self.condition:
+            if self.num_pending_requests == 0:
+                self.first_request_time = time.monotonic()
+            self.num_pending_requests += 1
+            self.num_requests += 1
+            self.last_request_time = time.monotonic()
+            self.condition.notify_all()
+
+
+    def is_dirty(self):
+        with self.condition:
+            return self.num_pending_requests > 0 or self.saving
+
+
+    def flush(self):
+        """
+        Write the pending changes now and wait until they are on the disk (or
+        until a save fails: see last_error).
+        """
+
+        with self.condition:
+            num_attempts = self.num_attempts
+            self.last_request_time = None     # Skip the coalescing window
+            self.retry_time = 0.
+            self.condition.notify_all()
+            while (self.num_pending_requests > 0 or self.saving) and self.thread.is_alive():
+                if self.num_attempts > num_attempts and self.last_error is not None:
+                    break
+                self.condition.wait()
+
+
+    def stop(self):
+        """
+        Flush the pending changes and stop the worker thread.
+        """
+
+        self.flush()
+
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        self.thread.join()
+
+
+    def get_stats(self):
+        with self.condition:
+            return {"queue_depth": self.num_pending_requests,
+                    "num_requests": self.num_requests,
+                    "num_saves": self.num_saves,
+                    "last_save_latency": self.last_save_latency,
+                    "max_save_latency": self.max_save_latency}
+
+
+    def _run(self):
+        while True:
+            with self.condition:
+                # Wait for a save request
+                while self.num_pending_requests == 0 and not self.stopped:
+                    self.condition.wait()
+
+                # Stopped (the last save failed if changes are still pending)
+                if self.stopped and (self.num_pending_requests == 0 or self.last_error is not None):
+                    return
+
+                # Wait until no new request comes during "delay" seconds (at
+                # most max_delay seconds after the first request)
+                while self.last_request_time is not None and not self.stopped:
+                    save_time = min(self.last_request_time + self.delay, self.first_request_time + self.max_delay)
+                    remaining_time = max(save_time, self.retry_time) - time.monotonic()
+                    if remaining_time <= 0:
+                        break
+                    self.condition.wait(remaining_time)
+
+                # The requests made during the save are counted on top of the
+                # merged ones (they trigger another save)
+                num_merged_requests = self.num_pending_requests
+                self.saving = True
+
+            start_time = time.monotonic()
+            try:
+                self.save_function()
+                error = None
+            except Exception as e:
+                logger.exception("Cannot save the database")
+                error = e
+            latency = time.monotonic() - start_time
+
+            with self.condition:
+                self.saving = False
+                self.last_error = error
+                self.num_attempts += 1
+                if error is not None:
+                    # Nothing has been written: the changes are still pending
+                    if self.last_request_time is None:
+                        self.last_request_time = time.monotonic()
+                    self.retry_time = time.monotonic() + RETRY_DELAY
+                else:
+                    # Only the requests made during the save are still pending
+                    self.num_pending_requests -= num_merged_requests
+                    self.first_request_time = start_time
+                    self.num_saves += 1
+                    self.last_save_latency = latency
+                    self.max_save_latency = max(latency, self.max_save_latency or 0.)
+                    logger.debug("Database saved in %.3fs (%d requests merged, queue depth: %d)",
+                                 latency, num_merged_requests, self.num_pending_requests)
+                self.condition.notify_all()
@@ -20,21 +20,30 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from gi.repository import Gio as gio
+from gi.repository import GLib as glib
 from gi.repository import Gtk as gtk
 
 import os
 import datetime
 import json
-import webbrowser
+
+import link_checker
+import tracing
 
 JSON_FILENAME = "~/job_adverts_web_sites.json"
 
-JOB_SEARCH_TREE_VIEW_COLUMN_LABEL_LIST = ["Url", "Tooltip", "Name", "Category", "Last visit", "Today status"]
+JOB_SEARCH_TREE_VIEW_COLUMN_LABEL_LIST = ["Url", "Tooltip", "Name", "Category", "Last visit", "Today status", "Link"]
 
 TODAY_STATUS_LIST = ["None", "Partial", "Full"]
 
+# Delay (in milliseconds) between a change of the web sites file and its
+# reading
+RELOAD_DELAY = 300
+
 class SearchContainer(gtk.Box):
 
+    @tracing.traced()
     def __init__(self, job_adverts_model):
 
         super(SearchContainer, self).__init__(orientation=gtk.Orientation.VERTICAL, spacing=6)
@@ -53,6 +62,19 @@ class SearchContainer(gtk.Box):
         except FileNotFoundError:
             pass
 
+        # Reload the web sites when the file is changed (e.g. edited in a text
+        # editor)
+        self.file_monitor = gio.File.new_for_path(os.path.expanduser(JSON_FILENAME)).monitor_file(gio.FileMonitorFlags.NONE, None)
+        self.file_monitor.connect("changed", self.web_sites_file_changed_cb)
+        self.reload_timeout_id = None
+
+        # Update the rows when the job search history is changed by another
+        # process
+        self.job_adverts_model.job_search_changed_callbacks.append(self.job_searchs_changed_cb)
+
+        # Update the link column when the web sites are checked
+        self.job_adverts_model.link_status_changed_callbacks.append(self.link_statuses_changed_cb)
+
         # Creating the Combo Status ListStore model
         liststore_today_status = gtk.ListStore(str)
         for item in TODAY_STATUS_LIST:
@@ -61,23 +83,10 @@ class SearchContainer(gtk.Box):
         # Creating the TreeView ListStore model
         # {"url": {"date": "status", ...}, ...}
 
-        self.liststore_job_search = gtk.ListStore(str, str, str, str, str, str)
+        self.liststore_job_search = gtk.ListStore(str, str, str, str, str, str, str)
+        self.row_iters = {}      # {url: gtk.TreeIter} (ListStore iters persist)
         for url, web_site_dict in self.json_database.items():
-            tooltip = url.replace('&', '&amp;')
-            label = web_site_dict["label"]
-            category = web_site_dict["category"]
-
-            today_datetime = datetime.datetime.today()
-            today_iso_str = datetime.date.isoformat(today_datetime)
-
-            try:
-                today_status = self.job_adverts_model.json_database["job_searchs"][url][today_iso_str]
-            except KeyError:
-                today_status = "None"
-
-            num_days_since_last_visit_str = self.set_last_visit_field_in_model(url)
-
-            self.liststore_job_search.append([url, tooltip, label, category, num_days_since_last_visit_str, today_status])
+            self.row_iters[url] = self.liststore_job_search.append(self.web_site_row(url, web_site_dict))
 
         # Creating the treeview, making it use the filter as a model, and
         # adding the columns
@@ -104,6 +113,8 @@ class SearchContainer(gtk.Box):
                 column.set_sort_column_id(4)
             elif column_title == "Today status":
                 column.set_sort_column_id(5)
+            elif column_title == "Link":
+                column.set_sort_column_id(6)
 
             #if column_title == "Last visit":
             #    if self.liststore_job_search[...][4] = "-"
@@ -141,7 +152,97 @@ class SearchContainer(gtk.Box):
 
         self.pack_start(adverts_src_scrolled_window, expand=True, fill=True, padding=0)
 
+        # Link check button
+        self.check_links_button = gtk.Button(label="Check the web sites")
+        self.check_links_button.set_tooltip_text("Check whether the web sites are still online")
+        self.check_links_button.connect("clicked", self.check_links_cb)
+
+        button_box = gtk.Box(orientation=gtk.Orientation.HORIZONTAL, spacing=6)
+        button_box.pack_end(self.check_links_button, expand=False, fill=False, padding=0)
+
+        self.pack_start(button_box, expand=False, fill=False, padding=0)
+
+
+    def web_site_row(self, url, web_site_dict):
+        tooltip = url.replace('&', '&amp;')
+        label = web_site_dict["label"]
+        category = web_site_dict["category"]
+
+        today_datetime = datetime.datetime.today()
+        today_iso_str = datetime.date.isoformat(today_datetime)
+
+        today_status = self.job_adverts_model.get_job_search_status(url, today_iso_str) or "None"
+
+        num_days_since_last_visit_str = self.set_last_visit_field_in_model(url)
+
+        link_status_str = link_checker.describe_status(self.job_adverts_model.get_link_status(url))
+
+        return [url, tooltip, label, category, num_days_since_last_visit_str, today_status, link_status_str]
+
+
+    def web_sites_file_changed_cb(self, file_monitor, changed_file, other_file, event_type):
+        if event_type != gio.FileMonitorEvent.ATTRIBUTE_CHANGED and self.reload_timeout_id is None:
+            self.reload_timeout_id = glib.timeout_add(RELOAD_DELAY, self.reload_web_sites)
+
+
+    @tracing.traced()
+    def reload_web_sites(self):
+        """
+        Read the web sites file again and only update the rows of the web
+        sites that have been added, removed or changed.
+        """
+
+        self.reload_timeout_id = None
+
+        try:
+            with open(os.path.expanduser(JSON_FILENAME), "r") as fd:
+                json_database = json.load(fd)
+        except FileNotFoundError:
+            json_database = {}
+        except ValueError:
+            return False         # Being written (the next change will be notified)
+
+        for url in list(self.row_iters):
+            if url not in json_database:
+                self.liststore_job_search.remove(self.row_iters.pop(url))
+
+        for url, web_site_dict in json_database.items():
+            if url not in self.row_iters:
+                self.row_iters[url] = self.liststore_job_search.append(self.web_site_row(url, web_site_dict))
+            elif web_site_dict != self.json_database.get(url):
+                self.liststore_job_search.set(self.row_iters[url], [2, 3], [web_site_dict["label"], web_site_dict["category"]])
+
+        self.json_database = json_database
+
+        return False
+
+
+    def job_searchs_changed_cb(self, url_set):
+        for url, treeiter in self.row_iters.items():
+            if url_set is None or url in url_set:
+                today_iso_str = datetime.date.isoformat(datetime.date.today())
+                today_status = self.job_adverts_model.get_job_search_status(url, today_iso_str) or "None"
+                self.liststore_job_search.set(treeiter, [4, 5], [self.set_last_visit_field_in_model(url), today_status])
+
+
+    def link_statuses_changed_cb(self, url_set):
+        for url in url_set:
+            if url in self.row_iters:
+                link_status_str = link_checker.describe_status(self.job_adverts_model.get_link_status(url))
+                self.liststore_job_search.set_value(self.row_iters[url], 6, link_status_str)
+
+
+    @tracing.traced()
+    def check_links_cb(self, button):
+        self.check_links_button.set_sensitive(False)
+        self.job_adverts_model.check_links(list(self.row_iters), self.check_links_done_cb)
+
+
+    def check_links_done_cb(self, status_dicts):
+        self.check_links_button.set_sensitive(True)
 
+
+    @tracing.traced()
     def on_combo_changed_cb(self, widget, path, text):
         # Liststore
         self.liststore_job_search[path][5] = text
@@ -150,13 +251,8 @@ class SearchContainer(gtk.Box):
         url = self.liststore_job_search[path][0]
         today = datetime.date.isoformat(datetime.date.today())
 
-        if url not in self.job_adverts_model.json_database["job_searchs"]:
-            self.job_adverts_model.json_database["job_searchs"][url] = {}
-
-        self.job_adverts_model.json_database["job_searchs"][url][today] = text
-
-        # Save the JSON file
-        self.job_adverts_model.save_json_file()
+        # Save the status in the database (and in the journal file)
+        self.job_adverts_model.set_job_search_status(url, today, text)
 
         # Update 'Last Visit' field in the model
         num_days_since_last_visit_str = self.set_last_visit_field_in_model(url)
@@ -164,34 +260,34 @@ class SearchContainer(gtk.Box):
 
 
     def set_last_visit_field_in_model(self, url):
-        today_datetime = datetime.datetime.today()
-        today_iso_str = datetime.date.isoformat(today_datetime)
+        today_date = datetime.date.today()
 
-        try:
-            if len(self.job_adverts_model.json_database["job_searchs"][url]) > 0:
-                # FULL
-                filtered_date_iso_str_list = [key for (key, val) in self.job_adverts_model.json_database["job_searchs"][url].items() if val=='Full']
-                last_date_iso_str = sorted(filtered_date_iso_str_list)[-1]
-                last_datetime = datetime.datetime.strptime(last_date_iso_str, "%Y-%m-%d")
-                num_days_since_last_full_visit = (today_datetime - last_datetime).days
-
-                # PARTIAL
-                filtered_date_iso_str_list = [key for (key, val) in self.job_adverts_model.json_database["job_searchs"][url].items() if val in ('Full', 'Partial')]
-                last_date_iso_str = sorted(filtered_date_iso_str_list)[-1]
-                last_datetime = datetime.datetime.strptime(last_date_iso_str, "%Y-%m-%d")
-                num_days_since_last_partial_visit = (today_datetime - last_datetime).days
-
-                num_days_since_last_visit_str = "{} - {}".format(num_days_since_last_full_visit, num_days_since_last_partial_visit)
-            else:
-                num_days_since_last_visit_str = "-"
-        except KeyError:
+        # FULL
+        last_full_date = self.job_adverts_model.get_last_visit_date(url, ('Full',))
+
+        # PARTIAL
+        last_partial_date = self.job_adverts_model.get_last_visit_date(url, ('Full', 'Partial'))
+
+        if last_partial_date is None:
             num_days_since_last_visit_str = "-"
+        else:
+            if last_full_date is None:
+                num_days_since_last_full_visit = "-"
+            else:
+                num_days_since_last_full_visit = (today_date - last_full_date).days
+
+            num_days_since_last_partial_visit = (today_date - last_partial_date).days
+
+            num_days_since_last_visit_str = "{} - {}".format(num_days_since_last_full_visit, num_days_since_last_partial_visit)
 
         return num_days_since_last_visit_str
 
 
+@tracing.traced()
 def treeview_double_click_cb(tree_view, tree_path, tree_view_column):
     """Inspired from http://stackoverflow.com/questions/17109634/hyperlink-in-cellrenderertext-markup"""
+    import webbrowser           # Imported at the first use (faster startup)
+
     model = tree_view.get_model()
     url = model[tree_path][0]
     webbrowser.open(url)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+In-memory inverted index of the job adverts used to filter the Edit tab.
+
+Queries are made of one or several terms: a job advert matches if, for each
+term, one of its words starts with this term (e.g. "pyth lyon" matches the
+job adverts containing "python" and "lyon").
+"""
+
+import bisect
+import heapq
+import re
+import unicodedata
+
+INDEXED_FIELDS = ("title", "organization", "pros", "cons", "desc")
+
+# Terms shorter than MIN_PREFIX_LENGTH only match whole words (a one letter
+# prefix would match most of the database)
+MIN_PREFIX_LENGTH = 2
+
+WORD_REGEX = re.compile(r"\w+")
+COMBINING_DIACRITICS_REGEX = re.compile("[\u0300-\u036f]")
+
+
+def normalize(text):
+    """
+    Lower case the text and remove its accents ("Société" -> "societe").
+    """
+
+    return COMBINING_DIACRITICS_REGEX.sub("", unicodedata.normalize("NFKD", text.lower()))
+
+
+def tokenize(text):
+    return WORD_REGEX.findall(normalize(text))
+
+
+class InvertedIndex(object):
+
+    def __init__(self):
+        self.postings = {}        # {word: set of urls}
+        self.url_words = {}       # {url: set of words}
+        self.version = 0          # Incremented at each change
+
+        # All the indexed words (sorted) for prefix queries. The words added
+        # or removed since the last query are merged at the next one (see
+        # _get_sorted_words()): inserting them one by one would be quadratic
+        # in the size of the vocabulary.
+        self.sorted_words = []
+        self.added_words = set()
+        self.removed_words = set()
+
+
+    def __len__(self):
+        return len(self.url_words)
+
+
+    def add(self, url, job_advert_dict):
+        """
+        Index (or re-index) the job advert "url".
+
+        The INDEXED_FIELDS missing in job_advert_dict are ignored: with the
+        backends that don't load the bodies at startup, the job adverts are
+        indexed a first time without pros, cons and desc.
+        """
+
+        self.remove(url)
+
+        word_set = set()
+        for field in INDEXED_FIELDS:
+            word_set.update(tokenize(job_advert_dict.get(field, "")))
+
+        for word in word_set:
+            url_set = self.postings.get(word)
+            if url_set is None:
+                self.postings[word] = url_set = set()
+                if word in self.removed_words:
+                    self.removed_words.discard(word)     # Still in sorted_words
+                else:
+                    self.added_words.add(word)
+            url_set.add(url)
+
+        self.url_words[url] = word_set
+        self.version += 1
+
+
+    def remove(self, url):
+        word_set = self.url_words.pop(url, None)
+        if word_set is None:
+            return
+
+        for word in word_set:
+            url_set = self.postings[word]
+            url_set.discard(url)
+            if len(url_set) == 0:
+                del self.postings[word]
+                if word in self.added_words:
+                    self.added_words.discard(word)       # Not in sorted_words yet
+                else:
+                    self.removed_words.add(word)
+
+        self.version += 1
+
+
+    def _get_sorted_words(self):
+        """
+        Return sorted_words once the pending additions and removals are
+        merged (one linear merge whatever their number).
+        """
+
+        if len(self.added_words) > 0 or len(self.removed_words) > 0:
+            word_iterable = self.sorted_words
+            if len(self.removed_words) > 0:
+                removed_words = self.removed_words
+                word_iterable = [word for word in word_iterable if word not in removed_words]
+            self.sorted_words = list(heapq.merge(word_iterable, sorted(self.added_words)))
+            self.added_words = set()
+            self.removed_words = set()
+
+        return self.sorted_words
+
+
+    def _word_range(self, term):
+        """
+        Return the (start, stop) range of the words of sorted_words matching
+        term.
+        """
+
+        sorted_words = self._get_sorted_words()
+
+        start = bisect.bisect_left(sorted_words, term)
+
+        if len(term) < MIN_PREFIX_LENGTH:
+            if start < len(sorted_words) and sorted_words[start] == term:
+                return start, start + 1
+            return start, start
+
+        stop = bisect.bisect_left(sorted_words, term + "\U0010ffff", start)
+        return start, stop
+
+
+    def search(self, query):
+        """
+        Return the set of urls matching all the terms of query or None if
+        the query is empty (i.e. everything matches).
+        """
+
+        term_list = tokenize(query)
+        if len(term_list) == 0:
+            return None
+
+        # The most selective terms (matching the fewest words) first
+        range_list = sorted((self._word_range(term) + (term,) for term in set(term_list)),
+                            key=lambda item: item[1] - item[0])
+
+        result = None
+        for start, stop, term in range_list:
+            if result is None:
+                result = set()
+                for word in self.sorted_words[start:stop]:
+                    result.update(self.postings[word])
+            elif len(result) < stop - start:
+                # Fewer candidates than matching words: check the candidates
+                if len(term) < MIN_PREFIX_LENGTH:
+                    result = {url for url in result if term in self.url_words[url]}
+                else:
+                    result = {url for url in result if any(word.startswith(term) for word in self.url_words[url])}
+            else:
+                url_set = set()
+                for word in self.sorted_words[start:stop]:
+                    url_set.update(self.postings[word])
+                result.intersection_update(url_set)
+
+            if len(result) == 0:
+                break
+
+        return result
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Binary cache of the JSON databases (e.g. "~/job_adverts.json.cache").
+
+Parsing a large JSON file is the main cost of the startup. The cache holds
+the same database in the marshal format, which is read several times
+faster, with the key of the JSON file it has been made from: its inode,
+size, modification time and a CRC32 of its first and last bytes. It is
+only used while this key still matches: the JSON file remains the reference
+(other tools only read and write the JSON file) and a stale cache is simply
+ignored, then rebuilt.
+
+The cache may already contain some records of the journal: the journal is
+replayed on top of it anyway (replaying a record twice has no effect).
+
+File format: a sequence of marshal objects, each one preceded by its length
+(8 bytes, little endian):
+
+    (FORMAT_VERSION, Python version, key, generation, other members)
+    {url: job search history}                    see JobSearchHistory.to_json()
+    [(url, job advert tuple or dict), ...]       CHUNK_SIZE job adverts
+    ...
+    and a length of 0 at the end.
+"""
+
+import marshal
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+import job_advert_record
+import job_search_history
+
+CACHE_SUFFIX = ".cache"
+
+FORMAT_VERSION = 2
+
+# The marshal format may change between Python versions
+PYTHON_VERSION = tuple(sys.version_info[:2])
+
+# Number of job adverts per marshal object (the worker thread writing the
+# cache releases the GIL between two chunks)
+CHUNK_SIZE = 5000
+
+# Number of bytes read at the beginning and at the end of the JSON file to
+# compute its key
+SAMPLE_SIZE = 65536
+
+LENGTH_FORMAT = struct.Struct("<Q")
+
+
+def file_key(path):
+    """
+    Return the key of the JSON file "path" (None if it doesn't exist).
+
+    Its first three items are the file identity used by the storage module
+    (inode, size and modification time).
+    """
+
+    try:
+        with open(path, "rb") as fd:
+            stat_result = os.fstat(fd.fileno())
+            crc = zlib.crc32(fd.read(SAMPLE_SIZE))
+            if stat_result.st_size > SAMPLE_SIZE:
+                fd.seek(max(stat_result.st_size - SAMPLE_SIZE, SAMPLE_SIZE))
+                crc = zlib.crc32(fd.read(), crc)
+    except FileNotFoundError:
+        return None
+
+    return (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns, crc)
+
+
+def _write_object(fd, value):
+    data = marshal.dumps(value)
+    fd.write(LENGTH_FORMAT.pack(len(data)))
+    fd.write(data)
+
+
+def _read_object(fd):
+    # Raise EOFError at the end of the file (and if it is truncated)
+    header = fd.read(LENGTH_FORMAT.size)
+    if len(header) < LENGTH_FORMAT.size:
+        raise EOFError("Truncated cache file")
+
+    length = LENGTH_FORMAT.unpack(header)[0]
+    if length == 0:
+        raise EOFError()
+
+    data = fd.read(length)
+    if len(data) < length:
+        raise EOFError("Truncated cache file")
+
+    return marshal.loads(data)
+
+
+class Snapshot(object):
+    """
+    A valid cache file opened by open_snapshot(). The job adverts are read by
+    iter_job_adverts().
+    """
+
+    def __init__(self, fd, generation, json_database):
+        self.fd = fd
+        self.size = os.fstat(fd.fileno()).st_size
+
+        self.generation = generation
+
+        # The members of the database except the job adverts (its
+        # "job_adverts" dict is empty)
+        self.json_database = json_database
+
+
+    def iter_job_adverts(self):
+        """
+        Iterate over the (url, job_advert, progress) items of the database
+        where progress is the fraction (between 0 and 1) of the file read so
+        far. Raise ValueError if the file is truncated or corrupted.
+        """
+
+        try:
+            while True:
+                try:
+                    chunk = _read_object(self.fd)
+                except EOFError as e:
+                    if len(e.args) > 0:
+                        raise ValueError("{}: {}".format(self.fd.name, e))
+                    break
+
+                progress = self.fd.tell() / self.size
+                for url, value in chunk:
+                    if type(value) is tuple:
+                        value = job_advert_record.from_tuple(value)
+                    yield url, value, progress
+        finally:
+            self.fd.close()
+
+
+    def close(self):
+        self.fd.close()
+
+
+def open_snapshot(cache_path, key):
+    """
+    Return the Snapshot of the cache file "cache_path" if it has been made
+    from the JSON file whose key is "key" (see file_key()), None otherwise.
+
+    The cache file can be replaced meanwhile: the opened file is read until
+    the end.
+    """
+
+    if key is None:
+        return None
+
+    try:
+        fd = open(cache_path, "rb")
+    except FileNotFoundError:
+        return None
+
+    try:
+        format_version, python_version, cache_key, generation, member_dict = _read_object(fd)
+        if format_version != FORMAT_VERSION or python_version != PYTHON_VERSION or cache_key != key:
+            fd.close()
+            return None
+
+        json_database = dict(member_dict)
+        json_database["job_searchs"] = {url: job_search_history.from_json(json_value) for url, json_value in _read_object(fd).items()}
+        json_database["job_adverts"] = {}
+    except (EOFError, ValueError, TypeError):
+        fd.close()
+        return None
+
+    return Snapshot(fd, generation, json_database)
+
+
+def write_snapshot(cache_path, key, generation, json_database):
+    """
+    Write the cache file "cache_path" of the JSON file whose key is "key"
+    (json_database must not be modified meanwhile: give a copy).
+
+    The file is written via a temporary file + rename: the readers see
+    either the previous cache or the new one.
+    """
+
+    dir_path = os.path.dirname(os.path.abspath(cache_path))
+    fd_num, tmp_path = tempfile.mkstemp(prefix=os.path.basename(cache_path) + ".", suffix=".tmp", dir=dir_path)
+
+    member_dict = {name: value for name, value in json_database.items() if name not in ("job_adverts", "job_searchs", "generation")}
+
+    try:
+        with os.fdopen(fd_num, "wb") as fd:
+            _write_object(fd, (FORMAT_VERSION, PYTHON_VERSION, key, generation, member_dict))
+            _write_object(fd, {url: history.to_json() if isinstance(history, job_search_history.JobSearchHistory) else history
+                               for url, history in json_database["job_searchs"].items()})
+
+            item_list = list(json_database["job_adverts"].items())
+            for start in range(0, len(item_list), CHUNK_SIZE):
+                _write_object(fd, [(url, job_advert.to_tuple() if isinstance(job_advert, job_advert_record.JobAdvert) else job_advert)
+                                   for url, job_advert in item_list[start:start + CHUNK_SIZE]])
+
+            fd.write(LENGTH_FORMAT.pack(0))
+
+        os.replace(tmp_path, cache_path)
+    except:
+        os.remove(tmp_path)
+        raise
@@ -21,59 +21,227 @@
 # THE SOFTWARE.
 
 """
-See: http://gtk3-matplotlib-cookbook.readthedocs.org/en/latest/
-     http://matplotlib.org/1.4.2/examples/user_interfaces/index.html
+The Stats tab.
+
+The plots are rendered offscreen (see the stats_renderer module) on a worker
+thread so that the GTK main loop is never blocked by matplotlib. The images
+are cached by the version of the statistics counters and the plot options:
+displaying the tab again (or going back to previous options) is instant, and
+the plots are only rendered again when the data changes.
 """
 
+import gi
+
+gi.require_version('GdkPixbuf', '2.0')
+
+from gi.repository import GdkPixbuf as gdkpixbuf
+from gi.repository import GLib as glib
 from gi.repository import Gtk as gtk
 
+import concurrent.futures
 import datetime
+import logging
+
+import stats_engine
+import tracing
+
+DEFAULT_NUM_DAYS = 90
+
+# Delay (in milliseconds) between a change of the database and the redraw
+# (the changes made meanwhile are drawn at once)
+REDRAW_DELAY = 500
 
-import matplotlib.pyplot as plt
+# Delay (in milliseconds) between a resize of the tab and the redraw
+RESIZE_DELAY = 200
 
-from matplotlib.backends.backend_gtk3cairo import FigureCanvasGTK3Cairo as FigureCanvas
+logger = logging.getLogger(__name__)
 
 class StatsContainer(gtk.Box):
 
+    @tracing.traced()
     def __init__(self, job_adverts_model):
 
+        # Matplotlib is imported when the Stats tab is displayed for the
+        # first time (it's slow to import)
+        import stats_renderer
+
+        self.stats_renderer = stats_renderer
+
         super(StatsContainer, self).__init__(orientation=gtk.Orientation.VERTICAL, spacing=6)
 
         self.set_border_width(18)
 
+        # The job adverts per day and per category and the visits per day
+        # (counted with one pass over the database at the first call, then
+        # kept up to date by the model)
+        self.stats_counters = job_adverts_model.get_stats_counters()
 
-        # Matplotlib
+        job_adverts_model.stats_changed_callbacks.append(self.stats_changed_cb)
+        self.redraw_timeout_id = None
 
-        # TODO: plot nb d'annonces ajoutées (pour chaque catégories) par jour
-        # TODO: plot nb sites web visités par jour (full et partial)
-        # TODO: plot nb de candidatures envoyées
-        x_list = range(90)
-        y_list = [0 for x in x_list]
+        # Rendering: one worker thread, the images are cached by
+        # (data version, last day, period, number of days, width, height)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="StatsRenderer")
+        self.render_cache = stats_renderer.RenderCache()
+        self.rendering_key = None          # The key of the image being rendered
+        self.wanted_key = None             # The key of the image to display
+        self.wanted_series = None
 
-        today = datetime.date.today()
-        day_interval = datetime.timedelta(days=1)
+        # The changes made while the tab is hidden are drawn when it is
+        # displayed again
+        self.connect("map", self.map_cb)
 
-        count_list = [job_advert["date"] for job_advert in job_adverts_model.json_database["job_adverts"].values()]
-        for i in x_list:
-            date_str = datetime.date.isoformat(today - i * day_interval)
-            y_list[i] = count_list.count(date_str)
+        # Options
 
-        fig = plt.figure()
-        ax = fig.add_subplot(111)
-        ax.plot(x_list, y_list)
+        options_box = gtk.Box(orientation=gtk.Orientation.HORIZONTAL, spacing=6)
+        self.pack_start(options_box, expand=False, fill=False, padding=0)
 
+        period_label = gtk.Label(label="Period")
+        options_box.pack_start(period_label, expand=False, fill=False, padding=0)
 
-        # Scrolled window
+        self.period_combobox = gtk.ComboBoxText()
+        for period in stats_engine.PERIOD_LIST:
+            self.period_combobox.append_text(period)
+        self.period_combobox.set_active(0)
+        self.period_combobox.connect("changed", self.options_changed_cb)
+        options_box.pack_start(self.period_combobox, expand=False, fill=False, padding=0)
 
-        scrolled_window = gtk.ScrolledWindow()
-        self.pack_start(scrolled_window, expand=True, fill=True, padding=0)
+        num_days_label = gtk.Label(label="Number of days")
+        options_box.pack_start(num_days_label, expand=False, fill=False, padding=0)
 
-        canvas = FigureCanvas(fig)
-        scrolled_window.add_with_viewport(canvas)
+        self.num_days_spin_button = gtk.SpinButton()
+        self.num_days_spin_button.set_increments(step=1, page=30)
+        self.num_days_spin_button.set_range(min=1, max=36500)
+        self.num_days_spin_button.set_value(DEFAULT_NUM_DAYS)
+        self.num_days_spin_button.set_numeric(True)
+        self.num_days_spin_button.connect("value-changed", self.options_changed_cb)
+        options_box.pack_start(self.num_days_spin_button, expand=False, fill=False, padding=0)
+
+        # Plots
+
+        # TODO: plot nb de candidatures envoyées
+        self.image = gtk.Image()
+
+        self.scrolled_window = gtk.ScrolledWindow()
+        self.scrolled_window.add_with_viewport(self.image)
+        self.scrolled_window.connect("size-allocate", self.size_allocate_cb)
+        self.pack_start(self.scrolled_window, expand=True, fill=True, padding=0)
+
+        self.plot_size = None              # (width, height) of the scrolled window
+        self.resize_timeout_id = None
 
         # Label
 
-        num_job_adverts = len(job_adverts_model.json_database["job_adverts"])
-        label = gtk.Label(label="{} job adverts registred".format(num_job_adverts))
-        self.pack_start(label, expand=False, fill=False, padding=0)
+        self.label = gtk.Label()
+        self.pack_start(self.label, expand=False, fill=False, padding=0)
+
+
+    @tracing.traced()
+    def plot(self):
+        """
+        Display the number of job adverts added per period (for each
+        category) and the number of web sites visited per period: the cached
+        image if there is one, otherwise render it on the worker thread.
+        """
+
+        if self.plot_size is None:
+            return                         # Not allocated yet (see size_allocate_cb())
+
+        period = self.period_combobox.get_active_text()
+        num_days = self.num_days_spin_button.get_value_as_int()
+
+        self.label.set_text("{} job adverts registred".format(self.stats_counters.job_adverts.total()))
+
+        # The plots end today: the images of the previous days are stale
+        last_date = datetime.date.today()
+
+        key = (self.stats_counters.version, last_date, period, num_days) + self.plot_size
+        self.wanted_key = key
+
+        pixbuf = self.render_cache.get(key)
+        if pixbuf is not None:
+            self.image.set_from_pixbuf(pixbuf)
+            self.wanted_series = None      # The image being rendered is no longer wanted
+            return
+
+        # The series are computed here (the counters are only updated by the
+        # main loop) and drawn by the worker thread
+        first_date = last_date - datetime.timedelta(days=num_days - 1)
+
+        self.wanted_series = stats_engine.StatsSeries(self.stats_counters, first_date, last_date, period)
+
+        if self.rendering_key is None:
+            self._start_rendering()
+        # Otherwise the last wanted image is rendered when the current one is
+        # done (the intermediate ones are skipped)
+
+
+    def _start_rendering(self):
+        key, stats_series = self.wanted_key, self.wanted_series
+        self.rendering_key = key
+        self.wanted_series = None
+
+        future = self.executor.submit(self.stats_renderer.render, stats_series, *key[-2:])
+        future.add_done_callback(lambda future: glib.idle_add(self._rendering_done, key, future))
+
+
+    def _rendering_done(self, key, future):
+        self.rendering_key = None
+
+        try:
+            data, width, height = future.result()
+            pixbuf = gdkpixbuf.Pixbuf.new_from_bytes(glib.Bytes.new(data), gdkpixbuf.Colorspace.RGB, True, 8, width, height, width * 4)
+        except Exception as e:
+            # Not cached: rendered again at the next plot()
+            logger.exception("Cannot draw the statistics")
+            pixbuf = None
+            if key == self.wanted_key:
+                self.label.set_text("Cannot draw the statistics: {}".format(e))
+        else:
+            self.render_cache.put(key, pixbuf)
+
+        if key == self.wanted_key:
+            if pixbuf is not None:
+                self.image.set_from_pixbuf(pixbuf)
+        elif self.wanted_series is not None:
+            self._start_rendering()
+
+        return False
+
+
+    @tracing.traced()
+    def options_changed_cb(self, widget):
+        self.plot()
+
+
+    def size_allocate_cb(self, widget, allocation):
+        if (allocation.width, allocation.height) != self.plot_size and self.resize_timeout_id is None:
+            self.resize_timeout_id = glib.timeout_add(RESIZE_DELAY if self.plot_size is not None else 0, self.resize_timeout_cb)
+
+
+    def resize_timeout_cb(self):
+        self.resize_timeout_id = None
+
+        allocation = self.scrolled_window.get_allocation()
+        plot_size = (max(allocation.width - 4, 1), max(allocation.height - 4, 1))   # Without the frame
+        if plot_size != self.plot_size:
+            self.plot_size = plot_size
+            self.plot()
+
+        return False
+
+
+    def stats_changed_cb(self):
+        if self.redraw_timeout_id is None:
+            self.redraw_timeout_id = glib.timeout_add(REDRAW_DELAY, self.redraw_timeout_cb)
+
+
+    def redraw_timeout_cb(self):
+        self.redraw_timeout_id = None
+        if self.get_mapped():
+            self.plot()
+        return False
+
 
+    def map_cb(self, widget):
+        self.plot()
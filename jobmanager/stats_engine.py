@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Histograms of the job adverts registered and of the web sites visited per
+day, week or month.
+
+The database is scanned once (or aggregated by the storage backend) into a
+{(date, category): number of job adverts} dict ; the histograms of any time
+window are then computed from the unique days only.
+
+StatsCounters keeps these counts up to date: each added or edited job advert
+and each job search status change is an O(1) update of the counts of its day.
+"""
+
+import datetime
+
+import job_search_history
+
+PERIOD_LIST = ["day", "week", "month"]
+
+VISIT_STATUS_LIST = ["Full", "Partial"]       # The statuses counted as visits
+
+
+def iso_to_date(date_iso_str):
+    """
+    Convert a "YYYY-MM-DD" string to a datetime.date (faster than strptime).
+    """
+
+    return datetime.date(int(date_iso_str[0:4]), int(date_iso_str[5:7]), int(date_iso_str[8:10]))
+
+
+def bucket_start(date, period):
+    """
+    Return the first day of the bucket (day, week or month) containing date.
+    """
+
+    if period == "day":
+        return date
+    elif period == "week":
+        return date - datetime.timedelta(days=date.weekday())
+    elif period == "month":
+        return date.replace(day=1)
+    else:
+        raise ValueError("Unknown period: {}".format(period))
+
+
+def next_bucket_start(date, period):
+    if period == "day":
+        return date + datetime.timedelta(days=1)
+    elif period == "week":
+        return date + datetime.timedelta(days=7)
+    elif period == "month":
+        if date.month == 12:
+            return date.replace(year=date.year + 1, month=1)
+        return date.replace(month=date.month + 1)
+    else:
+        raise ValueError("Unknown period: {}".format(period))
+
+
+def buckets(first_date, last_date, period):
+    """
+    Return the list of the first days of the buckets between first_date and
+    last_date (included).
+    """
+
+    bucket_list = []
+    date = bucket_start(first_date, period)
+    while date <= last_date:
+        bucket_list.append(date)
+        date = next_bucket_start(date, period)
+    return bucket_list
+
+
+class JobAdvertHistogram(object):
+
+    def __init__(self, count_dict):
+        """
+        count_dict is a {(date, category): number of job adverts} dict with
+        dates in ISO format (see Storage.count_job_adverts()).
+        """
+
+        self.day_counts = {}          # {datetime.date: {category: number of job adverts}}
+        self.category_totals = {}     # {category: number of job adverts}
+
+        for (date_iso_str, category), count in count_dict.items():
+            self.add(date_iso_str, category, count)
+
+
+    def add(self, date_iso_str, category, count=1):
+        """
+        Add count job adverts of category registered on date_iso_str (count
+        is negative to remove them).
+        """
+
+        date = iso_to_date(date_iso_str)
+
+        category_counts = self.day_counts.setdefault(date, {})
+        category_counts[category] = category_counts.get(category, 0) + count
+        if category_counts[category] == 0:
+            del category_counts[category]
+            if len(category_counts) == 0:
+                del self.day_counts[date]
+
+        self.category_totals[category] = self.category_totals.get(category, 0) + count
+        if self.category_totals[category] == 0:
+            del self.category_totals[category]
+
+
+    def categories(self):
+        return sorted(self.category_totals, key=str)
+
+
+    def total(self):
+        return sum(self.category_totals.values())
+
+
+    def histogram_by_category(self, first_date, last_date, period="day"):
+        """
+        Return (bucket_list, {category: count_list}) where count_list[i] is
+        the number of job adverts of category registered in the bucket
+        starting at bucket_list[i].
+        """
+
+        bucket_list = buckets(first_date, last_date, period)
+        bucket_index = {date: index for index, date in enumerate(bucket_list)}
+
+        count_lists = {category: [0] * len(bucket_list) for category in self.category_totals}
+
+        for date, category_counts in self.day_counts.items():
+            if first_date <= date <= last_date:
+                index = bucket_index[bucket_start(date, period)]
+                for category, count in category_counts.items():
+                    count_lists[category][index] += count
+
+        return bucket_list, count_lists
+
+
+class VisitHistogram(object):
+    """
+    Number of web sites visited per day (for each status of
+    VISIT_STATUS_LIST).
+    """
+
+    def __init__(self):
+        self.day_counts = {}          # {ordinal date: {status: number of web sites}}
+
+
+    def add(self, ordinal_date, status, count=1):
+        if status not in VISIT_STATUS_LIST:
+            return
+
+        status_counts = self.day_counts.setdefault(ordinal_date, {})
+        status_counts[status] = status_counts.get(status, 0) + count
+        if status_counts[status] == 0:
+            del status_counts[status]
+            if len(status_counts) == 0:
+                del self.day_counts[ordinal_date]
+
+
+    def histogram_by_status(self, first_date, last_date, period="day"):
+        """
+        Return (bucket_list, {status: count_list}) where count_list[i] is the
+        number of visits with status in the bucket starting at
+        bucket_list[i].
+        """
+
+        bucket_list = buckets(first_date, last_date, period)
+        bucket_index = {date: index for index, date in enumerate(bucket_list)}
+
+        count_lists = {status: [0] * len(bucket_list) for status in VISIT_STATUS_LIST}
+
+        first_ordinal = first_date.toordinal()
+        last_ordinal = last_date.toordinal()
+
+        for ordinal_date, status_counts in self.day_counts.items():
+            if first_ordinal <= ordinal_date <= last_ordinal:
+                index = bucket_index[bucket_start(datetime.date.fromordinal(ordinal_date), period)]
+                for status, count in status_counts.items():
+                    count_lists[status][index] += count
+
+        return bucket_list, count_lists
+
+
+class StatsCounters(object):
+    """
+    The job advert and visit histograms of the database, kept up to date by
+    the model (see JobAdvertsModel.get_stats_counters()).
+
+    version is incremented on each change (the views compare it with the
+    version they have drawn).
+    """
+
+    def __init__(self, count_dict, job_search_iterable):
+        """
+        count_dict is a {(date, category): number of job adverts} dict (see
+        Storage.count_job_adverts()) and job_search_iterable iterates over
+        the (url, {date: status}) items of the job search history.
+        """
+
+        self.version = 0
+
+        self.job_adverts = JobAdvertHistogram(count_dict)
+        self.reset_visits(job_search_iterable)
+
+
+    def reset_visits(self, job_search_iterable):
+        """
+        Count the visits of job_search_iterable again (used when the job
+        search history has been changed by another process: the previous
+        statuses are not known).
+        """
+
+        self.visits = VisitHistogram()
+
+        for url, status_dict in job_search_iterable:
+            for ordinal_date, status in job_search_history.ordinal_items(status_dict):
+                self.visits.add(ordinal_date, status)
+
+        self.version += 1
+
+
+    def job_advert_changed(self, previous_job_advert_dict, job_advert_dict):
+        """
+        Update the counts after a job advert has been added (if
+        previous_job_advert_dict is None) or replaced.
+        """
+
+        if previous_job_advert_dict is not None:
+            if previous_job_advert_dict["date"] == job_advert_dict["date"] and previous_job_advert_dict["category"] == job_advert_dict["category"]:
+                return
+            self.job_adverts.add(previous_job_advert_dict["date"], previous_job_advert_dict["category"], -1)
+
+        self.job_adverts.add(job_advert_dict["date"], job_advert_dict["category"])
+        self.version += 1
+
+
+    def job_search_status_changed(self, date_iso_str, previous_status, status):
+        """
+        Update the counts after the status of a web site has been changed
+        from previous_status (None if it had no status) to status on
+        date_iso_str.
+        """
+
+        if previous_status == status:
+            return
+
+        ordinal_date = iso_to_date(date_iso_str).toordinal()
+        if previous_status is not None:
+            self.visits.add(ordinal_date, previous_status, -1)
+        if status is not None:
+            self.visits.add(ordinal_date, status)
+        self.version += 1
+
+
+class StatsSeries(object):
+    """
+    The series plotted by the Stats tab for one time window (plain lists:
+    they can be read by another thread while the counters are updated).
+    """
+
+    def __init__(self, stats_counters, first_date, last_date, period="day"):
+        """
+        Compute all the series from the days of the job advert and visit
+        counts.
+        """
+
+        self.version = stats_counters.version
+        self.period = period
+
+        # Job adverts per category and in total
+        self.bucket_list, self.category_count_lists = stats_counters.job_adverts.histogram_by_category(first_date, last_date, period)
+        self.category_list = stats_counters.job_adverts.categories()
+        self.total_count_list = [sum(counts) for counts in zip(*self.category_count_lists.values())] if len(self.category_count_lists) > 0 else [0] * len(self.bucket_list)
+
+        # Web sites visited per status
+        self.visit_count_lists = stats_counters.visits.histogram_by_status(first_date, last_date, period)[1]
+
+        self.num_job_adverts = stats_counters.job_adverts.total()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Offscreen rendering of the plots of the Stats tab.
+
+The plots are drawn by the Agg backend of matplotlib (without pyplot: a
+Figure drawn by one thread at a time can be drawn by any thread) into an
+RGBA buffer, so that StatsContainer can draw them on a worker thread and
+display the image from the GTK main loop.
+"""
+
+import collections
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import tracing
+
+DPI = 96
+
+# Number of images kept by RenderCache
+RENDER_CACHE_SIZE = 8
+
+
+@tracing.traced()
+def render(stats_series, width, height, dpi=DPI):
+    """
+    Draw the plots of stats_series (a stats_engine.StatsSeries) in a width x
+    height image. Return (RGBA bytes, width, height).
+    """
+
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+
+    period = stats_series.period
+
+    # Job adverts per category
+    ax = fig.add_subplot(211)
+
+    for category in stats_series.category_list:
+        ax.plot(stats_series.bucket_list, stats_series.category_count_lists[category], label=category)
+
+    ax.plot(stats_series.bucket_list, stats_series.total_count_list, label="Total", linewidth=2)
+
+    ax.set_ylabel("Job adverts per {}".format(period))
+    ax.legend(loc="upper left")
+
+    # Web sites visited
+    visits_ax = fig.add_subplot(212, sharex=ax)
+
+    for status, count_list in stats_series.visit_count_lists.items():
+        visits_ax.plot(stats_series.bucket_list, count_list, label=status)
+
+    visits_ax.set_ylabel("Web sites visited per {}".format(period))
+    visits_ax.legend(loc="upper left")
+
+    fig.autofmt_xdate()
+
+    canvas.draw()
+
+    width, height = canvas.get_width_height()
+    return bytes(canvas.buffer_rgba()), width, height
+
+
+class RenderCache(object):
+    """
+    The last images rendered (least recently used first out). The keys
+    contain the version of the data and the last day plotted, so an image
+    is never out of date.
+    """
+
+    def __init__(self, max_size=RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        self.images = collections.OrderedDict()
+
+
+    def get(self, key):
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+        return image
+
+
+    def put(self, key, image):
+        self.images[key] = image
+        self.images.move_to_end(key)
+        while len(self.images) > self.max_size:
+            self.images.popitem(last=False)
@@ -0,0 +1,1165 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Storage backends of the job adverts database.
+
+Three backends are available:
+
+- JsonStorage: the whole database is kept in memory and saved in
+  "~/job_adverts.json" (with an append-only journal of the last changes) ;
+- SplitStorage: like JsonStorage but the index file
+  "~/job_adverts.index.json" only contains the columns displayed in the job
+  advert lists ; the pros, cons and desc bodies are kept in the blob file
+  "~/job_adverts.blobs" and are read only when they are needed ;
+- SqliteStorage: the database is stored in "~/job_adverts.sqlite" with
+  indexes on url, date, category and organization ; each change is written
+  in its own transaction.
+
+The backend is selected with the JOB_ADVERT_MANAGER_STORAGE environment
+variable ("json", "split" or "sqlite"). When the split or SQLite backend is
+selected for the first time, the existing JSON database is migrated.
+
+Several processes can use the same database at the same time (e.g. the GUI
+and the jobmanager command). With the JSON based backends, the files are read
+with a shared lock and written with an exclusive lock (see the file_lock
+module); the changes are merged per record (see the journal module) and the
+JSON file carries a generation number incremented at each write so that the
+processes know when they must read it again. SQLite does its own locking.
+
+The JSON based backends also keep a binary copy of their JSON file, which is
+much faster to load (see the snapshot_cache module).
+"""
+
+import collections
+import json
+import logging
+import operator
+import os
+import sqlite3
+import threading
+
+import blob_store
+import file_lock
+import job_advert_record
+import job_search_history
+import journal
+import json_stream
+import save_scheduler
+import snapshot_cache
+import tracing
+
+JSON_FILENAME = "~/job_adverts.json"
+SPLIT_INDEX_FILENAME = "~/job_adverts.index.json"
+SPLIT_BLOB_FILENAME = "~/job_adverts.blobs"
+SQLITE_FILENAME = "~/job_adverts.sqlite"
+
+STORAGE_LIST = ["json", "split", "sqlite"]
+STORAGE_ENV_VAR = "JOB_ADVERT_MANAGER_STORAGE"
+DEFAULT_STORAGE = "json"
+
+JOB_ADVERT_FIELDS = ("date", "category", "organization", "title", "score", "pros", "cons", "desc")
+
+# The fields displayed in the job advert lists and the (large) text bodies
+SUMMARY_FIELDS = ("date", "category", "organization", "title", "score")
+BODY_FIELDS = ("pros", "cons", "desc")
+
+# The journal is compacted into the main JSON file when it contains more than
+# JOURNAL_COMPACTION_THRESHOLD records (and when the application is closed)
+JOURNAL_COMPACTION_THRESHOLD = 200
+
+logger = logging.getLogger(__name__)
+
+
+class Storage(object):
+    """
+    The interface implemented by the storage backends.
+
+    Dates are strings in ISO format ("YYYY-MM-DD") and job adverts are
+    mappings with the keys listed in JOB_ADVERT_FIELDS: the backends return
+    job_advert_record.JobAdverts and accept any mapping.
+    """
+
+    # Whether the dicts returned by iter_job_advert_summaries() also contain
+    # the BODY_FIELDS
+    summaries_include_bodies = True
+
+    def iter_job_adverts(self):
+        """
+        Iterate over the (url, job_advert_dict) items of the database.
+        """
+        raise NotImplementedError()
+
+    def iter_job_advert_summaries(self):
+        """
+        Iterate over the (url, summary_dict) items of the database where
+        summary_dict contains at least the keys listed in SUMMARY_FIELDS.
+        """
+        return self.iter_job_adverts()
+
+    def iter_load(self):
+        """
+        Iterate over the (url, summary_dict, progress) items of the database
+        where progress is the fraction (between 0 and 1) of the database
+        loaded so far.
+
+        Backends opened in streaming mode load the database while this
+        iterator is consumed: the other methods must not be used before it
+        is exhausted (except set_job_advert() and has_job_advert()).
+        """
+        num_job_adverts = max(self.num_job_adverts(), 1)
+        for index, (url, summary_dict) in enumerate(self.iter_job_advert_summaries()):
+            yield url, summary_dict, (index + 1) / num_job_adverts
+
+    def get_job_advert(self, url):
+        """
+        Return the job advert dict of "url" (raise KeyError if the database
+        doesn't contain this url).
+        """
+        raise NotImplementedError()
+
+    def has_job_advert(self, url):
+        raise NotImplementedError()
+
+    def num_job_adverts(self):
+        raise NotImplementedError()
+
+    def count_job_adverts(self):
+        """
+        Return a {(date, category): number of job adverts} dict.
+        """
+        return collections.Counter((summary_dict["date"], summary_dict["category"]) for url, summary_dict in self.iter_job_advert_summaries())
+
+    def set_job_advert(self, url, job_advert_dict):
+        raise NotImplementedError()
+
+    def set_job_adverts(self, job_advert_iterable):
+        """
+        Add or replace the (url, job_advert_dict) items of
+        job_advert_iterable in one write (used for bulk imports).
+        """
+        for url, job_advert_dict in job_advert_iterable:
+            self.set_job_advert(url, job_advert_dict)
+
+    def query_job_adverts(self, first_date=None, last_date=None, category_set=None, field_list=JOB_ADVERT_FIELDS):
+        """
+        Iterate over the (url, job_advert_dict) items of the job adverts
+        registered between first_date and last_date (included, None = no
+        limit) whose category is in category_set (None = all categories).
+
+        job_advert_dict only contains the fields of field_list: the bodies
+        are not read if they are not requested.
+        """
+        needs_bodies = not self.summaries_include_bodies and any(field in BODY_FIELDS for field in field_list)
+
+        for url, summary_dict in self.iter_job_advert_summaries():
+            if first_date is not None and summary_dict["date"] < first_date:
+                continue
+            if last_date is not None and summary_dict["date"] > last_date:
+                continue
+            if category_set is not None and summary_dict["category"] not in category_set:
+                continue
+
+            job_advert_dict = self.get_job_advert(url) if needs_bodies else summary_dict
+            yield url, {field: job_advert_dict[field] for field in field_list}
+
+    def iter_job_search_urls(self):
+        raise NotImplementedError()
+
+    def get_job_search_statuses(self, url):
+        """
+        Return the {date: status} mapping of the web site "url" (a
+        job_search_history.JobSearchHistory with the JSON backends).
+        """
+        raise NotImplementedError()
+
+    def get_job_search_status(self, url, date):
+        """
+        Return the status of the web site "url" for the day "date" (or None).
+        """
+        return self.get_job_search_statuses(url).get(date)
+
+    def query_job_searchs(self, first_date=None, last_date=None, url_set=None):
+        """
+        Iterate over the (url, date, status) items of the job search history
+        between first_date and last_date (included, None = no limit) for the
+        web sites of url_set (None = all web sites), sorted by date for each
+        web site.
+        """
+        for url in self.iter_job_search_urls():
+            if url_set is not None and url not in url_set:
+                continue
+
+            for date, status in sorted(self.get_job_search_statuses(url).items()):
+                if first_date is not None and date < first_date:
+                    continue
+                if last_date is not None and date > last_date:
+                    break
+                yield url, date, status
+
+    def set_job_search_status(self, url, date, status):
+        raise NotImplementedError()
+
+    def save(self):
+        """
+        Make sure the last changes will be written on the disk.
+        """
+        pass
+
+    # True if refresh() may read the whole database (it is then called from a
+    # worker thread by the GUI)
+    refresh_in_background = False
+
+    def watched_paths(self):
+        """
+        Return the list of the files modified when the database changes.
+        """
+        return []
+
+    def refresh(self):
+        """
+        Read the changes made by the other processes since the last call and
+        return the set of the urls of the job adverts and the set of the urls
+        of the job search web sites that have changed.
+
+        A set is None when the backend can't tell which records have changed
+        (all of them must be compared).
+        """
+        return set(), set()
+
+    def get_save_stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+def open_storage(name=None, streaming=False):
+    """
+    Open the storage backend "name" ("json", "split" or "sqlite").
+
+    If name is None, the backend is read from the JOB_ADVERT_MANAGER_STORAGE
+    environment variable.
+
+    If streaming is True, the JSON based backends don't load the database
+    here: it is loaded while the iter_load() iterator is consumed.
+    """
+
+    if name is None:
+        name = os.environ.get(STORAGE_ENV_VAR, DEFAULT_STORAGE)
+
+    json_path = os.path.expanduser(JSON_FILENAME)
+    split_index_path = os.path.expanduser(SPLIT_INDEX_FILENAME)
+    split_blob_path = os.path.expanduser(SPLIT_BLOB_FILENAME)
+    sqlite_path = os.path.expanduser(SQLITE_FILENAME)
+
+    if name == "json":
+        return JsonStorage(json_path, streaming)
+    elif name == "split":
+        if not os.path.exists(split_index_path) and os.path.exists(json_path):
+            migrate_json_to_split(json_path, split_index_path, split_blob_path)
+        return SplitStorage(split_index_path, split_blob_path, streaming)
+    elif name == "sqlite":
+        if not os.path.exists(sqlite_path) and os.path.exists(json_path):
+            migrate_json_to_sqlite(json_path, sqlite_path)
+        return SqliteStorage(sqlite_path)
+    else:
+        raise ValueError("Unknown storage backend: {}".format(name))
+
+
+def _file_identity(stat_result):
+    # Changes when the file is replaced or modified
+    return (stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def _get_file_identity(path):
+    try:
+        return _file_identity(os.stat(path))
+    except FileNotFoundError:
+        return None
+
+
+def _read_json_file(path, cache_path=None):
+    """
+    Return the (json_database, generation, file identity, from_cache) of the
+    JSON file "path" (an empty database if the file doesn't exist).
+
+    The database is read from the cache file "cache_path" instead if it is
+    up to date (from_cache is then True, see the snapshot_cache module).
+    """
+
+    if cache_path is not None:
+        key = snapshot_cache.file_key(path)
+        snapshot = snapshot_cache.open_snapshot(cache_path, key)
+        if snapshot is not None:
+            try:
+                job_advert_dict = snapshot.json_database["job_adverts"]
+                for url, job_advert, progress in snapshot.iter_job_adverts():
+                    job_advert_dict[url] = job_advert
+                return snapshot.json_database, snapshot.generation, key[:3], True
+            except ValueError as e:
+                logger.warning("Invalid cache file (%s): the JSON file is read instead", e)
+
+    json_database = {"job_adverts": {}, "job_searchs": {}}
+    identity = None
+    try:
+        with open(path, "r") as fd:
+            identity = _file_identity(os.fstat(fd.fileno()))
+            json_database = json.load(fd)
+    except FileNotFoundError:
+        pass
+
+    generation = json_database.pop("generation", 0)    # Files written by the previous versions have no generation
+
+    job_advert_dict = json_database["job_adverts"]
+    for url, job_advert in job_advert_dict.items():
+        job_advert_dict[url] = job_advert_record.from_dict(job_advert)
+
+    job_search_dict = json_database["job_searchs"]
+    for url, json_value in job_search_dict.items():
+        job_search_dict[url] = job_search_history.from_json(json_value)
+
+    return json_database, generation, identity, False
+
+
+def _peek_generation(text):
+    # The generation is the first member of the JSON files (keys are sorted)
+    scanner = json_stream.ObjectScanner(text)
+    if scanner.next_key() == "generation":
+        return scanner.read_value()
+    return 0
+
+
+def load_json_database(path):
+    """
+    Load the JSON database "path" and replay its journal. Return
+    (json_database, generation, json_journal).
+    """
+
+    with file_lock.FileLock(path + file_lock.LOCK_SUFFIX).shared():
+        json_database, generation, identity, from_cache = _read_json_file(path)
+
+        json_journal = journal.Journal(path + journal.JOURNAL_SUFFIX)
+        json_journal.replay(json_database, generation)
+
+    return json_database, generation, json_journal
+
+
+def migrate_json_to_sqlite(json_path, sqlite_path):
+    """
+    Copy the JSON database "json_path" into a new SQLite database (in a
+    single transaction). The JSON file is left untouched.
+
+    Nothing is done if the SQLite database already exists (e.g. it has been
+    created by another process meanwhile).
+    """
+
+    # Several processes may start the migration at the same time: the
+    # others wait for the first one
+    with file_lock.FileLock(sqlite_path + file_lock.LOCK_SUFFIX).exclusive():
+        if os.path.exists(sqlite_path):
+            return
+
+        json_database, generation, json_journal = load_json_database(json_path)
+
+        fd_num, tmp_path = save_scheduler.create_temporary_file(sqlite_path)
+        os.close(fd_num)
+
+        try:
+            sqlite_storage = SqliteStorage(tmp_path)
+            with sqlite_storage.connection:
+                sqlite_storage.connection.executemany(SqliteStorage.INSERT_JOB_ADVERT_SQL,
+                                                      (_job_advert_row(url, job_advert_dict) for url, job_advert_dict in json_database["job_adverts"].items()))
+                sqlite_storage.connection.executemany(SqliteStorage.INSERT_JOB_SEARCH_SQL,
+                                                      ((url, date, status) for url, job_search_dict in json_database["job_searchs"].items() for date, status in job_search_dict.items()))
+            sqlite_storage.close()
+        except:
+            os.remove(tmp_path)
+            raise
+
+        save_scheduler.replace_file(tmp_path, sqlite_path)
+
+
+def migrate_json_to_split(json_path, index_path, blob_path):
+    """
+    Copy the JSON database "json_path" into a new index file and a new blob
+    file. The JSON file is left untouched.
+
+    Nothing is done if the index file already exists (e.g. it has been
+    created by another process meanwhile).
+    """
+
+    # Taken by SplitStorage too: the other processes wait until both files
+    # are written
+    with file_lock.FileLock(index_path + file_lock.LOCK_SUFFIX).exclusive():
+        if os.path.exists(index_path):
+            return
+
+        json_database, generation, json_journal = load_json_database(json_path)
+
+        # Write the bodies
+        fd_num, tmp_blob_path = save_scheduler.create_temporary_file(blob_path)
+        os.close(fd_num)
+
+        url_list = list(json_database["job_adverts"])
+        body_iterable = ({field: json_database["job_adverts"][url][field] for field in BODY_FIELDS} for url in url_list)
+        try:
+            ref_list = blob_store.BlobStore(tmp_blob_path).put_many(body_iterable)
+        except:
+            os.remove(tmp_blob_path)
+            raise
+
+        save_scheduler.replace_file(tmp_blob_path, blob_path)
+
+        # Write the index
+        index_database = dict(json_database)
+        index_database["job_adverts"] = {url: _job_advert_summary(json_database["job_adverts"][url], ref) for url, ref in zip(url_list, ref_list)}
+
+        save_scheduler.atomic_write_json(index_path, index_database, job_search_history.to_json)
+
+
+def _job_advert_summary(job_advert_dict, body_ref):
+    summary_dict = {field: job_advert_dict[field] for field in SUMMARY_FIELDS}
+    summary_dict["body"] = body_ref
+    return job_advert_record.from_dict(summary_dict)
+
+
+def _job_advert_row(url, job_advert_dict):
+    return (url,) + tuple(job_advert_dict[field] for field in JOB_ADVERT_FIELDS)
+
+
+# JSON ########################################################################
+
+class JsonStorage(Storage):
+
+    def __init__(self, path, streaming=False):
+        self.path = path
+
+        # Shared with the other processes using the database (to be taken
+        # before self.lock)
+        self.file_lock = file_lock.FileLock(path + file_lock.LOCK_SUFFIX)
+
+        self.journal = journal.Journal(path + journal.JOURNAL_SUFFIX)
+
+        self.cache_path = path + snapshot_cache.CACHE_SUFFIX
+        self.cache_thread = None
+
+        if streaming:
+            self.json_database = {"job_adverts": {}, "job_searchs": {}}
+            self.generation = 0
+            self.file_identity = None
+            self.loaded = False
+        else:
+            with self.file_lock.shared():
+                self.json_database, self.generation, self.file_identity, from_cache = _read_json_file(path, self.cache_path)
+                self.journal.replay(self.json_database, self.generation)
+            self.loaded = True
+
+        self.save_requested = False   # A save has been requested during the loading
+
+        # Job adverts set with set_job_adverts() (not written in the journal)
+        # and not saved yet: {url: (previous job advert dict or None, job advert dict)}
+        self.unsaved_job_adverts = {}
+
+        # Changes read from the other processes, returned by refresh()
+        self.changed_job_advert_urls = set()
+        self.changed_job_search_urls = set()
+
+        # The JSON file is written on a worker thread ; self.lock protects
+        # json_database while its snapshot is taken
+        self.lock = threading.Lock()
+        self.save_scheduler = save_scheduler.SaveScheduler(self._write_json_file)
+
+        if self.loaded and not from_cache:
+            self._write_cache_in_background()
+
+
+    def iter_load(self):
+        if self.loaded:
+            yield from super(JsonStorage, self).iter_load()
+            return
+
+        job_advert_dict = self.json_database["job_adverts"]
+
+        # The JSON file (or its cache) and the journal are read together (the
+        # JSON file is then parsed from memory, without the lock)
+        with self.file_lock.shared():
+            cache_key = snapshot_cache.file_key(self.path)
+            snapshot = snapshot_cache.open_snapshot(self.cache_path, cache_key)
+
+            if snapshot is not None:
+                text = None
+                self.file_identity = cache_key[:3]
+                self.generation = snapshot.generation
+            else:
+                text, self.file_identity = self._read_text()
+                self.generation = _peek_generation(text)
+
+            # The journal contains the most recent version of the job adverts
+            # it mentions: it is replayed first and these job adverts are
+            # skipped when they are read from the JSON file
+            self.journal.replay(self.json_database, self.generation)
+
+        for url, summary_dict in list(job_advert_dict.items()):
+            yield url, summary_dict, 0.
+
+        from_cache = snapshot is not None
+
+        if from_cache:
+            try:
+                for url, summary_dict, progress in snapshot.iter_job_adverts():
+                    if url not in job_advert_dict:
+                        job_advert_dict[url] = summary_dict
+                        yield url, summary_dict, progress
+            except ValueError as e:
+                # Read the rest from the JSON file (if it has changed
+                # meanwhile, it is reloaded by the _sync() below)
+                logger.warning("Invalid cache file (%s): the JSON file is read instead", e)
+                from_cache = False
+                with self.file_lock.shared():
+                    text = self._read_text()[0]
+            else:
+                for key, value in snapshot.json_database.items():
+                    if key == "job_searchs":
+                        self._merge_loaded_job_searchs(value)
+                    elif key != "job_adverts":
+                        self.json_database.setdefault(key, value)
+
+        scanner = json_stream.ObjectScanner(text if text is not None else "{}")
+        while True:
+            key = scanner.next_key()
+            if key is None:
+                break
+
+            if key == "job_adverts":
+                job_advert_scanner = scanner.enter_object()
+                while True:
+                    url = job_advert_scanner.next_key()
+                    if url is None:
+                        break
+                    summary_dict = job_advert_record.from_dict(job_advert_scanner.read_value())
+                    if url not in job_advert_dict:        # Job adverts added or edited since the loading started are kept
+                        job_advert_dict[url] = summary_dict
+                        yield url, summary_dict, job_advert_scanner.idx / len(text)
+                scanner.leave_object(job_advert_scanner)
+            elif key == "job_searchs":
+                self._merge_loaded_job_searchs(scanner.read_value())
+            elif key == "generation":
+                scanner.read_value()
+            else:
+                value = scanner.read_value()
+                self.json_database.setdefault(key, value)
+
+        self.loaded = True
+
+        # Changes made by the other processes during the loading
+        with self.file_lock.shared():
+            with self.lock:
+                self._sync()
+
+        if self.save_requested or len(self.journal) >= JOURNAL_COMPACTION_THRESHOLD:
+            self.save()                                 # The cache is written too
+        elif not from_cache:
+            self._write_cache_in_background()
+
+
+    def _read_text(self):
+        # Return the content and the identity of the JSON file
+        try:
+            with open(self.path, "r") as fd:
+                return fd.read(), _file_identity(os.fstat(fd.fileno()))
+        except FileNotFoundError:
+            return "{}", None
+
+
+    def _merge_loaded_job_searchs(self, job_search_dict):
+        for url, json_value in job_search_dict.items():
+            job_search_dict[url] = job_search_history.from_json(json_value)
+
+        # The statuses replayed from the journal are more recent
+        for url, status_dict in self.json_database["job_searchs"].items():
+            for date, status in status_dict.items():
+                job_search_history.set_status(job_search_dict, url, date, status)
+
+        self.json_database["job_searchs"] = job_search_dict
+
+
+    def iter_job_adverts(self):
+        # The items are copied: the database may change during the iteration
+        # (e.g. when it is made in several GLib idle callbacks)
+        return iter(list(self.json_database["job_adverts"].items()))
+
+
+    def get_job_advert(self, url):
+        return self.json_database["job_adverts"][url]
+
+
+    def has_job_advert(self, url):
+        return url in self.json_database["job_adverts"]
+
+
+    def num_job_adverts(self):
+        return len(self.json_database["job_adverts"])
+
+
+    def count_job_adverts(self):
+        # The (ordinal date, category) pairs of the JobAdvert records are
+        # counted by the C loop of Counter (about 5 times faster than the
+        # generic version), then the few thousand keys are converted
+        summary_list = list(self.json_database["job_adverts"].values())
+        try:
+            ordinal_counts = collections.Counter(zip(map(operator.attrgetter("date_ordinal"), summary_list),
+                                                     map(operator.attrgetter("category"), summary_list)))
+        except AttributeError:
+            # Some job adverts are kept as dicts (see job_advert_record.from_dict())
+            return super(JsonStorage, self).count_job_adverts()
+
+        return {(job_advert_record.ordinal_to_date(date_ordinal), category): count for (date_ordinal, category), count in ordinal_counts.items()}
+
+
+    def set_job_advert(self, url, job_advert_dict):
+        record = {"op": journal.SET_JOB_ADVERT, "url": url, "job_advert": job_advert_record.from_dict(job_advert_dict)}
+        self._apply(record)
+
+
+    def iter_job_search_urls(self):
+        return iter(self.json_database["job_searchs"])
+
+
+    def get_job_search_statuses(self, url):
+        return self.json_database["job_searchs"].get(url, {})
+
+
+    def set_job_search_status(self, url, date, status):
+        record = {"op": journal.SET_JOB_SEARCH_STATUS, "url": url, "date": date, "status": status}
+        self._apply(record)
+
+
+    def set_job_adverts(self, job_advert_iterable):
+        # The job adverts are not written in the journal: the whole database
+        # is saved once (they are merged with the changes of the other
+        # processes at that time)
+        num_job_adverts = 0
+
+        with self.lock:
+            job_advert_dict = self.json_database["job_adverts"]
+            for url, new_job_advert_dict in job_advert_iterable:
+                new_job_advert_dict = job_advert_record.from_dict(new_job_advert_dict)
+                previous_job_advert_dict = self.unsaved_job_adverts.get(url, (job_advert_dict.get(url),))[0]
+                self.unsaved_job_adverts[url] = (previous_job_advert_dict, new_job_advert_dict)
+                job_advert_dict[url] = new_job_advert_dict
+                num_job_adverts += 1
+
+        if num_job_adverts > 0:
+            self.save()
+
+
+    def _apply(self, record):
+        # Called on the GTK main thread: if another process has rewritten the
+        # JSON file, it is read again later by refresh() (on a worker thread
+        # in the GUI) or by the next save, not here. The record is appended
+        # to the current journal file anyway, so it is kept by the reload.
+        with self.file_lock.exclusive():
+            with self.lock:
+                # The records of the other processes are applied first (the
+                # last record written wins)
+                if self.loaded:
+                    self._sync(defer_reload=True)
+                journal.apply_record(self.json_database, record)
+                self.journal.append(record)
+                num_journal_records = len(self.journal)
+
+        if num_journal_records >= JOURNAL_COMPACTION_THRESHOLD:
+            self.save()
+
+
+    def _sync(self, defer_reload=False):
+        """
+        Apply the changes written by the other processes (to be called with
+        the file lock and self.lock).
+
+        If defer_reload is True and the JSON file has been rewritten, it is
+        not read again: the database is left as it is until the next call.
+        """
+
+        # The JSON file may also be written by other tools
+        if _get_file_identity(self.path) != self.file_identity:
+            if not defer_reload:
+                self._reload()
+            return
+
+        record_list = self.journal.read_new_records()
+
+        if record_list is None:
+            if not defer_reload:
+                self._reload()
+            return
+
+        for record in record_list:
+            journal.apply_record(self.json_database, record)
+            if record["op"] == journal.SET_JOB_ADVERT:
+                self.changed_job_advert_urls.add(record["url"])
+            elif record["op"] == journal.SET_JOB_SEARCH_STATUS:
+                self.changed_job_search_urls.add(record["url"])
+
+
+    def _reload(self):
+        # Another process has rewritten the JSON file: read it again and
+        # merge the job adverts not saved yet
+        json_database, generation, identity, from_cache = _read_json_file(self.path, self.cache_path)
+
+        # A tool unaware of the journal may have written the file without
+        # changing (or keeping) the generation: the journal still applies
+        generation = max(generation, self.generation)
+        self.journal.replay(json_database, generation)
+
+        job_advert_dict = json_database["job_adverts"]
+
+        for url, (previous_job_advert_dict, new_job_advert_dict) in self.unsaved_job_adverts.items():
+            current_job_advert_dict = job_advert_dict.get(url)
+            if current_job_advert_dict not in (previous_job_advert_dict, new_job_advert_dict):
+                logger.warning("%s has been changed by another process: the local version is kept", url)
+            job_advert_dict[url] = new_job_advert_dict
+
+        # The job adverts that have not changed are kept (they may be
+        # referenced, e.g. by the GUI)
+        previous_job_advert_dict = self.json_database["job_adverts"]
+        for url, summary_dict in job_advert_dict.items():
+            previous_summary_dict = previous_job_advert_dict.get(url)
+            if previous_summary_dict == summary_dict:
+                job_advert_dict[url] = previous_summary_dict
+            else:
+                self.changed_job_advert_urls.add(url)
+
+        previous_job_search_dict = self.json_database["job_searchs"]
+        for url, status_dict in json_database["job_searchs"].items():
+            if previous_job_search_dict.get(url) != status_dict:
+                self.changed_job_search_urls.add(url)
+
+        self.json_database = json_database
+        self.generation = generation
+        self.file_identity = identity
+
+        logger.info("Database reloaded (generation %d written by another process)", generation)
+
+
+    refresh_in_background = True
+
+    def watched_paths(self):
+        return [self.path, self.journal.path]
+
+
+    def refresh(self):
+        if not self.loaded:
+            return set(), set()
+
+        with self.file_lock.shared():
+            with self.lock:
+                self._sync()
+                changes = (self.changed_job_advert_urls, self.changed_job_search_urls)
+                self.changed_job_advert_urls = set()
+                self.changed_job_search_urls = set()
+
+        return changes
+
+
+    def save(self):
+        """
+        Schedule the compaction of the journal into the JSON file.
+
+        The file is written later on a worker thread (several calls made in a
+        short time are merged into one write). A partially loaded database
+        is never written: the save is postponed until the end of the loading.
+        """
+
+        if not self.loaded:
+            self.save_requested = True
+            return
+
+        self.save_scheduler.schedule()
+
+
+    @tracing.traced()
+    def _write_json_file(self):
+        # Called on the save scheduler's worker thread
+
+        while True:
+            with self.file_lock.exclusive():
+                with self.lock:
+                    self._sync()
+                    if self.journal.stale:
+                        self.journal.replace_stale_file()
+
+                    generation = self.generation + 1
+                    snapshot = self._copy_database()
+                    snapshot["generation"] = generation
+                    saved_job_adverts = dict(self.unsaved_job_adverts)
+                    file_identity = self.file_identity
+                    journal_offset = self.journal.offset      # End of the records included in the snapshot
+
+            # The JSON file is dumped without the lock: the other processes
+            # (and the GTK main thread) can read the database and append to
+            # the journal meanwhile
+            tmp_path = save_scheduler.write_temporary_json(self.path, snapshot, job_search_history.to_json)
+
+            # The lock is only held to rename the files
+            try:
+                with self.file_lock.exclusive():
+                    with self.lock:
+                        self._sync()
+
+                        up_to_date = (self.file_identity == file_identity and self.generation == generation - 1)
+                        if up_to_date:
+                            # The records appended during the dump go to the
+                            # journal of the new generation
+                            self.journal.write_pending(generation, self.journal.read_records(journal_offset))
+                            save_scheduler.replace_file(tmp_path, self.path)
+                            self.journal.commit_pending(generation)
+
+                            self.file_identity = file_identity = _get_file_identity(self.path)
+                            self.generation = generation
+                            for url, item in saved_job_adverts.items():
+                                if self.unsaved_job_adverts.get(url) is item:
+                                    del self.unsaved_job_adverts[url]
+            except:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            if up_to_date:
+                break
+
+            # Another process has rewritten the JSON file during the dump (it
+            # has been read again by _sync()): save again
+            os.remove(tmp_path)
+            logger.info("Database rewritten by another process during the save: saving again")
+
+        # The other processes don't need to wait for the cache
+        self._write_cache(snapshot, generation, file_identity)
+
+
+    def _copy_database(self):
+        # To be called with self.lock. Job adverts are replaced, never
+        # modified in place, but the job search dicts are updated in place:
+        # they are copied too.
+        json_database = dict(self.json_database)
+        json_database["job_adverts"] = dict(self.json_database["job_adverts"])
+        json_database["job_searchs"] = {url: job_search_dict.copy() for url, job_search_dict in self.json_database["job_searchs"].items()}
+        return json_database
+
+
+    def _write_cache_in_background(self):
+        """
+        Write the cache of the JSON file (after it has been read) on a worker
+        thread.
+        """
+
+        # The cache must not contain the job adverts that are neither in the
+        # JSON file nor in the journal
+        with self.lock:
+            json_database = self._copy_database()
+            for url, (previous_job_advert_dict, new_job_advert_dict) in self.unsaved_job_adverts.items():
+                if previous_job_advert_dict is None:
+                    del json_database["job_adverts"][url]
+                else:
+                    json_database["job_adverts"][url] = previous_job_advert_dict
+            generation = self.generation
+            file_identity = self.file_identity
+
+        self.cache_thread = threading.Thread(target=self._write_cache, args=(json_database, generation, file_identity))
+        self.cache_thread.start()
+
+
+    @tracing.traced()
+    def _write_cache(self, json_database, generation, file_identity):
+        # Skipped if the JSON file has been replaced since json_database was
+        # read from it
+        key = snapshot_cache.file_key(self.path)
+        if key is None or key[:3] != file_identity:
+            return
+
+        try:
+            snapshot_cache.write_snapshot(self.cache_path, key, generation, json_database)
+        except OSError as e:
+            logger.warning("Can't write the cache file %s: %s", self.cache_path, e)
+
+
+    def get_save_stats(self):
+        return self.save_scheduler.get_stats()
+
+
+    def close(self):
+        """
+        Compact the journal into the main JSON file if needed and wait until
+        it is written.
+        """
+
+        if len(self.journal) > 0 or len(self.unsaved_job_adverts) > 0:
+            self.save()
+
+        self.save_scheduler.stop()
+
+        if self.cache_thread is not None:
+            self.cache_thread.join()
+
+
+# Split index + blob store ####################################################
+
+class SplitStorage(JsonStorage):
+    """
+    The index file is handled like the JSON database of JsonStorage (journal +
+    background saving) but its job advert dicts contain the SUMMARY_FIELDS
+    and a "body" [offset, length] reference in the blob file instead of the
+    BODY_FIELDS.
+
+    The blob file is append-only: when a job advert is edited, its new body
+    is appended and the previous one is left unreferenced.
+    """
+
+    summaries_include_bodies = False
+
+    def __init__(self, index_path, blob_path, streaming=False):
+        super(SplitStorage, self).__init__(index_path, streaming)
+        self.blob_store = blob_store.BlobStore(blob_path)
+
+
+    def iter_job_adverts(self):
+        for url, summary_dict in self.iter_job_advert_summaries():
+            yield url, self._get_job_advert_from_summary(summary_dict)
+
+
+    def iter_job_advert_summaries(self):
+        return iter(list(self.json_database["job_adverts"].items()))
+
+
+    def get_job_advert(self, url):
+        return self._get_job_advert_from_summary(self.json_database["job_adverts"][url])
+
+
+    def _get_job_advert_from_summary(self, summary_dict):
+        job_advert_dict = {field: summary_dict[field] for field in SUMMARY_FIELDS}
+        job_advert_dict.update(self.blob_store.get(summary_dict["body"]))
+        return job_advert_record.from_dict(job_advert_dict)
+
+
+    def set_job_advert(self, url, job_advert_dict):
+        # The blob file is shared with the other processes: the offset of the
+        # body is only known while the exclusive lock is held
+        with self.file_lock.exclusive():
+            body_ref = self.blob_store.put({field: job_advert_dict[field] for field in BODY_FIELDS})
+            super(SplitStorage, self).set_job_advert(url, _job_advert_summary(job_advert_dict, body_ref))
+
+
+    def set_job_adverts(self, job_advert_iterable):
+        job_advert_list = list(job_advert_iterable)
+        with self.file_lock.exclusive():
+            body_ref_list = self.blob_store.put_many({field: job_advert_dict[field] for field in BODY_FIELDS} for url, job_advert_dict in job_advert_list)
+        super(SplitStorage, self).set_job_adverts((url, _job_advert_summary(job_advert_dict, body_ref))
+                                                  for (url, job_advert_dict), body_ref in zip(job_advert_list, body_ref_list))
+
+
+# SQLite ######################################################################
+
+class SqliteStorage(Storage):
+
+    summaries_include_bodies = False
+
+    SCHEMA_SQL = """
+        CREATE TABLE IF NOT EXISTS job_adverts (
+            url TEXT PRIMARY KEY,
+            date TEXT NOT NULL,
+            category TEXT,
+            organization TEXT,
+            title TEXT,
+            score INTEGER,
+            pros TEXT,
+            cons TEXT,
+            "desc" TEXT
+        );
+        -- Covers count_job_adverts() (and the date ranges)
+        DROP INDEX IF EXISTS job_adverts_date_index;
+        CREATE INDEX IF NOT EXISTS job_adverts_date_category_index ON job_adverts (date, category);
+        CREATE INDEX IF NOT EXISTS job_adverts_category_index ON job_adverts (category);
+        CREATE INDEX IF NOT EXISTS job_adverts_organization_index ON job_adverts (organization);
+
+        CREATE TABLE IF NOT EXISTS job_searchs (
+            url TEXT NOT NULL,
+            date TEXT NOT NULL,
+            status TEXT NOT NULL,
+            PRIMARY KEY (url, date)
+        );
+        CREATE INDEX IF NOT EXISTS job_searchs_status_index ON job_searchs (url, status, date);
+    """
+
+    # "desc" is a SQL keyword: column names are quoted
+    COLUMNS_SQL = ", ".join('"{}"'.format(field) for field in JOB_ADVERT_FIELDS)
+
+    INSERT_JOB_ADVERT_SQL = "INSERT OR REPLACE INTO job_adverts (url, {}) VALUES (?, {})".format(COLUMNS_SQL,
+                                                                                                 ", ".join("?" * len(JOB_ADVERT_FIELDS)))
+    INSERT_JOB_SEARCH_SQL = "INSERT OR REPLACE INTO job_searchs (url, date, status) VALUES (?, ?, ?)"
+
+    SELECT_JOB_ADVERT_SQL = "SELECT url, {} FROM job_adverts".format(COLUMNS_SQL)
+    SELECT_SUMMARY_SQL = "SELECT url, {} FROM job_adverts".format(", ".join('"{}"'.format(field) for field in SUMMARY_FIELDS))
+
+    def __init__(self, path):
+        self.path = path
+
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.executescript(self.SCHEMA_SQL)
+
+        # Changed by the commits of the other connections
+        self.data_version = self._get_data_version()
+
+
+    def _get_data_version(self):
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+
+    def watched_paths(self):
+        return [self.path]
+
+
+    def refresh(self):
+        # SQLite tells whether the database has changed, not what has changed
+        data_version = self._get_data_version()
+        if data_version == self.data_version:
+            return set(), set()
+
+        self.data_version = data_version
+        return None, None
+
+
+    def _row_to_job_advert(self, row):
+        return row[0], job_advert_record.from_dict(dict(zip(JOB_ADVERT_FIELDS, row[1:])))
+
+
+    def iter_job_adverts(self):
+        for row in self.connection.execute(self.SELECT_JOB_ADVERT_SQL):
+            yield self._row_to_job_advert(row)
+
+
+    def iter_job_advert_summaries(self):
+        for row in self.connection.execute(self.SELECT_SUMMARY_SQL):
+            yield row[0], job_advert_record.from_dict(dict(zip(SUMMARY_FIELDS, row[1:])))
+
+
+    def get_job_advert(self, url):
+        row = self.connection.execute(self.SELECT_JOB_ADVERT_SQL + " WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        return self._row_to_job_advert(row)[1]
+
+
+    def has_job_advert(self, url):
+        row = self.connection.execute("SELECT 1 FROM job_adverts WHERE url = ?", (url,)).fetchone()
+        return row is not None
+
+
+    def num_job_adverts(self):
+        return self.connection.execute("SELECT COUNT(*) FROM job_adverts").fetchone()[0]
+
+
+    def count_job_adverts(self):
+        cursor = self.connection.execute("SELECT date, category, COUNT(*) FROM job_adverts GROUP BY date, category")
+        return {(date, category): count for (date, category, count) in cursor}
+
+
+    def set_job_advert(self, url, job_advert_dict):
+        with self.connection:
+            self.connection.execute(self.INSERT_JOB_ADVERT_SQL, _job_advert_row(url, job_advert_dict))
+
+
+    def set_job_adverts(self, job_advert_iterable):
+        # One transaction
+        with self.connection:
+            self.connection.executemany(self.INSERT_JOB_ADVERT_SQL,
+                                        (_job_advert_row(url, job_advert_dict) for url, job_advert_dict in job_advert_iterable))
+
+
+    def query_job_adverts(self, first_date=None, last_date=None, category_set=None, field_list=JOB_ADVERT_FIELDS):
+        for field in field_list:
+            if field not in JOB_ADVERT_FIELDS:
+                raise ValueError("Unknown job advert field: {}".format(field))
+
+        where_list, parameter_list = [], []
+
+        if first_date is not None:
+            where_list.append("date >= ?")
+            parameter_list.append(first_date)
+        if last_date is not None:
+            where_list.append("date <= ?")
+            parameter_list.append(last_date)
+        if category_set is not None:
+            where_list.append("category IN ({})".format(", ".join("?" * len(category_set))))
+            parameter_list.extend(category_set)
+
+        sql = "SELECT url, {} FROM job_adverts".format(", ".join('"{}"'.format(field) for field in field_list))
+        if len(where_list) > 0:
+            sql += " WHERE " + " AND ".join(where_list)
+
+        for row in self.connection.execute(sql, parameter_list):
+            yield row[0], dict(zip(field_list, row[1:]))
+
+
+    def iter_job_search_urls(self):
+        for row in self.connection.execute("SELECT DISTINCT url FROM job_searchs"):
+            yield row[0]
+
+
+    def get_job_search_statuses(self, url):
+        return dict(self.connection.execute("SELECT date, status FROM job_searchs WHERE url = ?", (url,)))
+
+
+    def get_job_search_status(self, url, date):
+        row = self.connection.execute("SELECT status FROM job_searchs WHERE url = ? AND date = ?", (url, date)).fetchone()
+        return None if row is None else row[0]
+
+
+    def query_job_searchs(self, first_date=None, last_date=None, url_set=None):
+        where_list, parameter_list = [], []
+
+        if first_date is not None:
+            where_list.append("date >= ?")
+            parameter_list.append(first_date)
+        if last_date is not None:
+            where_list.append("date <= ?")
+            parameter_list.append(last_date)
+        if url_set is not None:
+            where_list.append("url IN ({})".format(", ".join("?" * len(url_set))))
+            parameter_list.extend(url_set)
+
+        sql = "SELECT url, date, status FROM job_searchs"
+        if len(where_list) > 0:
+            sql += " WHERE " + " AND ".join(where_list)
+        sql += " ORDER BY url, date"
+
+        return iter(self.connection.execute(sql, parameter_list))
+
+
+    def set_job_search_status(self, url, date, status):
+        with self.connection:
+            self.connection.execute(self.INSERT_JOB_SEARCH_SQL, (url, date, status))
+
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Lightweight tracing of the slow parts of the application (database
+loading and saving, tab construction, GTK callbacks, ...).
+
+Tracing is disabled by default. It is enabled with the
+JOB_ADVERT_MANAGER_TRACE environment variable or the --trace command line
+option:
+
+- "summary" (or "1"): print a table of the spans (count, total, mean and
+  max durations) on the standard error at exit ;
+- any other value: the path of a Chrome trace file written at exit (open it
+  in chrome://tracing or https://ui.perfetto.dev).
+
+Usage:
+
+    @tracing.traced("model.save")
+    def save(self):
+        ...
+
+    with tracing.span("model.load"):
+        ...
+
+When tracing is disabled, span() returns a shared no-op context manager and
+the traced() wrappers only test a global variable.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+TRACE_ENV_VAR = "JOB_ADVERT_MANAGER_TRACE"
+SUMMARY_OUTPUT_LIST = ["summary", "1"]
+
+# The active Tracer (None when tracing is disabled)
+_tracer = None
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.events = []             # (name, start time, end time, thread id) (list.append is thread safe)
+        self.origin = time.perf_counter()
+
+
+    def record(self, name, start_time, end_time):
+        self.events.append((name, start_time, end_time, threading.get_ident()))
+
+
+    def write_chrome_trace(self, path):
+        """
+        Write the spans in the Chrome trace event format.
+        """
+
+        pid = os.getpid()
+        event_list = [{"name": name,
+                       "ph": "X",
+                       "ts": (start_time - self.origin) * 1e6,
+                       "dur": (end_time - start_time) * 1e6,
+                       "pid": pid,
+                       "tid": thread_id}
+                      for name, start_time, end_time, thread_id in self.events]
+
+        with open(path, "w") as fd:
+            json.dump({"traceEvents": event_list, "displayTimeUnit": "ms"}, fd)
+
+
+    def summary(self):
+        """
+        Return a table (a str) of the spans sorted by total duration.
+        """
+
+        duration_dict = {}       # {name: [durations]}
+        for name, start_time, end_time, thread_id in self.events:
+            duration_dict.setdefault(name, []).append(end_time - start_time)
+
+        line_list = ["{:<40} {:>8} {:>11} {:>11} {:>11}".format("span", "count", "total (ms)", "mean (ms)", "max (ms)")]
+        for name, duration_list in sorted(duration_dict.items(), key=lambda item: sum(item[1]), reverse=True):
+            total = sum(duration_list)
+            line_list.append("{:<40} {:>8} {:>11.2f} {:>11.2f} {:>11.2f}".format(name, len(duration_list), total * 1e3,
+                                                                                 total / len(duration_list) * 1e3, max(duration_list) * 1e3))
+
+        return "\n".join(line_list)
+
+
+class _Span(object):
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.record(self.name, self.start_time, time.perf_counter())
+        return False
+
+
+class _NoOpSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NO_OP_SPAN = _NoOpSpan()
+
+
+def enable(output="summary"):
+    """
+    Start tracing: the spans are written to output (see the module
+    documentation) when the process exits.
+    """
+
+    global _tracer
+
+    if _tracer is not None:
+        return
+
+    _tracer = Tracer()
+    atexit.register(_dump, _tracer, output)
+
+
+def enable_from_environment():
+    output = os.environ.get(TRACE_ENV_VAR)
+    if output:
+        enable(output)
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def _dump(tracer, output):
+    if output in SUMMARY_OUTPUT_LIST:
+        print(tracer.summary(), file=sys.stderr)
+    else:
+        tracer.write_chrome_trace(output)
+        print("Trace written in {}".format(output), file=sys.stderr)
+
+
+def span(name):
+    """
+    Return a context manager recording a span named name.
+    """
+
+    if _tracer is None:
+        return _NO_OP_SPAN
+    return _Span(_tracer, name)
+
+
+def now():
+    return time.perf_counter()
+
+
+def record(name, start_time):
+    """
+    Record a span from start_time (given by now()) to now, for spans that
+    don't fit in a with block (e.g. a loading made of several callbacks).
+    """
+
+    if _tracer is not None:
+        _tracer.record(name, start_time, time.perf_counter())
+
+
+def traced(name=None):
+    """
+    Decorator recording a span at each call of the function (named after
+    the function by default).
+    """
+
+    def decorator(function):
+        span_name = function.__qualname__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _tracer.record(span_name, start_time, time.perf_counter())
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Checks made before a job advert is saved (from the GUI or by the importer).
+"""
+
+import category_list
+
+SCORE_RANGE = range(6)
+DEFAULT_SCORE = 5
+
+
+def check_job_advert(url, category, score, is_duplicate=False):
+    """
+    Return the list of the error messages for this job advert (an empty list
+    if it is valid).
+
+    is_duplicate tells whether the database already contains url.
+    """
+
+    error_msg_list = []
+
+    if category is None:
+        error_msg_list.append("You must select a category.")
+    elif category not in category_list.CATEGORY_LIST:
+        error_msg_list.append("The category must be one of: {}.".format(", ".join(category_list.CATEGORY_LIST)))
+
+    if len(url) == 0:
+        error_msg_list.append("You must enter an url.")
+    elif is_duplicate:
+        error_msg_list.append("This job advert already exists in the database.")
+
+    try:
+        if score not in SCORE_RANGE:
+            error_msg_list.append("The score must be a number between 0 and 5.")
+    except:
+        error_msg_list.append("The score must be a number between 0 and 5.")
+
+    return error_msg_list
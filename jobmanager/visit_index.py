@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Index of the visit dates of the job search web sites.
+
+For each web site and each status, the index keeps the sorted list of the
+ordinal dates (see datetime.date.toordinal()) the web site had this status.
+The last visit is the last item of these lists and today's status change is
+an append (or a pop) at the end of a list.
+"""
+
+import bisect
+import datetime
+
+import job_search_history
+
+
+def iso_to_ordinal(date_iso_str):
+    """
+    Convert a "YYYY-MM-DD" string to an ordinal date (faster than strptime).
+    """
+
+    return datetime.date(int(date_iso_str[0:4]), int(date_iso_str[5:7]), int(date_iso_str[8:10])).toordinal()
+
+
+class VisitIndex(object):
+
+    def __init__(self):
+        self.ordinal_dates = {}        # {url: {status: sorted list of ordinal dates}}
+
+
+    def add_web_site(self, url, status_dict):
+        """
+        Index the {date: status} history of the web site "url" (the invalid
+        dates are skipped).
+        """
+
+        status_ordinal_dates = {}
+        for ordinal_date, status in job_search_history.ordinal_items(status_dict):
+            status_ordinal_dates.setdefault(status, []).append(ordinal_date)
+
+        for ordinal_date_list in status_ordinal_dates.values():
+            ordinal_date_list.sort()
+
+        self.ordinal_dates[url] = status_ordinal_dates
+
+
+    def set_status(self, url, date_iso_str, status, previous_status=None):
+        """
+        Update the index when the status of "url" for the day date_iso_str
+        changes from previous_status (None if this day had no status) to
+        status.
+        """
+
+        ordinal_date = iso_to_ordinal(date_iso_str)
+        status_ordinal_dates = self.ordinal_dates.setdefault(url, {})
+
+        if previous_status is not None:
+            ordinal_date_list = status_ordinal_dates.get(previous_status, [])
+            if len(ordinal_date_list) > 0 and ordinal_date_list[-1] == ordinal_date:
+                ordinal_date_list.pop()                   # Usual case: today
+            else:
+                index = bisect.bisect_left(ordinal_date_list, ordinal_date)
+                if index < len(ordinal_date_list) and ordinal_date_list[index] == ordinal_date:
+                    del ordinal_date_list[index]
+
+        ordinal_date_list = status_ordinal_dates.setdefault(status, [])
+        if len(ordinal_date_list) == 0 or ordinal_date_list[-1] < ordinal_date:
+            ordinal_date_list.append(ordinal_date)        # Usual case: today
+        else:
+            index = bisect.bisect_left(ordinal_date_list, ordinal_date)
+            if index == len(ordinal_date_list) or ordinal_date_list[index] != ordinal_date:
+                ordinal_date_list.insert(index, ordinal_date)
+
+
+    def get_last_visit_date(self, url, status_list):
+        """
+        Return the last date (a datetime.date) the web site "url" had one of
+        the statuses of status_list or None.
+        """
+
+        status_ordinal_dates = self.ordinal_dates.get(url, {})
+
+        last_ordinal_date = max((status_ordinal_dates[status][-1] for status in status_list if len(status_ordinal_dates.get(status, [])) > 0),
+                                default=None)
+
+        if last_ordinal_date is None:
+            return None
+
+        return datetime.date.fromordinal(last_ordinal_date)
@@ -76,6 +76,9 @@ SCRIPTS = []
 # Syntax: "name_of_the_command_to_make = package.module:function".
 #ENTRY_POINTS = {}
 ENTRY_POINTS = {
+  'console_scripts': [
+      'jobmanager = jobmanager.cli:main',
+  ],
   'gui_scripts': [
       'job-advert-manager = jobmanager.job_advert_manager:main',
   ],
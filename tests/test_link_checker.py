@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Tests of the link_checker module against a local http.server.
+
+Run from the root of the repository:
+
+    python3 -m unittest discover tests
+"""
+
+import http.server
+import os
+import sys
+import threading
+import time
+import unittest
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "jobmanager"))
+
+import link_checker
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    /ok            200 with an ETag and a Last-Modified date (304 if they are
+                   sent back)
+    /missing       404
+    /gone          410
+    /redirect      301 to /ok
+    /loop          302 to itself
+    /get-only      405 for HEAD, 200 for GET
+    /slow?delay=S  200 after S seconds
+    """
+
+    protocol_version = "HTTP/1.1"       # Keep-alive
+
+    def setup(self):
+        super(_Handler, self).setup()
+        with self.server.stats_lock:
+            self.server.num_connections += 1
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def _send(self, http_status, headers=()):
+        self.send_response(http_status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+    def do_HEAD(self):
+        self._handle()
+
+
+    def do_GET(self):
+        self._handle()
+
+
+    def _handle(self):
+        url_parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url_parts.query)
+
+        with self.server.stats_lock:
+            self.server.requests.append((self.command, self.path, dict(self.headers)))
+            self.server.num_active_requests += 1
+            self.server.max_active_requests = max(self.server.max_active_requests, self.server.num_active_requests)
+
+        try:
+            if url_parts.path == "/ok":
+                if self.headers.get("If-None-Match") == ETAG or self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                    self._send(304)
+                else:
+                    self._send(200, [("ETag", ETAG), ("Last-Modified", LAST_MODIFIED)])
+            elif url_parts.path == "/missing":
+                self._send(404)
+            elif url_parts.path == "/gone":
+                self._send(410)
+            elif url_parts.path == "/redirect":
+                self._send(301, [("Location", "/ok")])
+            elif url_parts.path == "/loop":
+                self._send(302, [("Location", "/loop")])
+            elif url_parts.path == "/get-only":
+                self._send(405 if self.command == "HEAD" else 200)
+            elif url_parts.path == "/slow":
+                time.sleep(float(query["delay"][0]))
+                self._send(200)
+            else:
+                self._send(500)
+        finally:
+            with self.server.stats_lock:
+                self.server.num_active_requests -= 1
+
+
+class _Server(object):
+
+    def __init__(self):
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stats_lock = threading.Lock()
+        self.httpd.num_connections = 0
+        self.httpd.num_active_requests = 0
+        self.httpd.max_active_requests = 0
+        self.httpd.requests = []
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+
+    def url(self, path):
+        return "http://127.0.0.1:{}{}".format(self.httpd.server_address[1], path)
+
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class LinkCheckerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server()
+
+
+    def tearDown(self):
+        self.server.close()
+
+
+    def test_statuses(self):
+        url_list = [self.server.url(path) for path in ("/ok", "/missing", "/gone", "/get-only")]
+        status_dicts = link_checker.check_urls(url_list)
+
+        self.assertEqual(status_dicts[url_list[0]]["state"], link_checker.ALIVE)
+        self.assertEqual(status_dicts[url_list[0]]["http_status"], 200)
+        self.assertEqual(status_dicts[url_list[0]]["etag"], ETAG)
+        self.assertEqual(status_dicts[url_list[0]]["last_modified"], LAST_MODIFIED)
+
+        self.assertEqual(status_dicts[url_list[1]]["state"], link_checker.DEAD)
+        self.assertEqual(status_dicts[url_list[1]]["http_status"], 404)
+        self.assertEqual(status_dicts[url_list[2]]["state"], link_checker.DEAD)
+        self.assertEqual(status_dicts[url_list[2]]["http_status"], 410)
+
+        # HEAD not allowed: checked again with GET
+        self.assertEqual(status_dicts[url_list[3]]["state"], link_checker.ALIVE)
+        self.assertIn(("GET", "/get-only"), [(method, path) for method, path, headers in self.server.httpd.requests])
+
+
+    def test_conditional_request(self):
+        url = self.server.url("/ok")
+        first_status_dict = link_checker.check_urls([url])[url]
+        status_dict = link_checker.check_urls([url], {url: first_status_dict})[url]
+
+        self.assertEqual(status_dict["state"], link_checker.ALIVE)
+        self.assertEqual(status_dict["http_status"], 304)
+
+        # The validators were sent back and are kept for the next check
+        method, path, headers = self.server.httpd.requests[-1]
+        self.assertEqual(headers.get("If-None-Match"), ETAG)
+        self.assertEqual(headers.get("If-Modified-Since"), LAST_MODIFIED)
+        self.assertEqual(status_dict["etag"], ETAG)
+        self.assertEqual(status_dict["last_modified"], LAST_MODIFIED)
+
+
+    def test_redirections(self):
+        url = self.server.url("/redirect")
+        loop_url = self.server.url("/loop")
+        status_dicts = link_checker.check_urls([url, loop_url])
+
+        self.assertEqual(status_dicts[url]["state"], link_checker.ALIVE)
+        self.assertEqual(status_dicts[url]["final_url"], self.server.url("/ok"))
+        self.assertNotIn("etag", status_dicts[url])       # Validators of the final url only
+
+        self.assertEqual(status_dicts[loop_url]["state"], link_checker.ERROR)
+        self.assertEqual(status_dicts[loop_url]["error"], "too many redirections")
+
+
+    def test_keep_alive(self):
+        url_list = [self.server.url("/ok?{}".format(i)) for i in range(10)]
+        status_dicts = link_checker.check_urls(url_list, max_connections_per_host=1)
+
+        self.assertTrue(all(status_dict["state"] == link_checker.ALIVE for status_dict in status_dicts.values()))
+        self.assertEqual(self.server.httpd.num_connections, 1)
+
+
+    def test_timeout(self):
+        url = self.server.url("/slow?delay=2")
+        status_dict = link_checker.check_urls([url], timeout=0.3)[url]
+
+        self.assertEqual(status_dict["state"], link_checker.ERROR)
+        self.assertEqual(status_dict["error"], "timeout")
+
+
+    def test_max_connections_per_host(self):
+        url_list = [self.server.url("/slow?delay=0.2&i={}".format(i)) for i in range(8)]
+        status_dicts = link_checker.check_urls(url_list, max_connections_per_host=2)
+
+        self.assertTrue(all(status_dict["state"] == link_checker.ALIVE for status_dict in status_dicts.values()))
+        self.assertEqual(self.server.httpd.max_active_requests, 2)
+
+
+    def test_timeout_excludes_waiting_for_the_host(self):
+        # The urls are checked one after the other (about 2 s in all): only
+        # the requests themselves must be timed
+        url_list = [self.server.url("/slow?delay=0.25&i={}".format(i)) for i in range(8)]
+        status_dicts = link_checker.check_urls(url_list, max_connections_per_host=1, timeout=1.)
+
+        self.assertEqual([status_dicts[url]["state"] for url in url_list], [link_checker.ALIVE] * len(url_list))
+
+
+    def test_waiting_for_a_host_doesnt_block_the_others(self):
+        other_server = _Server()
+        self.addCleanup(other_server.close)
+
+        url_list = [self.server.url("/slow?delay=0.5&i={}".format(i)) for i in range(4)]
+        other_url = other_server.url("/ok")
+
+        done_times = {}
+        start_time = time.monotonic()
+        link_checker.check_urls(url_list + [other_url], callback=lambda url, status_dict: done_times.setdefault(url, time.monotonic() - start_time),
+                                max_connections=2, max_connections_per_host=1)
+
+        # The slow urls wait for their host, not for the other host's slot
+        self.assertLess(done_times[other_url], 0.4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2015 Jérémie DECOCK (http://www.jdhp.org)
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+ 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Tests of the page_cache module (the pages are downloaded from a local
+http.server).
+
+Run from the root of the repository:
+
+    python3 -m unittest discover tests
+"""
+
+import http.server
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "jobmanager"))
+
+import page_cache
+
+PAGE = b"<html><head><title>T</title><script>var x;</script></head><body><h1>Python developer</h1><p>Lyon &amp; remote</p></body></html>"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    /page?...       PAGE (text/html), after delay seconds if given
+    /pdf            a PDF file
+    /missing        404
+    /truncated      a body shorter than its Content-Length
+    /garbage        not an HTTP response
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def _send(self, http_status, content=b"", content_type="text/html; charset=utf-8", content_length=None):
+        self.send_response(http_status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content) if content_length is None else content_length))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def do_GET(self):
+        url_parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url_parts.query)
+
+        with self.server.stats_lock:
+            self.server.requests.append(self.path)
+            self.server.num_active_requests += 1
+            self.server.max_active_requests = max(self.server.max_active_requests, self.server.num_active_requests)
+
+        try:
+            if "delay" in query:
+                time.sleep(float(query["delay"][0]))
+
+            if url_parts.path == "/page":
+                self._send(200, PAGE)
+            elif url_parts.path == "/pdf":
+                self._send(200, b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n", "application/pdf")
+            elif url_parts.path == "/missing":
+                self._send(404, b"Not found")
+            elif url_parts.path == "/truncated":
+                self._send(200, PAGE[:20], content_length=len(PAGE))
+                self.close_connection = True
+            elif url_parts.path == "/garbage":
+                self.wfile.write(b"NOT HTTP\r\n\r\n")
+                self.close_connection = True
+            else:
+                self._send(500)
+        finally:
+            with self.server.stats_lock:
+                self.server.num_active_requests -= 1
+
+
+class PageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="page_cache_test.")
+        self.addCleanup(shutil.rmtree, self.path)
+
+
+    def test_hit_and_miss(self):
+        cache = page_cache.PageCache(self.path)
+        cache.put_page("http://a/1", PAGE, "text/html")
+
+        self.assertTrue(cache.has_page("http://a/1"))
+        self.assertEqual(cache.get_page("http://a/1"), (PAGE, "text/html"))
+
+        self.assertFalse(cache.has_page("http://a/2"))
+        self.assertIsNone(cache.get_page("http://a/2"))
+
+        # Shared with the other instances (processes)
+        self.assertEqual(page_cache.PageCache(self.path).get_page("http://a/1"), (PAGE, "text/html"))
+
+
+    def test_zlib_round_trip(self):
+        cache = page_cache.PageCache(self.path)
+        content = os.urandom(1000) + PAGE * 100
+        page_hash = cache.put_page("http://a/1", content, "text/html")
+
+        with open(cache._object_path(page_hash), "rb") as fd:
+            compressed = fd.read()
+
+        self.assertLess(len(compressed), len(content))
+        self.assertEqual(zlib.decompress(compressed), content)
+        self.assertEqual(cache.get_page("http://a/1")[0], content)
+
+
+    def test_damaged_object(self):
+        cache = page_cache.PageCache(self.path)
+        page_hash = cache.put_page("http://a/1", PAGE, "text/html")
+
+        with open(cache._object_path(page_hash), "wb") as fd:
+            fd.write(b"not zlib")
+
+        self.assertIsNone(cache.get_page("http://a/1"))
+        self.assertFalse(cache.has_page("http://a/1"))
+
+
+    def test_dedupe_by_hash(self):
+        cache = page_cache.PageCache(self.path)
+        hash1 = cache.put_page("http://a/1", PAGE, "text/html")
+        hash2 = cache.put_page("http://b/1?utm_source=x", PAGE, "text/html")
+
+        self.assertEqual(hash1, hash2)
+        self.assertEqual(cache.get_stats()[:2], (2, 1))     # 2 urls, 1 page
+
+        # The object is removed with its last url
+        other_hash = cache.put_page("http://a/1", PAGE + b"<p>edited</p>", "text/html")
+        self.assertTrue(os.path.exists(cache._object_path(hash1)))
+        cache.put_page("http://b/1?utm_source=x", PAGE + b"<p>edited</p>", "text/html")
+        self.assertFalse(os.path.exists(cache._object_path(hash1)))
+        self.assertEqual(cache.get_stats()[:2], (2, 1))
+        self.assertTrue(os.path.exists(cache._object_path(other_hash)))
+
+
+    def test_lru_eviction(self):
+        # Random pages can't be compressed: each object takes about 1 kB
+        page_dict = {"http://a/{}".format(i): os.urandom(1000) for i in range(4)}
+        cache = page_cache.PageCache(self.path, max_size=3500)
+
+        for url in ("http://a/0", "http://a/1", "http://a/2"):
+            cache.put_page(url, page_dict[url], "text/html")
+            time.sleep(0.01)
+
+        cache.get_page("http://a/0")         # http://a/1 is now the least recently used page
+        time.sleep(0.01)
+        cache.put_page("http://a/3", page_dict["http://a/3"], "text/html")
+
+        self.assertEqual([cache.has_page(url) for url in sorted(page_dict)], [True, False, True, True])
+        num_urls, num_pages, size = cache.get_stats()
+        self.assertEqual((num_urls, num_pages), (3, 3))
+        self.assertLessEqual(size, 3500)
+
+
+    def test_view_file(self):
+        cache = page_cache.PageCache(self.path)
+        cache.put_page("http://a/1", PAGE, "text/html; charset=utf-8")
+        cache.put_page("http://a/2", b"%PDF-1.4", "application/pdf")
+
+        path = cache.write_view_file("http://a/1")
+        self.assertTrue(path.endswith(".html"))
+        with open(path, "rb") as fd:
+            self.assertEqual(fd.read(), PAGE)
+
+        self.assertTrue(cache.write_view_file("http://a/2").endswith(".pdf"))
+        self.assertIsNone(cache.write_view_file("http://a/3"))
+
+
+class TextExtractionTest(unittest.TestCase):
+
+    def test_html(self):
+        self.assertEqual(page_cache.extract_text(PAGE, "text/html; charset=utf-8"), "Python developer\nLyon & remote")
+        self.assertEqual(page_cache.extract_text(PAGE, ""), "Python developer\nLyon & remote")
+
+
+    def test_charset(self):
+        self.assertEqual(page_cache.extract_text("Société".encode("latin-1"), "text/plain; charset=ISO-8859-1"), "Société")
+
+
+    def test_not_text(self):
+        self.assertIsNone(page_cache.extract_text(b"%PDF-1.4", "application/pdf"))
+        self.assertIsNone(page_cache.extract_text(b"\x89PNG", "image/png"))
+
+
+class PageFetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="page_cache_test.")
+        self.addCleanup(shutil.rmtree, self.path)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stats_lock = threading.Lock()
+        self.httpd.num_active_requests = 0
+        self.httpd.max_active_requests = 0
+        self.httpd.requests = []
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.addCleanup(self.httpd.server_close)
+        self.addCleanup(self.httpd.shutdown)
+
+        self.cache = page_cache.PageCache(self.path)
+        self.results = {}              # {url: (text, error message)} given to the callbacks
+        self.results_lock = threading.Lock()
+
+
+    def url(self, path):
+        return "http://127.0.0.1:{}{}".format(self.httpd.server_address[1], path)
+
+
+    def callback(self, url, text, error_msg):
+        with self.results_lock:
+            self.results[url] = (text, error_msg)
+
+
+    def fetch_all(self, url_list, max_workers=page_cache.DEFAULT_MAX_WORKERS):
+        fetcher = page_cache.PageFetcher(self.cache, max_workers=max_workers, timeout=5.)
+        for url in url_list:
+            fetcher.fetch(url, self.callback)
+        fetcher.close()
+
+
+    def test_fetch(self):
+        url = self.url("/page")
+        self.fetch_all([url])
+
+        self.assertEqual(self.results[url], ("Python developer\nLyon & remote", None))
+        self.assertEqual(self.cache.get_page(url), (PAGE, "text/html; charset=utf-8"))
+
+
+    def test_dedupe_by_url(self):
+        url = self.url("/page?delay=0.2")
+        fetcher = page_cache.PageFetcher(self.cache)
+        future1 = fetcher.fetch(url, self.callback)
+        future2 = fetcher.fetch(url)
+        fetcher.close()
+
+        self.assertIs(future1, future2)
+        self.assertEqual(self.httpd.requests, ["/page?delay=0.2"])
+        self.assertEqual(self.results[url][1], None)
+
+
+    def test_bounded_workers(self):
+        url_list = [self.url("/page?delay=0.2&i={}".format(i)) for i in range(9)]
+        self.fetch_all(url_list, max_workers=3)
+
+        self.assertEqual(self.httpd.max_active_requests, 3)
+        self.assertTrue(all(self.results[url][1] is None for url in url_list))
+        self.assertEqual(self.cache.get_stats()[:2], (9, 1))      # The same page for all the urls
+
+
+    def test_failures(self):
+        url_dict = {name: self.url("/" + name) for name in ("missing", "pdf", "truncated", "garbage")}
+        refused_url = "http://127.0.0.1:1/"                       # Nothing listens on port 1
+        self.fetch_all(list(url_dict.values()) + [refused_url])
+
+        for url in list(url_dict.values()) + [refused_url]:
+            text, error_msg = self.results[url]
+            self.assertIsNone(text)
+            self.assertTrue(error_msg)
+
+        self.assertIn("404", self.results[url_dict["missing"]][1])
+        self.assertIn("application/pdf", self.results[url_dict["pdf"]][1])
+        self.assertIn("more expected", self.results[url_dict["truncated"]][1])
+
+        # Only the PDF file (a valid response) is stored
+        self.assertEqual([self.cache.has_page(url) for url in url_dict.values()], [False, True, False, False])
+        self.assertFalse(self.cache.has_page(refused_url))
+
+
+    def test_cancel_pending(self):
+        url_list = [self.url("/page?delay=0.3&i={}".format(i)) for i in range(6)]
+        fetcher = page_cache.PageFetcher(self.cache, max_workers=1)
+        for url in url_list:
+            fetcher.fetch(url, self.callback)
+        time.sleep(0.1)
+        fetcher.close(cancel_pending=True)
+
+        self.assertEqual(self.results[url_list[0]][1], None)     # Running: completed
+        self.assertEqual([self.results[url] for url in url_list[1:]], [(None, "cancelled")] * 5)
+        self.assertEqual(len(self.httpd.requests), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()